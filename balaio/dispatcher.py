@@ -0,0 +1,55 @@
+# coding: utf-8
+import sys
+import logging
+
+from lib import (
+    utils,
+    models,
+    scieloapitoolbelt,
+    outbox,
+    wakeup,
+)
+
+
+logger = logging.getLogger('balaio.dispatcher')
+
+
+def main(dispatcher, waiter):
+    while True:
+        # full batches mean there may be more messages waiting.
+        if dispatcher.run_once() >= dispatcher.batch_size:
+            waiter.busy()
+            continue
+
+        waiter.idle()
+        waiter.wait()
+
+
+if __name__ == '__main__':
+    # App bootstrapping:
+    # Setting up the app configuration, logging and SqlAlchemy Session.
+    config = utils.balaio_config_from_env()
+    utils.setup_logging(config)
+    models.Session.configure(bind=models.create_engine_from_config(config))
+
+    # connections are kept alive between deliveries.
+    client = scieloapitoolbelt.keepalive_client(config.get('manager', 'api_username'),
+                                                config.get('manager', 'api_key'),
+                                                api_uri=config.get('manager', 'api_url'))
+
+    dispatcher = outbox.Dispatcher(client,
+                                   batch_size=config.getint('dispatcher', 'batch_size'),
+                                   max_tries=config.getint('dispatcher', 'max_tries'),
+                                   backoff=config.getint('dispatcher', 'backoff'),
+                                   max_backoff=config.getint('dispatcher', 'max_backoff'))
+
+    waiter = wakeup.Waiter(min_interval=config.getfloat('dispatcher', 'poll_min'),
+                           max_interval=config.getfloat('dispatcher', 'poll_max'))
+
+    while True:
+        try:
+            main(dispatcher, waiter)
+        except KeyboardInterrupt:
+            sys.exit(0)
+        except Exception as e:
+            logger.error(e.message)
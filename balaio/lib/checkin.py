@@ -6,12 +6,38 @@ import transaction
 
 from . import models
 from . import excepts
+from . import xmlcatalog
+from . import schemas
 
 
 logger = logging.getLogger('balaio.checkin')
 
 
-def get_attempt(package, Session=models.Session):
+def _register_attempt(attempt, pkg, session):
+    """
+    Adds `attempt` to `session`, bound to a models.ArticlePkg if possible.
+    """
+    session.add(attempt)
+
+    # Trying to bind a ArticlePkg
+    savepoint = transaction.savepoint()
+    try:
+        article_pkg = models.ArticlePkg.get_or_create_from_package(pkg, session)
+        if article_pkg not in session:
+            session.add(article_pkg)
+
+        attempt.articlepkg = article_pkg
+        attempt.is_valid = True
+
+    except Exception as e:
+        savepoint.rollback()
+        logger.error('Failed to load an ArticlePkg for %s.' % pkg)
+        logger.debug('---> Traceback: %s' % e)
+
+    return attempt
+
+
+def get_attempt(package, Session=models.Session, committer=None):
     """
     Returns a brand new models.Attempt instance, bound to a models.ArticlePkg
     instance.
@@ -30,45 +56,53 @@ def get_attempt(package, Session=models.Session):
 
     :param package: Instance of SafePackage.
     :param Session: (optional) Reference to a Session class.
+    :param committer: (optional) a `committer.GroupCommitter` instance. If
+    given, the Attempt is committed along with those of other workers.
     """
     logger.info('Analyzing package: %s' % package)
 
     with package.analyzer as pkg:
 
+        # Duplicated packages are rejected before any expensive work
+        # is done. The unique constraint on `package_checksum` still
+        # protects against concurrent deposits of the same package.
+        session = Session()
+        try:
+            is_duplicated = models.Attempt.checksum_exists(pkg.checksum, session)
+        finally:
+            transaction.abort()
+            session.close()
+
+        if is_duplicated:
+            raise excepts.DuplicatedPackage('The package %s already exists.' % package)
+
         try:
-            is_valid_xml = pkg.is_valid_schema()
+            is_valid_xml, errors = pkg.validate_schema()
         except AttributeError as e:  # if there is not a single xml file
             raise excepts.MissingXML(e.message)
+        except (xmlcatalog.UnresolvedEntity, schemas.UnknownSchema) as e:
+            raise excepts.InvalidXML([e.message])
 
         if not is_valid_xml:
-            errors = pkg.stylechecker.validate()[1]
             exc_message = ['%s:%s %s' % (err.line, err.column, err.message) for err in errors]
             raise excepts.InvalidXML(exc_message)
 
-        try:
+        if committer is None:
             logger.debug('Creating a transactional session scope')
             session = Session()
+        else:
+            session = None
 
+        try:
             # Building a new Attempt
             attempt = models.Attempt.get_from_package(pkg)
-            session.add(attempt)
-
-            # Trying to bind a ArticlePkg
-            savepoint = transaction.savepoint()
-            try:
-                article_pkg = models.ArticlePkg.get_or_create_from_package(pkg, session)
-                if article_pkg not in session:
-                    session.add(article_pkg)
-
-                attempt.articlepkg = article_pkg
-                attempt.is_valid = True
 
-            except Exception as e:
-                savepoint.rollback()
-                logger.error('Failed to load an ArticlePkg for %s.' % package)
-                logger.debug('---> Traceback: %s' % e)
+            if session is not None:
+                _register_attempt(attempt, pkg, session)
+                transaction.commit()
+            else:
+                committer.submit(lambda db_session: _register_attempt(attempt, pkg, db_session))
 
-            transaction.commit()
             return attempt
 
         except IntegrityError as e:
@@ -87,6 +121,7 @@ def get_attempt(package, Session=models.Session):
             raise
 
         finally:
-            logger.debug('Closing the transactional session scope')
-            session.close()
+            if session is not None:
+                logger.debug('Closing the transactional session scope')
+                session.close()
 
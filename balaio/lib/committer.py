@@ -0,0 +1,141 @@
+#coding: utf-8
+"""Group commit of database writes performed by concurrent workers."""
+import time
+import Queue
+import logging
+import threading
+
+import transaction
+
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Unit(object):
+    """
+    A piece of work submitted to a `GroupCommitter`, and its outcome.
+    """
+    def __init__(self, work):
+        self.work = work
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommitter(object):
+    """
+    Commits the work of many workers in a single transaction.
+
+    Units of work are callables that receive a session and perform
+    their writes on it. They are gathered in batches of at most
+    `max_batch` units, waiting at most `max_latency` seconds for a batch
+    to be filled, and each batch is committed at once by a dedicated
+    thread.
+
+    Each unit runs within a savepoint, and its changes are flushed
+    before the next one runs, so a unit that fails, e.g. with an
+    `IntegrityError` for a duplicated package, is rolled back alone.
+
+    :param max_batch: (optional) max number of units per transaction.
+    :param max_latency: (optional) max seconds to wait for a batch to be filled.
+    :param Session: (optional) reference to a Session class.
+    """
+    _stop_sentinel = object()
+
+    def __init__(self, max_batch=50, max_latency=0.05, Session=models.Session):
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.Session = Session
+        self.batches = 0
+        self.units = 0
+        self._queue = Queue.Queue()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, work):
+        """
+        Runs `work` in the next batch, and blocks until it is committed.
+
+        Returns the value returned by `work`, or raises the exception
+        raised while running or committing it.
+
+        :param work: callable that receives a session.
+        """
+        unit = _Unit(work)
+        self._queue.put(unit)
+        unit.done.wait()
+
+        if unit.error is not None:
+            raise unit.error
+
+        return unit.result
+
+    def close(self):
+        """
+        Commits the pending units and stops the committer thread.
+        """
+        self._queue.put(self._stop_sentinel)
+        self._thread.join()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.time() + self.max_latency
+
+        while len(batch) < self.max_batch and batch[-1] is not self._stop_sentinel:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except Queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            units = [unit for unit in batch if unit is not self._stop_sentinel]
+
+            if units:
+                self._commit(units)
+                for unit in units:
+                    unit.done.set()
+
+            if len(units) != len(batch):
+                return None
+
+    def _commit(self, units):
+        session = self.Session()
+        committed = []
+        try:
+            for unit in units:
+                savepoint = transaction.savepoint()
+                try:
+                    unit.result = unit.work(session)
+                    session.flush()
+                except Exception as e:
+                    savepoint.rollback()
+                    unit.error = e
+                else:
+                    committed.append(unit)
+
+            transaction.commit()
+
+        except Exception as e:
+            transaction.abort()
+            logger.error('Failed to commit a batch of %s units: %s' % (len(units), e))
+            for unit in committed:
+                unit.error = e
+
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.units += len(units)
+        logger.debug('Committed a batch of %s units (%s failed).' % (
+            len(units), len(units) - len(committed)))
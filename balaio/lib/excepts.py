@@ -16,3 +16,13 @@ class MissingXML(BalaioBaseError):
     """Raised when there is not a single XML inside a package.
     """
 
+class MissingSeenIndex(BalaioBaseError):
+    """Raised when the index of the files seen by the monitor is missing,
+    but there are files at the watched directories.
+    """
+
+class CheckinJobFailed(BalaioBaseError):
+    """Raised when the checkin of a package could not be completed,
+    e.g. because its worker process died.
+    """
+
@@ -0,0 +1,142 @@
+#coding: utf-8
+"""Persistent indexes of the files handled by the monitor."""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteIndex(object):
+    """
+    Base class for the indexes stored in a SQLite database.
+
+    Each thread uses its own connection. Subclasses must define
+    `schema`, the statement that creates their table.
+
+    :param path: filesystem path to the index database.
+    """
+    schema = None
+
+    def __init__(self, path):
+        self.path = path
+        self.is_new = not os.path.exists(path)
+        self._local = threading.local()
+
+        self._conn.execute(self.schema)
+        self._conn.commit()
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+
+        return conn
+
+
+class SeenFileIndex(SQLiteIndex):
+    """
+    Records the files already handled by the monitor.
+
+    Files are identified by the triple (inode, size, mtime), obtained
+    with a single `stat` call, so checking if a file was already seen
+    never requires reading its contents.
+
+    The index `is_new` while it has no entries, even if its database
+    already exists, e.g. after a failed bootstrap.
+
+    :param path: filesystem path to the index database.
+    """
+    schema = '''CREATE TABLE IF NOT EXISTS seen (
+                    inode INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    filepath TEXT NOT NULL,
+                    seen_at REAL NOT NULL,
+                    PRIMARY KEY (inode, size, mtime))'''
+
+    def __init__(self, path):
+        super(SeenFileIndex, self).__init__(path)
+        self.is_new = self._conn.execute('SELECT 1 FROM seen LIMIT 1').fetchone() is None
+
+    @staticmethod
+    def key(filepath):
+        """
+        Returns the identity of the file at `filepath`, or None
+        if it does not exist.
+        """
+        try:
+            st = os.stat(filepath)
+        except OSError as e:
+            logger.debug('Could not stat %s: %s' % (filepath, e))
+            return None
+
+        return (st.st_ino, st.st_size, st.st_mtime)
+
+    def __contains__(self, key):
+        cursor = self._conn.execute(
+            'SELECT 1 FROM seen WHERE inode=? AND size=? AND mtime=?', key)
+        return cursor.fetchone() is not None
+
+    def add(self, key, filepath):
+        """
+        Mark the file identified by `key` as seen.
+        """
+        self.add_many([(key, filepath)])
+
+    def add_many(self, items):
+        """
+        Mark many files as seen, in a single transaction.
+
+        :param items: iterable of (key, filepath) pairs.
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO seen VALUES (?, ?, ?, ?, ?)',
+                ((inode, size, mtime, _as_text(filepath), now)
+                    for (inode, size, mtime), filepath in items))
+
+
+class JobJournal(SQLiteIndex):
+    """
+    Records the files queued for checkin, until they are processed.
+
+    Files are recorded when they are added to the job queue, or
+    deferred because it is full, and removed once their processing is
+    completed, even if the package is rejected. The files recorded
+    when the monitor goes down, deferred, queued, being processed or
+    whose processing failed, can be resumed on the next start.
+
+    :param path: filesystem path to the journal database.
+    """
+    schema = '''CREATE TABLE IF NOT EXISTS jobs (
+                    filepath TEXT PRIMARY KEY,
+                    queued_at REAL NOT NULL)'''
+
+    def add(self, filepath):
+        with self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO jobs VALUES (?, ?)',
+                (_as_text(filepath), time.time()))
+
+    def remove(self, filepath):
+        with self._conn:
+            self._conn.execute('DELETE FROM jobs WHERE filepath=?', (_as_text(filepath),))
+
+    def pending(self):
+        """
+        Returns the list of recorded files, in the order they were queued.
+        """
+        cursor = self._conn.execute('SELECT filepath FROM jobs ORDER BY queued_at')
+        return [row[0] for row in cursor]
+
+
+def _as_text(filepath):
+    # sqlite3 refuses 8-bit bytestrings.
+    if isinstance(filepath, unicode):
+        return filepath
+
+    return filepath.decode('utf-8', 'replace')
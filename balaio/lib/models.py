@@ -1,7 +1,13 @@
 #coding: utf-8
 import datetime
+import hashlib
+import itertools
+import json
 import logging
 import os
+import threading
+import unicodedata
+import uuid
 
 import enum
 
@@ -12,22 +18,26 @@ from sqlalchemy import (
     ForeignKey,
     DateTime,
     String,
+    Text,
     Boolean,
     Table,
+    Sequence,
     event,
+    text,
 )
 from sqlalchemy.orm import (
     relationship,
     backref,
     scoped_session,
     sessionmaker,
+    object_session,
 )
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
-from zope.sqlalchemy import ZopeTransactionExtension
+from zope.sqlalchemy import ZopeTransactionExtension, mark_changed
 
-from .base28 import genbase
+from .base28 import reprbase, BASE28
 from .package import PackageAnalyzer
 
 
@@ -72,6 +82,22 @@ def init_database(engine):
             logger.error('Could not find alembic config file at %s' % config_path)
 
 
+# claims the attempts ready to be validated, with unclaimed or expired leases,
+# that have not failed too many times.
+CLAIM_FOR_VALIDATION = text('''
+    UPDATE attempt
+       SET validation_claimed_by = :token,
+           validation_lease_expires_at = now() + :lease * interval '1 second'
+     WHERE id IN (
+        SELECT id FROM attempt
+         WHERE proceed_to_validation = true AND is_valid = true
+           AND (validation_lease_expires_at IS NULL OR validation_lease_expires_at < now())
+           AND validation_failures < :max_failures
+         ORDER BY id
+         LIMIT :limit
+           FOR UPDATE SKIP LOCKED)''')
+
+
 class Attempt(Base):
     __tablename__ = 'attempt'
 
@@ -88,6 +114,9 @@ class Attempt(Base):
     proceed_to_validation = Column(Boolean, nullable=False, default=False)
     validation_started_at = Column(DateTime(timezone=True))
     validation_ended_at = Column(DateTime(timezone=True))
+    validation_claimed_by = Column(String(length=32), nullable=True, index=True)
+    validation_lease_expires_at = Column(DateTime, nullable=True)
+    validation_failures = Column(Integer, nullable=False, default=0)
 
     proceed_to_checkout = Column(Boolean, nullable=False)
     checkout_started_at = Column(DateTime)
@@ -103,6 +132,7 @@ class Attempt(Base):
         self.is_valid = kwargs.get('is_valid', True)
         self.is_expired = kwargs.get('is_expired', False)
         self.proceed_to_validation = kwargs.get('proceed_to_validation', False)
+        self.validation_failures = kwargs.get('validation_failures', 0)
         self.proceed_to_checkout = kwargs.get('proceed_to_checkout', False)
 
     @property
@@ -152,6 +182,19 @@ class Attempt(Base):
             attempt.is_valid = True
         return attempt
 
+    @classmethod
+    def checksum_exists(cls, checksum, session):
+        """
+        Tells if there is an Attempt for the package with `checksum`.
+
+        The lookup is backed by the unique index on `package_checksum`.
+
+        :param checksum: the package checksum.
+        :param session: sqlalchemy db session
+        """
+        query = session.query(cls.id).filter_by(package_checksum=checksum)
+        return query.first() is not None
+
     @hybrid_method
     def ready_to_validate(self):
         """
@@ -159,6 +202,37 @@ class Attempt(Base):
         """
         return (self.proceed_to_validation == True) & (self.is_valid == True)
 
+    @classmethod
+    def claim_for_validation(cls, session, limit=10, lease=600, max_failures=3):
+        """
+        Claims up to `limit` attempts ready to be validated, and returns them.
+
+        The claim is a lease of `lease` seconds, so the attempts are not
+        claimed by other validator processes until it expires, e.g. if the
+        claimer dies before validating them. The claim is visible to the
+        others only after the transaction commits.
+
+        Candidates locked by a concurrent claim are skipped, so concurrent
+        claimers get distinct attempts instead of waiting for each other.
+        Leases are measured by the database clock. Requires PostgreSQL 9.5+.
+
+        Attempts whose validation failed `max_failures` times are not
+        claimed anymore.
+
+        :param session: sqlalchemy db session
+        :param limit: (optional) max number of attempts.
+        :param lease: (optional) lease duration in seconds.
+        :param max_failures: (optional) max number of failed validations.
+        """
+        token = uuid.uuid4().hex
+
+        # SKIP LOCKED is not supported by sqlalchemy 0.9.
+        session.execute(CLAIM_FOR_VALIDATION, {'token': token, 'limit': limit,
+            'lease': lease, 'max_failures': max_failures})
+        mark_changed(session)
+
+        return session.query(cls).filter_by(validation_claimed_by=token).order_by(cls.id).all()
+
     def start_validation(self):
         """
         Mark the attempt validation as started.
@@ -205,6 +279,132 @@ class Attempt(Base):
         self.is_expired = True
 
 
+# metadata that identifies an article, used to build ArticlePkg.identity_key
+IDENTITY_FIELDS = (
+    'article_title',
+    'journal_pissn',
+    'journal_eissn',
+    'issue_year',
+    'issue_volume',
+    'issue_number',
+    'issue_suppl_volume',
+    'issue_suppl_number',
+)
+
+
+def _normalize_identity_value(value):
+    if value is None:
+        return u''
+
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    else:
+        value = unicode(value)
+
+    return u' '.join(unicodedata.normalize('NFKC', value).lower().split())
+
+
+def make_identity_key(meta):
+    """
+    Returns the identity key of the article described by `meta`.
+
+    The key is the sha1 hexdigest of the normalized article title,
+    ISSNs and issue identification, so it can be indexed and compared
+    for equality regardless of the case and spacing of the values.
+
+    :param meta: dict of article metadata, as in `PackageAnalyzer.meta`.
+    """
+    values = [_normalize_identity_value(meta.get(field)) for field in IDENTITY_FIELDS]
+    return hashlib.sha1(u'\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+# ArticlePkg.aid is the base28 representation of a counter, scrambled
+# by a bijection over the 10 digits space, so aids are unique but still
+# look random. Counters are reserved by blocks, each one taken from a
+# database sequence, so a block is shared by neither processes nor
+# threads.
+AID_LENGTH = 10
+AID_BLOCK_SIZE = 1000
+AID_BLOCK_SEQUENCE = Sequence('articlepkg_aid_block_seq', metadata=Base.metadata)
+
+# multipliers must be coprime with 28, i.e. odd and not multiple of 7.
+_AID_ROUNDS = [(2654435761, 1481765933), (625341585, 40503)]
+
+
+def scramble_aid_counter(counter, length=AID_LENGTH, digits=BASE28):
+    """
+    Maps `counter` to another number in ``[0, len(digits) ** length)``.
+
+    The mapping is a bijection, made of an affine transformation, the
+    reversal of the digits and another affine transformation.
+    """
+    base = len(digits)
+    space = base ** length
+
+    (a1, c1), (a2, c2) = _AID_ROUNDS
+    n = (a1 * counter + c1) % space
+
+    reversed_n = 0
+    for _ in range(length):
+        n, d = divmod(n, base)
+        reversed_n = reversed_n * base + d
+
+    return (a2 * reversed_n + c2) % space
+
+
+def make_aid(counter, length=AID_LENGTH, digits=BASE28):
+    """
+    Returns the aid bound to `counter`.
+    """
+    return reprbase(scramble_aid_counter(counter, length, digits), digits).rjust(length, digits[0])
+
+
+class AidAllocator(object):
+    """
+    Hands out aids from blocks of `block_size` counters.
+
+    A new block is reserved from `AID_BLOCK_SEQUENCE` when the current
+    one is exhausted, so only one in `block_size` aids costs a database
+    round trip. Blocks are not shared with forked processes.
+
+    :param block_size: (optional) number of counters per block.
+    :param sequence: (optional) sequence of block numbers.
+    """
+    def __init__(self, block_size=AID_BLOCK_SIZE, sequence=AID_BLOCK_SEQUENCE):
+        self.block_size = block_size
+        self.sequence = sequence
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._next = self._end = 0
+
+    def next(self, session):
+        """
+        Returns a fresh aid.
+
+        :param session: the session used to reserve a new block, if needed.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+
+            if self._next >= self._end:
+                block = session.scalar(self.sequence.next_value())
+                self._next = block * self.block_size
+                self._end = self._next + self.block_size
+                logger.debug('Reserved the aid block %s.' % block)
+
+            counter = self._next
+            self._next += 1
+
+        return make_aid(counter)
+
+
+aid_allocator = AidAllocator()
+
+
 class ArticlePkg(Base):
     __tablename__ = 'articlepkg'
 
@@ -219,6 +419,7 @@ class ArticlePkg(Base):
     issue_number = Column(String, nullable=True)
     issue_suppl_volume = Column(String, nullable=True)
     issue_suppl_number = Column(String, nullable=True)
+    identity_key = Column(String(length=40), nullable=True, index=True)
 
     @property
     def issue_label(self):
@@ -246,11 +447,17 @@ class ArticlePkg(Base):
 
         return ' '.join([val for val in values if val]).strip()
 
-    def get_aid(self):
+    def make_identity_key(self):
+        """
+        Returns the identity key for the current metadata. See `make_identity_key`.
+        """
+        return make_identity_key(dict((field, getattr(self, field)) for field in IDENTITY_FIELDS))
+
+    def get_aid(self, allocator=aid_allocator):
         """
         Produce a fresh `aid` only for instances not yet persisted.
         """
-        return self.aid if (self.id and self.aid) else genbase(10)
+        return self.aid if (self.id and self.aid) else allocator.next(object_session(self))
 
     def to_dict(self):
         return dict(
@@ -280,8 +487,9 @@ class ArticlePkg(Base):
         :param session: sqlalchemy db session
         """
         meta = package.meta
+        identity_key = make_identity_key(meta)
         try:
-            article_pkg = session.query(ArticlePkg).filter_by(article_title=meta['article_title']).one()
+            article_pkg = session.query(ArticlePkg).filter_by(identity_key=identity_key).one()
         except MultipleResultsFound as e:
             logger.error('Multiple results trying to get a models.ArticlePkg for article_title=%s. %s' % (
                 meta['article_title'], e))
@@ -395,15 +603,52 @@ class Checkpoint(Base):
     def is_active(self):
         return bool(self.started_at and self.ended_at is None)
 
-    def tell(self, message, status, label=None):
+    def tell(self, message, status, label=None, deferred=False):
+        """
+        Records a notice.
+
+        Deferred notices are kept in memory until `write_deferred_notices`
+        is called.
+        """
         if not self.is_active:
             raise RuntimeError('cannot tell thing after end was called')
 
         if status not in Status:
             raise ValueError('status must be %s' % ','.join(str(st) for st in Status))
 
-        notice = Notice(message=message, status=status, label=label)
-        self.messages.append(notice)
+        if deferred:
+            if getattr(self, '_deferred_notices', None) is None:
+                self._deferred_notices = []
+
+            self._deferred_notices.append(dict(when=datetime.datetime.now(),
+                                               label=label,
+                                               message=message,
+                                               status=status.value))
+        else:
+            notice = Notice(message=message, status=status, label=label)
+            self.messages.append(notice)
+
+    def write_deferred_notices(self, session):
+        """
+        Inserts the deferred notices in a single statement.
+
+        :param session: sqlalchemy db session
+        """
+        notices = getattr(self, '_deferred_notices', None)
+        if not notices:
+            return None
+
+        if self.id is None:
+            session.flush()
+
+        for notice in notices:
+            notice['checkpoint_id'] = self.id
+
+        session.execute(Notice.__table__.insert().values(notices))
+        self._deferred_notices = []
+
+        # the collection must be reloaded to include the new notices.
+        session.expire(self, ['messages'])
 
     @hybrid_property
     def point(self):
@@ -424,27 +669,63 @@ class Checkpoint(Base):
                         )
 
 
+class OutboxMessage(Base):
+    """
+    A notification to SciELO Manager, waiting to be delivered.
+
+    Messages are written within the transaction that produced them,
+    and delivered later by the dispatcher. See :mod:`outbox`.
+
+    :param kind: `CHECKIN`, `NOTICE` or `NOTICES`, for a batch of notices.
+    :param data: dict of data to be sent.
+    """
+    __tablename__ = 'outbox'
+
+    CHECKIN = 'checkin'
+    NOTICE = 'notice'
+    NOTICES = 'notices'
+
+    id = Column(Integer, primary_key=True)
+    attempt_id = Column(Integer, ForeignKey('attempt.id'), nullable=True, index=True)
+    kind = Column(String(length=16), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    tries = Column(Integer, nullable=False, default=0)
+    next_try_at = Column(DateTime, nullable=False)
+    delivered_at = Column(DateTime, nullable=True, index=True)
+    last_error = Column(String, nullable=True)
+
+    attempt = relationship('Attempt',
+                           backref=backref('outbox_messages',
+                           cascade='all, delete-orphan'))
+
+    def __init__(self, kind, data, **kwargs):
+        super(OutboxMessage, self).__init__(kind=kind, payload=json.dumps(data), **kwargs)
+        self.created_at = self.next_try_at = datetime.datetime.now()
+        self.tries = 0
+
+    @property
+    def data(self):
+        return json.loads(self.payload)
+
+    @data.setter
+    def data(self, data):
+        self.payload = json.dumps(data)
+
+    def __repr__(self):
+        return "<OutboxMessage('%s, %s')>" % (self.id, self.kind)
+
+
 @event.listens_for(Session, 'before_flush')
 def before_flush(session, flush_context, instances):
+    # ArticlePkg.identity_key must follow the article metadata.
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, ArticlePkg):
+            obj.identity_key = obj.make_identity_key()
+
     # ArticlePkg.aid must be generated automaticaly while
-    # a new instance is being saved.
+    # a new instance is being saved. See `AidAllocator`.
     for obj in session.new:
         if isinstance(obj, ArticlePkg):
-            # obj.aid must be unique, so we are checking for its absence
-            # before assigning. This is not quite reliable by the lack
-            # of atomicity over both the operations (query+assignment).
-            for trial_no in range(10):
-                aid = obj.get_aid()
-                try:
-                    session.query(ArticlePkg).filter_by(aid=aid).one()
-                except NoResultFound:
-                    break
-                else:
-                    logger.error("Conflict while generating ArticlePkg.aid attribute")
-                    continue
-            else:
-                logger.error("Max attempts to generate an unique ArticlePkg.aid has expired. Giving up.")
-                aid = None
-
-            obj.aid = aid
+            obj.aid = obj.get_aid()
 
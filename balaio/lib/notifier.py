@@ -1,7 +1,6 @@
 # coding: utf-8
 import logging
 
-import scieloapi
 import sqlalchemy
 import transaction
 
@@ -32,20 +31,35 @@ def auto_commit_or_rollback(method):
 class Notifier(object):
     """
     Acts as a broker to notifications.
+
+    Notifications to SciELO Manager are written to the outbox, within
+    the current transaction, and delivered later by the dispatcher.
+    See :mod:`outbox`.
+
+    In batch mode, the notices are buffered and written as a single
+    message when the checkpoint ends, so they are delivered one after
+    the other through the same connection.
+
+    Likewise, the checkpoint notices can be deferred and inserted at
+    once when the checkpoint ends.
     """
 
-    def __init__(self, checkpoint, scieloapi_client,
-                 db_session, manager_integration=True):
+    def __init__(self, checkpoint, db_session, manager_integration=True, batch=False,
+                 defer_notices=False):
         """
         :param checkpoint: is a :class:`models.Checkpoint` instance.
-        :param scieloapi_client: instance of `scieloapi.Client`.
         :param db_session: sqlalchemy session.
         :param manager_integration: (optional) if notifications must be sent to manager.
+        :param batch: (optional) if notices must be buffered until `end` is called.
+        :param defer_notices: (optional) if checkpoint notices must be inserted
+        when `end` is called.
         """
-        self.scieloapi = scieloapi_client
         self.checkpoint = checkpoint
         self.db_session = db_session
         self.manager_integration = manager_integration
+        self.batch = batch
+        self.defer_notices = defer_notices
+        self._notices = []
 
         # make sure checkpoint is held by the session
         if self.checkpoint not in self.db_session:
@@ -60,7 +74,7 @@ class Notifier(object):
         :param status: instance of :class:`models.Status`.
         :param label: (optional)
         """
-        self.checkpoint.tell(message, status, label=label)
+        self.checkpoint.tell(message, status, label=label, deferred=self.defer_notices)
         self._send_notice_notification(message, status, label=label)
 
     def start(self):
@@ -74,6 +88,31 @@ class Notifier(object):
         if self.checkpoint.point is models.Point.checkout:
             self._send_checkout_notification()
         self._send_notice_notification('', models.Status.SERV_END)
+        self.flush()
+
+        if self.defer_notices:
+            self.checkpoint.write_deferred_notices(self.db_session)
+
+    def flush(self):
+        """
+        Writes the buffered notices to the outbox.
+        """
+        if self._notices:
+            self._write(models.OutboxMessage.NOTICES, {'notices': self._notices})
+            self._notices = []
+
+    def _write(self, kind, data):
+        self.db_session.add(models.OutboxMessage(kind, data, attempt=self.checkpoint.attempt))
+
+    def _enqueue(self, kind, data):
+        """
+        Writes a notification of `kind` to the outbox, or buffers it
+        if it is a notice and the notifier is in batch mode.
+        """
+        if self.batch and kind == models.OutboxMessage.NOTICE:
+            self._notices.append(data)
+        else:
+            self._write(kind, data)
 
     def _send_checkout_notification(self):
         """
@@ -87,6 +126,7 @@ class Notifier(object):
 
         assert self.checkpoint.point is models.Point.checkout, 'only `checkout` checkpoint can send this notification.'
 
+        # `checkin` is bound to the attempt checkin uri on delivery.
         data = {
             'checkin': self.checkpoint.attempt.checkin_uri,
             'stage': 'checkout',
@@ -95,19 +135,16 @@ class Notifier(object):
             'status': 'ok',
         }
 
-        try:
-            self.scieloapi.notices.post(data)
-        except scieloapi.exceptions.APIError as e:
-            logger.error('Error posting data to Manager. Message: %s' % e)
+        self._enqueue(models.OutboxMessage.NOTICE, data)
 
     def _send_checkin_notification(self):
         """
         Sends a checkin notification to SciELO Manager.
 
         Only checkpoints of type checkin can send call this method.
-        As a side effect of creating a new checkin on SciELO Manager,
-        the attribute `self._checkin_resource_uri` is bound to its
-        resource uri.
+        On delivery, a `checkins_articles` entity is created, and then
+        a `checkins` entity bound to it, whose resource uri is bound to
+        the attribute `checkin_uri` of the attempt.
         """
         if not self.manager_integration:
             logger.warning('Notifications to Manager are disabled. Skipping.')
@@ -115,8 +152,6 @@ class Notifier(object):
 
         assert self.checkpoint.point is models.Point.checkin, 'only `checkin` checkpoint can send this notification.'
 
-        # First, a `checkins_articles` entity is created, with some metadata of the article we
-        # are talking about.
         data_article = {
                  'articlepkg_ref': str(self.checkpoint.attempt.articlepkg.id),
                  'article_title': self.checkpoint.attempt.articlepkg.article_title,
@@ -126,30 +161,14 @@ class Notifier(object):
                  'eissn': self.checkpoint.attempt.articlepkg.journal_eissn,
                }
 
-        try:
-            resource_id = self.scieloapi.checkins_articles.post(data_article)
-            article_uri = '/api/v1/checkins_articles/%s/' % resource_id
-        except scieloapi.exceptions.APIError as e:
-            logger.error('Error posting data to Manager. Message: %s' % e)
-        else:
-            # If the former step goes fine, a `checkins` entity is created, with some metadata
-            # of the current attempt.
-            data_checkins = {
-                     'attempt_ref': str(self.checkpoint.attempt.id),
-                     'package_name': self.checkpoint.attempt.xml_filename,
-                     'uploaded_at': str(self.checkpoint.attempt.started_at),
-                     'article': article_uri,
-                   }
-            try:
-                resource_id = self.scieloapi.checkins.post(data_checkins)
-                checkin_uri = '/api/v1/checkins/%s/' % resource_id
-            except scieloapi.exceptions.APIError as e:
-                logger.error('Error posting data to Manager. Message: %s' % e)
-            else:
-                # If all goes fine, the generated `checkin_uri` is stored for future
-                # interactions.
-                self.checkpoint.attempt.checkin_uri = checkin_uri
+        data_checkins = {
+                 'attempt_ref': str(self.checkpoint.attempt.id),
+                 'package_name': self.checkpoint.attempt.xml_filename,
+                 'uploaded_at': str(self.checkpoint.attempt.started_at),
+               }
 
+        self._enqueue(models.OutboxMessage.CHECKIN,
+                      {'article': data_article, 'checkin': data_checkins})
 
     def _send_notice_notification(self, message, status, label=None):
         """
@@ -170,16 +189,10 @@ class Notifier(object):
             logger.warning('Notifications to Manager are disabled. Skipping.')
             return None
 
-        try:
-            self.scieloapi.notices.post(data)
-        except scieloapi.exceptions.APIError as e:
-            logger.error('Error posting data to Manager. Message: %s' % e)
+        self._enqueue(models.OutboxMessage.NOTICE, data)
 
 
-def create_checkpoint_notifier(config, point):
-    scieloapi_client = scieloapi.Client(config.get('manager', 'api_username'),
-                                        config.get('manager', 'api_key'),
-                                        api_uri=config.get('manager', 'api_url'))
+def create_checkpoint_notifier(config, point, defer_notices=False):
 
     def _checkin_notifier_factory(attempt, session):
         try:
@@ -194,9 +207,10 @@ def create_checkpoint_notifier(config, point):
             pass
 
         return Notifier(checkpoint,
-                        scieloapi_client,
                         session,
-                        manager_integration=config.getboolean('manager', 'notifications'))
+                        manager_integration=config.getboolean('manager', 'notifications'),
+                        batch=config.getboolean('manager', 'batch_notices'),
+                        defer_notices=defer_notices)
 
     return _checkin_notifier_factory
 
@@ -226,7 +240,7 @@ def validation_notifier_factory(config):
         >>> first_attempt_notifier = ValidationNotifier(first_attempt)
         >>> first_attempt_notifier.start()
     """
-    return create_checkpoint_notifier(config, models.Point.validation)
+    return create_checkpoint_notifier(config, models.Point.validation, defer_notices=True)
 
 
 def checkout_notifier_factory(config):
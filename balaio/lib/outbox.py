@@ -0,0 +1,172 @@
+#coding: utf-8
+"""Delivery of the notifications written to the outbox to SciELO Manager."""
+import logging
+import datetime
+
+import transaction
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased
+
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher(object):
+    """
+    Delivers the outbox messages to SciELO Manager.
+
+    Messages are delivered at least once, in batches of `batch_size`,
+    each one committed at once. The messages of an attempt are
+    delivered in order, so its checkin is created before its notices.
+
+    Failed deliveries are retried after `backoff` seconds, doubled
+    for each failure up to `max_backoff` seconds, until the message
+    has been tried `max_tries` times.
+
+    :param scieloapi_client: instance of `scieloapi.Client`.
+    :param Session: (optional) reference to a Session class.
+    :param batch_size: (optional) max number of messages per round.
+    :param max_tries: (optional) max number of deliveries per message.
+    :param backoff: (optional) seconds to wait after the first failure.
+    :param max_backoff: (optional) max seconds to wait between tries.
+    """
+    def __init__(self, scieloapi_client, Session=models.Session, batch_size=50,
+                 max_tries=10, backoff=30, max_backoff=3600):
+        self.scieloapi = scieloapi_client
+        self.Session = Session
+        self.batch_size = batch_size
+        self.max_tries = max_tries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def backoff_for(self, tries):
+        """
+        Returns the seconds to wait after the failure number `tries`.
+        """
+        return min(self.backoff * 2 ** (tries - 1), self.max_backoff)
+
+    def deliver(self, message):
+        """
+        Sends `message` to SciELO Manager.
+        """
+        data = message.data
+
+        if message.kind == models.OutboxMessage.CHECKIN:
+            self._deliver_checkin(message, data)
+
+        elif message.kind == models.OutboxMessage.NOTICE:
+            # the checkin may have been created after the notice was written.
+            if message.attempt is not None:
+                data['checkin'] = message.attempt.checkin_uri
+            self.scieloapi.notices.post(data)
+
+        elif message.kind == models.OutboxMessage.NOTICES:
+            self._deliver_notices(message, data)
+
+        else:
+            raise ValueError('unknown message kind %s' % message.kind)
+
+    def _deliver_checkin(self, message, data):
+        article_uri = data.get('article_uri')
+        if article_uri is None:
+            resource_id = self.scieloapi.checkins_articles.post(data['article'])
+            article_uri = '/api/v1/checkins_articles/%s/' % resource_id
+
+            # so the article is not created again if the checkin fails.
+            data['article_uri'] = article_uri
+            message.data = data
+
+        resource_id = self.scieloapi.checkins.post(dict(data['checkin'], article=article_uri))
+        message.attempt.checkin_uri = '/api/v1/checkins/%s/' % resource_id
+
+    def _deliver_notices(self, message, data):
+        sent = data.get('sent', 0)
+        try:
+            for notice in data['notices'][sent:]:
+                if message.attempt is not None:
+                    notice['checkin'] = message.attempt.checkin_uri
+                self.scieloapi.notices.post(notice)
+                sent += 1
+        finally:
+            # so the notices already sent are not sent again on retries.
+            if sent != data.get('sent', 0):
+                data['sent'] = sent
+                message.data = data
+
+    def _pending(self, session, now):
+        """
+        Returns the messages due at `now`.
+
+        Messages written after a backed-off message of the same attempt
+        are not due either, so the attempt's messages keep their order.
+        """
+        Message = models.OutboxMessage
+        earlier = aliased(Message)
+
+        backed_off = session.query(earlier.id).filter(
+            earlier.attempt_id == Message.attempt_id).filter(
+            earlier.id < Message.id).filter(
+            earlier.delivered_at == None).filter(
+            earlier.tries < self.max_tries).filter(
+            earlier.next_try_at > now)
+
+        return session.query(Message).filter(
+            Message.delivered_at == None).filter(
+            Message.tries < self.max_tries).filter(
+            or_(Message.next_try_at == None, Message.next_try_at <= now)).filter(
+            ~backed_off.exists()).order_by(
+            Message.id).limit(self.batch_size).all()
+
+    def run_once(self):
+        """
+        Delivers a batch of messages.
+
+        Returns the number of messages whose delivery was attempted,
+        successfully or not.
+        """
+        session = self.Session()
+        now = datetime.datetime.now()
+        blocked = set()
+        attempted = 0
+
+        try:
+            messages = self._pending(session, now)
+            for message in messages:
+                # a message waits for the ones written before it, for the same attempt.
+                if message.attempt_id in blocked:
+                    continue
+
+                if message.next_try_at > now:
+                    if message.attempt_id is not None:
+                        blocked.add(message.attempt_id)
+                    continue
+
+                attempted += 1
+                try:
+                    self.deliver(message)
+                except Exception as e:
+                    message.tries += 1
+                    message.last_error = unicode(e)
+                    message.next_try_at = now + datetime.timedelta(seconds=self.backoff_for(message.tries))
+                    if message.attempt_id is not None:
+                        blocked.add(message.attempt_id)
+
+                    if message.tries >= self.max_tries:
+                        logger.error('Giving up delivering %s after %s tries: %s' % (message, message.tries, e))
+                    else:
+                        logger.warning('Could not deliver %s: %s' % (message, e))
+                else:
+                    message.delivered_at = datetime.datetime.now()
+
+            transaction.commit()
+
+        except Exception:
+            transaction.abort()
+            raise
+
+        finally:
+            session.close()
+
+        return attempted
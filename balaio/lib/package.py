@@ -3,21 +3,159 @@ import os
 import stat
 import shutil
 import uuid
+import fcntl
+import hashlib
+import threading
+import itertools
+import collections
 from datetime import datetime
 
 from packtools import xray
 
 from . import utils
+from . import schemas
+from . import xmlcatalog
+from . import xmlindex
 
 
 logger = logging.getLogger(__name__)
 
+# ioctl request to clone a file, sharing its extents (linux/fs.h)
+FICLONE = 0x40049409
+
+# the package checksum is the md5 hexdigest of the whole file
+CHECKSUM_ALGORITHM = hashlib.md5
+
+# buffer size used while streaming packages
+COPY_BUFSIZE = 1024 * 1024
+
+
+def checksum_file(filepath, algorithm=CHECKSUM_ALGORITHM, bufsize=COPY_BUFSIZE):
+    """
+    Returns the hexdigest of the file at `filepath`.
+    """
+    digest = algorithm()
+    with open(filepath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(bufsize), ''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def stage_by_reflink(src, dst):
+    """
+    Stages `src` at `dst` as a copy-on-write clone.
+
+    Staging strategies return the package checksum when it is
+    computed as a side effect, or None otherwise.
+
+    Both files must be on the same filesystem, and the filesystem must
+    support reflinks, e.g. btrfs or xfs.
+    """
+    with open(src, 'rb') as fsrc:
+        # `dst` must be a brand new file, otherwise files linked
+        # to it would be truncated.
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0644)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except (IOError, OSError):
+            os.unlink(dst)
+            raise
+        finally:
+            os.close(fd)
+
+    shutil.copystat(src, dst)
+
+
+def stage_by_link(src, dst):
+    """
+    Stages `src` at `dst` as a hardlink.
+
+    Both files must be on the same filesystem. Note that the staged file
+    shares the inode with `src`, so in-place rewrites of `src` are seen
+    through `dst`, and the package is not isolated from the depositor.
+    It must be enabled explicitly, see `DEFAULT_STAGING`.
+    """
+    os.link(src, dst)
+
+
+def stage_by_copy(src, dst, bufsize=COPY_BUFSIZE):
+    """
+    Stages `src` at `dst` as a full copy.
+
+    The package checksum is computed in the same pass, so the
+    package does not need to be read again just to be hashed.
+    """
+    digest = CHECKSUM_ALGORITHM()
+    with open(src, 'rb') as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0644)
+        try:
+            with os.fdopen(fd, 'wb') as fdst:
+                for chunk in iter(lambda: fsrc.read(bufsize), ''):
+                    digest.update(chunk)
+                    fdst.write(chunk)
+        except (IOError, OSError):
+            os.unlink(dst)
+            raise
+
+    shutil.copystat(src, dst)
+    return digest.hexdigest()
+
+
+# strategies that only work when `src` and `dst` are on the same filesystem
+SAME_FS_STAGING = ('reflink', 'link')
+
+# strategies whose staged file is the same file as `src`. Their
+# permissions are never changed, see `PackageAnalyzer.lock_package`.
+SHARED_INODE_STAGING = ('link',)
+
+STAGING_STRATEGIES = {
+    'reflink': stage_by_reflink,
+    'link': stage_by_link,
+    'copy': stage_by_copy,
+}
+
+DEFAULT_STAGING = ('reflink', 'copy')
+
+
+def parse_staging(value):
+    """
+    Returns the sequence of staging strategy names in the comma
+    separated `value`, as in the `app.staging` setting.
+
+    Raises ValueError for unknown names.
+    """
+    names = tuple(name.strip() for name in value.split(',') if name.strip())
+    if not names:
+        raise ValueError('at least one staging strategy must be set')
+
+    unknown = [name for name in names if name not in STAGING_STRATEGIES]
+    if unknown:
+        raise ValueError('unknown staging strategies: %s. Must be one of %s' % (
+            ', '.join(unknown), ', '.join(sorted(STAGING_STRATEGIES))))
+
+    return names
+
 
 class PackageAnalyzer(xray.SPSPackage):
+    """
+    The parsed XML, the results of the schema validation and the
+    metadata extraction are memoized, since all are expensive on
+    large XML files.
 
-    def __init__(self, *args):
-        super(PackageAnalyzer, self).__init__(*args)
+    :param checksum: (optional) the package checksum, if already known.
+    :param shared: (optional) if the file is shared with the depositor,
+    in which case its permissions and group are left untouched.
+    """
+    def __init__(self, *args, **kwargs):
+        self._checksum = kwargs.pop('checksum', None)
+        self._shared = kwargs.pop('shared', False)
+        super(PackageAnalyzer, self).__init__(*args, **kwargs)
         self._errors = set()
+        self._schema_validation = None
+        self._meta = None
+        self._xml = None
+        self._xml_index = None
         self._default_perms = stat.S_IMODE(os.stat(self._filename).st_mode)
         self._is_locked = False
 
@@ -32,16 +170,73 @@ class PackageAnalyzer(xray.SPSPackage):
             logger.info('The package had been deleted before the permissions restore procedure: %s' % exc)
         self._cleanup_package_fp()
 
+    @property
+    def checksum(self):
+        """
+        The package checksum. See `CHECKSUM_ALGORITHM`.
+        """
+        if self._checksum is None:
+            self._checksum = checksum_file(self._filename)
+
+        return self._checksum
+
+    @property
+    def xml(self):
+        """
+        The parsed XML file. DTDs and entity sets are resolved
+        locally, see `xmlcatalog`.
+
+        Raises AttributeError if the package has not exactly one XML file.
+        """
+        if self._xml is None:
+            fps = list(itertools.islice(self.get_fps('xml'), 2))
+            if len(fps) != 1:
+                raise AttributeError('there is not a single xml file')
+
+            self._xml = xmlcatalog.parse(fps[0])
+
+        return self._xml
+
+    @property
+    def xml_index(self):
+        """
+        Index of the elements of the XML file, built once per instance.
+        See `xmlindex.ElementIndex`.
+        """
+        if self._xml_index is None:
+            self._xml_index = xmlindex.ElementIndex(self.xml)
+
+        return self._xml_index
+
     @property
     def meta(self):
-        dct_mta = super(PackageAnalyzer, self).meta
+        if self._meta is None:
+            dct_mta = super(PackageAnalyzer, self).meta
+
+            ign, dct_mta['issue_suppl_volume'], dct_mta['issue_number'], dct_mta['issue_suppl_number'] = utils.issue_identification(
+                dct_mta['issue_volume'], dct_mta['issue_number'], dct_mta['supplement'])
 
-        ign, dct_mta['issue_suppl_volume'], dct_mta['issue_number'], dct_mta['issue_suppl_number'] = utils.issue_identification(
-            dct_mta['issue_volume'], dct_mta['issue_number'], dct_mta['supplement'])
+            del dct_mta['supplement']
+            self._meta = dct_mta
 
-        del dct_mta['supplement']
+        return dict(self._meta)
 
-        return dct_mta
+    def validate_schema(self):
+        """
+        Validates the XML against the SPS schema.
+
+        The validation is performed only once per package, and the
+        compiled schemas are shared by the process. See `schemas.cache`.
+        Returns a tuple comprising the validation status and the errors list.
+        Raises AttributeError if the package has not exactly one XML file.
+        """
+        if self._schema_validation is None:
+            self._schema_validation = schemas.cache.validate(self.xml)
+
+        return self._schema_validation
+
+    def is_valid_schema(self):
+        return self.validate_schema()[0]
 
     @property
     def errors(self):
@@ -63,10 +258,15 @@ class PackageAnalyzer(xray.SPSPackage):
            http://docs.python.org/2/library/stat.html#stat.S_IWOTH
          - Change the group of package to the application group
            http://docs.python.org/2/library/os.html#os.chown
+
+        Packages shared with the depositor are left untouched.
         """
 
+        if self._shared:
+            return None
+
         if not self._is_locked:
-            perm = self._default_perms ^ stat.S_IWOTH ^ stat.S_IWUSR
+            perm = self._default_perms & ~(stat.S_IWOTH | stat.S_IWUSR)
 
             try:
                 os.chmod(self._filename, perm)
@@ -84,6 +284,9 @@ class PackageAnalyzer(xray.SPSPackage):
             self._is_locked = True
 
     def restore_perms(self):
+        if self._shared:
+            return None
+
         os.chmod(self._filename, self._default_perms)
         self._is_locked = False
 
@@ -92,13 +295,23 @@ class SafePackage(object):
     """
     Represents a package that can be inspected safely.
 
-    The safety is obtained by copying the package to a
+    The safety is obtained by staging the package at a
     working directory managed only by the application.
+
+    The staging strategies are tried in order, until one succeeds. See
+    `STAGING_STRATEGIES`.
+
+    :param package: filesystem path to the package.
+    :param working_dir: filesystem path to the working directory.
+    :param staging: (optional) sequence of staging strategy names.
     """
-    def __init__(self, package, working_dir):
+    def __init__(self, package, working_dir, staging=DEFAULT_STAGING):
         self.primary_path = package
         self.path = None
         self.working_dir = working_dir
+        self.staging = staging
+        self.staged_by = None
+        self.checksum = None
 
         self._move_to_working_dir()
 
@@ -115,7 +328,24 @@ class SafePackage(object):
 
     def _move_to_working_dir(self):
         new_path = self._gen_safe_path()
-        shutil.copy2(self.primary_path, new_path)
+
+        same_fs = os.stat(self.primary_path).st_dev == os.stat(self.working_dir).st_dev
+        strategies = [name for name in self.staging if same_fs or name not in SAME_FS_STAGING]
+
+        for name in strategies:
+            try:
+                checksum = STAGING_STRATEGIES[name](self.primary_path, new_path)
+            except (IOError, OSError) as e:
+                logger.debug('Could not stage %s using %s: %s' % (self.primary_path, name, e))
+            else:
+                self.staged_by = name
+                self.checksum = checksum
+                break
+        else:
+            raise IOError('Could not stage %s at %s using %s.' % (
+                self.primary_path, self.working_dir, ', '.join(strategies)))
+
+        logger.info('Staged %s at %s using %s.' % (self.primary_path, new_path, self.staged_by))
         self.path = new_path
 
     @property
@@ -125,7 +355,8 @@ class SafePackage(object):
         """
         p_analyzer = getattr(self, '_analyzer', None)
         if not p_analyzer:
-            self._analyzer = PackageAnalyzer(self.path)
+            self._analyzer = PackageAnalyzer(self.path, checksum=self.checksum,
+                shared=self.staged_by in SHARED_INODE_STAGING)
 
         return p_analyzer or self._analyzer
 
@@ -143,6 +374,138 @@ class SafePackage(object):
             if not silence: raise
 
 
+class ReportAppender(object):
+    """
+    Appends lines to a report file, keeping it open between writes.
+
+    The file is opened in append mode and each line is written with a
+    single `write` call, so the lines written by concurrent processes
+    are never interleaved. The file is reopened if it is removed or
+    replaced, e.g. by the depositor. To spare a `stat` call per line,
+    this is checked once every `check_every` writes, so at most
+    `check_every` lines may be written to the removed file.
+
+    :param filepath: filesystem path to the report file.
+    :param fsync: (optional) if each line must be flushed to the disk.
+    :param check_every: (optional) number of writes between the checks
+      for a removed or replaced file.
+    """
+    def __init__(self, filepath, fsync=False, check_every=16):
+        self.filepath = filepath
+        self.fsync = fsync
+        self.check_every = check_every
+        self._lock = threading.Lock()
+        self._fd = None
+        self._inode = None
+        self._unchecked_writes = 0
+
+    def __del__(self):
+        self._close()
+
+    def _open(self):
+        self._close()
+        self._fd = os.open(self.filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        self._inode = os.fstat(self._fd).st_ino
+        self._unchecked_writes = 0
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _is_stale(self):
+        try:
+            return os.stat(self.filepath).st_ino != self._inode
+        except OSError:
+            return True
+
+    def write(self, line):
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+
+        with self._lock:
+            if self._fd is None:
+                self._open()
+            elif self._unchecked_writes >= self.check_every:
+                if self._is_stale():
+                    self._open()
+                else:
+                    self._unchecked_writes = 0
+
+            os.write(self._fd, line)
+            self._unchecked_writes += 1
+            if self.fsync:
+                os.fsync(self._fd)
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class ReportAppenders(object):
+    """
+    Registry of the `ReportAppender` instances shared by the process.
+
+    At most `max_open` report files are kept open, and the least
+    recently used is closed when the limit is reached. The registry is
+    reset on forked processes, since the locks held by the parent at
+    fork time would never be released in the child.
+
+    :param fsync: (optional) if each line must be flushed to the disk.
+    :param max_open: (optional) max number of open report files.
+    """
+    def __init__(self, fsync=False, max_open=64):
+        self.fsync = fsync
+        self.max_open = max_open
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._appenders = collections.OrderedDict()
+
+    def configure(self, fsync=None, max_open=None):
+        """
+        Changes the registry settings. Open report files are closed.
+        """
+        if fsync is not None:
+            self.fsync = fsync
+        if max_open is not None:
+            self.max_open = max_open
+
+        self.close_all()
+
+    def get(self, filepath):
+        """
+        Returns the appender bound to `filepath`.
+        """
+        if self._pid != os.getpid():
+            self._reset()
+
+        with self._lock:
+            try:
+                appender = self._appenders.pop(filepath)
+            except KeyError:
+                appender = ReportAppender(filepath, fsync=self.fsync)
+                while len(self._appenders) >= self.max_open:
+                    self._appenders.popitem(last=False)[1].close()
+
+            self._appenders[filepath] = appender
+
+        return appender
+
+    def close_all(self):
+        with self._lock:
+            while self._appenders:
+                self._appenders.popitem()[1].close()
+
+
+report_appenders = ReportAppenders()
+
+# name of the report file written next to the packages.
+REPORT_FILENAME = 'report.log'
+
+
 class CheckinReporter(object):
     def __init__(self, package_path):
         """
@@ -150,9 +513,8 @@ class CheckinReporter(object):
         """
         self.packname = os.path.basename(package_path)
         self.dirname = os.path.dirname(package_path)
-        self.report_filepath = os.path.join(self.dirname, 'report.log')
+        self.report_filepath = os.path.join(self.dirname, REPORT_FILENAME)
 
     def tell(self, message):
-        with open(self.report_filepath, 'a') as fp:
-            fp.write('[%s]\t%s\t%s\n' % (datetime.now(), self.packname, message))
-
+        report_appenders.get(self.report_filepath).write(
+            '[%s]\t%s\t%s\n' % (datetime.now(), self.packname, message))
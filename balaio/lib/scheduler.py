@@ -0,0 +1,175 @@
+#coding: utf-8
+"""Scheduling of the packages waiting to be checked in."""
+import os
+import time
+import Queue
+import itertools
+import collections
+
+
+class FairQueue(Queue.Queue):
+    """
+    Job queue that is fair among the classes of packages.
+
+    Jobs are `(filepath, key)` pairs, where `key` is the file identity
+    `(inode, size, mtime)` as produced by `fsindex.SeenFileIndex.key`.
+    A job's class is the directory the package was deposited at, and
+    the classes are served in a round-robin fashion, so a publisher
+    depositing hundreds of packages does not delay the others.
+
+    Among the jobs of the same class, the smallest package is served
+    first, unless a job has been waiting for more than `age_boost`
+    seconds, in which case the oldest one is served.
+
+    Any other item, e.g. a shutdown sentinel, is served only after all
+    jobs.
+
+    :param maxsize: (optional) max number of items in the queue.
+    :param age_boost: (optional) max seconds a job waits before being
+    served regardless of its size.
+    """
+    def __init__(self, maxsize=0, age_boost=600):
+        self.age_boost = age_boost
+        Queue.Queue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        self.classes = collections.OrderedDict()
+        self.others = collections.deque()
+        self._stats = {}
+        self._counter = itertools.count()
+
+    def _qsize(self, len=len):
+        return sum(len(jobs) for jobs in self.classes.values()) + len(self.others)
+
+    @staticmethod
+    def classify(job):
+        filepath, key = job
+        return os.path.dirname(filepath)
+
+    def _put(self, item):
+        if not isinstance(item, tuple):
+            self.others.append(item)
+            return None
+
+        job_class = self.classify(item)
+
+        # jobs are stored as (size, order, enqueued_at, job).
+        self.classes.setdefault(job_class, []).append(
+            (item[1][1], next(self._counter), time.time(), item))
+        self._stats.setdefault(job_class, {'served': 0, 'total_wait': 0.0, 'max_wait': 0.0})
+
+    def _get(self):
+        if not self.classes:
+            return self.others.popleft()
+
+        # the served class goes to the end of the line.
+        job_class, jobs = self.classes.popitem(last=False)
+
+        now = time.time()
+        oldest = min(jobs, key=lambda entry: entry[1])
+        if now - oldest[2] > self.age_boost:
+            entry = oldest
+        else:
+            entry = min(jobs)
+
+        wait = now - entry[2]
+        stats = self._stats[job_class]
+        stats['served'] += 1
+        stats['total_wait'] += wait
+        stats['max_wait'] = max(stats['max_wait'], wait)
+
+        jobs.remove(entry)
+        if jobs:
+            self.classes[job_class] = jobs
+        else:
+            # so the metrics of drained classes do not pile up.
+            del self._stats[job_class]
+
+        return entry[3]
+
+    def stats(self):
+        """
+        Returns a dict of the queue metrics by class.
+
+        Each class has the keys `depth`, the number of waiting jobs,
+        `served`, `mean_wait` and `max_wait`, in seconds. Classes are
+        reported while they have waiting jobs, so their metrics are
+        reset once they are drained.
+        """
+        with self.mutex:
+            result = {}
+            for job_class, stats in self._stats.items():
+                served = stats['served']
+                result[job_class] = {
+                    'depth': len(self.classes.get(job_class, ())),
+                    'served': served,
+                    'mean_wait': stats['total_wait'] / served if served else 0.0,
+                    'max_wait': stats['max_wait'],
+                }
+
+            return result
+
+
+class FairBacklog(object):
+    """
+    Backlog of files waiting for room in the job queue, fair among
+    the classes of packages, as in `FairQueue`.
+
+    Files are served round-robin among the directories they were
+    deposited at, and in the order they were added within the same
+    directory, so a publisher's bulk deposit does not hold back the
+    files of the others. The backlog is unbounded.
+    """
+    def __init__(self):
+        self.classes = collections.OrderedDict()
+        self._filepaths = set()
+
+    def __len__(self):
+        return len(self._filepaths)
+
+    def __contains__(self, filepath):
+        return filepath in self._filepaths
+
+    def __iter__(self):
+        """
+        Iterates over the files by class, not in the order they are served.
+        """
+        for filepaths in self.classes.values():
+            for filepath in filepaths:
+                yield filepath
+
+    @staticmethod
+    def classify(filepath):
+        return os.path.dirname(filepath)
+
+    def append(self, filepath):
+        if filepath in self._filepaths:
+            return None
+
+        self.classes.setdefault(self.classify(filepath), collections.deque()).append(filepath)
+        self._filepaths.add(filepath)
+
+    def peek(self):
+        """
+        Returns the next file to be served, without removing it.
+        """
+        for filepaths in self.classes.values():
+            return filepaths[0]
+
+        raise IndexError('the backlog is empty')
+
+    def popleft(self):
+        """
+        Removes and returns the next file to be served.
+        """
+        if not self.classes:
+            raise IndexError('the backlog is empty')
+
+        # the served class goes to the end of the line.
+        job_class, filepaths = self.classes.popitem(last=False)
+        filepath = filepaths.popleft()
+        if filepaths:
+            self.classes[job_class] = filepaths
+
+        self._filepaths.discard(filepath)
+        return filepath
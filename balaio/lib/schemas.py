@@ -0,0 +1,121 @@
+#coding: utf-8
+"""Process-wide cache of the compiled SPS validation schemas."""
+import time
+import logging
+import threading
+
+from lxml import etree
+
+from . import xmlcatalog
+
+
+logger = logging.getLogger(__name__)
+
+# public ids of the DOCTYPEs allowed by SPS. Their DTDs are resolved
+# through the XML catalog, as the DOCTYPE of the XML files are.
+SPS_PUBLIC_IDS = (
+    '-//NLM//DTD JATS (Z39.96) Journal Publishing DTD v1.0 20120330//EN',
+    '-//NLM//DTD Journal Publishing DTD v3.0 20080202//EN',
+)
+
+DEFAULT_PUBLIC_ID = SPS_PUBLIC_IDS[0]
+
+
+class UnknownSchema(LookupError):
+    """
+    Raised when there is not a local schema for a public id.
+    """
+
+
+def load_schema(public_id):
+    """
+    Loads and compiles the DTD bound to `public_id` by the XML catalog.
+    """
+    if public_id not in SPS_PUBLIC_IDS:
+        raise UnknownSchema('Unsupported DOCTYPE public id: %s' % public_id)
+
+    schema_path = xmlcatalog.get_catalog().lookup(None, public_id)
+    if schema_path is None:
+        raise UnknownSchema('Could not find the DTD of %s locally.' % public_id)
+
+    return etree.DTD(schema_path)
+
+
+def schema_id_for(xml):
+    """
+    Returns the public id of the DTD `xml` must be validated against,
+    as declared by its DOCTYPE. XML files without a DOCTYPE are
+    validated against `DEFAULT_PUBLIC_ID`.
+
+    :param xml: etree instance.
+    """
+    return xml.docinfo.public_id or DEFAULT_PUBLIC_ID
+
+
+class SchemaCache(object):
+    """
+    Keeps the compiled schemas, so each one is compiled once per process.
+
+    Validators hold the error log of their last run, so validations
+    against the same schema are serialized.
+
+    :param loader: (optional) callable that compiles a schema by its public id.
+    """
+    def __init__(self, loader=load_schema):
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._schemas = {}
+
+    def get(self, schema_id):
+        """
+        Returns a tuple comprising the compiled schema and its lock.
+
+        Raises `UnknownSchema` if there is not a schema for `schema_id`.
+        """
+        with self._lock:
+            try:
+                entry = self._schemas[schema_id]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                return entry
+
+            started_at = time.time()
+            entry = self._schemas[schema_id] = (self.loader(schema_id), threading.Lock())
+            logger.info('Compiled the schema %s in %.3fs.' % (schema_id, time.time() - started_at))
+
+            return entry
+
+    def warm(self, schema_ids=None):
+        """
+        Compiles the schemas beforehand. Failures are logged and ignored.
+
+        :param schema_ids: (optional) defaults to all `SPS_PUBLIC_IDS`.
+        """
+        for schema_id in set(schema_ids or SPS_PUBLIC_IDS):
+            try:
+                self.get(schema_id)
+            except (UnknownSchema, IOError, etree.LxmlError) as e:
+                logger.warning('Could not compile the schema %s: %s' % (schema_id, e))
+
+    def validate(self, xml):
+        """
+        Validates `xml` against the schema bound to its DOCTYPE.
+
+        Returns a tuple comprising the validation status and the errors list.
+
+        :param xml: etree instance.
+        """
+        schema, lock = self.get(schema_id_for(xml))
+        with lock:
+            result = schema.validate(xml)
+            return result, list(schema.error_log)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'schemas': len(self._schemas)}
+
+
+cache = SchemaCache()
@@ -3,8 +3,13 @@
 Useful functions to extract results from
 scieloapi result sets.
 """
+import functools
 import itertools
 
+import requests
+import scieloapi
+from scieloapi import httpbroker
+
 
 def has_any(dataset):
     """
@@ -38,3 +43,73 @@ def get_one(dataset):
     else:
         raise ValueError('dataset is empty')
 
+
+class KeepAliveBroker(object):
+    """
+    HTTP broker for scieloapi that reuses its connections.
+
+    :mod:`scieloapi.httpbroker` opens a new connection per request;
+    this one keeps them alive in a `requests.Session`, so consecutive
+    requests to SciELO Manager skip the TCP and TLS handshakes.
+    As in the stock broker, `requests` exceptions are re-raised as
+    :mod:`scieloapi.exceptions`.
+
+    :param session: (optional) a `requests.Session` instance.
+    """
+    def __init__(self, session=None):
+        self.session = session or requests.Session()
+        self.requests = 0
+
+    def _options(self, url, auth, check_ca):
+        options = {}
+        if auth and all(auth):
+            options['auth'] = httpbroker.ApiKeyAuth(*auth)
+
+        if url.startswith('https'):
+            options['verify'] = check_ca
+
+        return options
+
+    @httpbroker.translate_exceptions
+    def get(self, api_uri, endpoint=None, resource_id=None, params=None, auth=None, check_ca=False):
+        if not endpoint and resource_id:
+            raise ValueError('resource_id depends on an endpoint definition')
+
+        full_url = httpbroker._make_full_url(api_uri, endpoint, resource_id)
+        headers = {'User-Agent': scieloapi.__user_agent__}
+
+        self.requests += 1
+        resp = self.session.get(full_url,
+                                headers=headers,
+                                params=httpbroker.prepare_params(params),
+                                **self._options(full_url, auth, check_ca))
+        httpbroker.check_http_status(resp)
+
+        return resp.json()
+
+    @httpbroker.translate_exceptions
+    def post(self, api_uri, data, endpoint=None, auth=None, check_ca=False):
+        full_url = httpbroker._make_full_url(api_uri, endpoint)
+        headers = {'User-Agent': scieloapi.__user_agent__,
+                   'Content-Type': 'application/json'}
+
+        self.requests += 1
+        resp = self.session.post(full_url,
+                                 data=httpbroker.prepare_data(data),
+                                 headers=headers,
+                                 **self._options(full_url, auth, check_ca))
+        httpbroker.check_http_status(resp)
+
+        if resp.status_code != 201:
+            raise scieloapi.exceptions.APIError('The server gone nuts: %s' % resp.status_code)
+
+        return resp.headers['location']
+
+
+def keepalive_client(username, api_key, api_uri=None, broker=None):
+    """
+    Returns a `scieloapi.Client` bound to a :class:`KeepAliveBroker`.
+    """
+    connector = functools.partial(scieloapi.core.Connector,
+                                  http_broker=broker or KeepAliveBroker())
+    return scieloapi.Client(username, api_key, api_uri=api_uri, connector_dep=connector)
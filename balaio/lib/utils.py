@@ -4,17 +4,66 @@ import requests
 import zipfile
 from StringIO import StringIO
 import logging, logging.handlers
-from ConfigParser import SafeConfigParser
+from ConfigParser import SafeConfigParser, NoSectionError, NoOptionError
 
 from requests.exceptions import Timeout, RequestException
 
 
 logger = logging.getLogger('balaio.utils')
 
+# magic bytes of a zip local file header
+ZIP_SIGNATURE = 'PK\x03\x04'
+
 # flag to indicate if the process have
 # already defined a logger handler.
 has_logger = False
 
+# values of the settings missing from older configuration files.
+CONFIG_DEFAULTS = {
+    'app': {
+        'staging': 'reflink,copy',
+    },
+    'monitor': {
+        'executor': 'thread',
+        'workers': 1,
+        'queue_size': 100,
+        'scheduling': 'fair',
+        'age_boost': 600.0,
+        'admission_timeout': 0.5,
+        'debounce': 2.0,
+        'catch_up': True,
+        'seen_index': '/var/lib/balaio/monitor_seen.db',
+        'job_journal': '/var/lib/balaio/monitor_jobs.db',
+        'bootstrap_seen_index': False,
+        'drain_on_shutdown': False,
+        'group_commit': False,
+        'group_commit_size': 50,
+        'group_commit_latency': 0.05,
+        'report_fsync': False,
+        'report_max_open': 64,
+    },
+    'validator': {
+        'wakeup': 'auto',
+        'wakeup_socket': '/tmp/balaio_wd/validator.sock',
+        'poll_min': 1.0,
+        'poll_max': 60.0,
+        'claim_size': 10,
+        'claim_lease': 600,
+        'max_failures': 3,
+    },
+    'dispatcher': {
+        'batch_size': 50,
+        'max_tries': 10,
+        'backoff': 30,
+        'max_backoff': 3600,
+        'poll_min': 1.0,
+        'poll_max': 10.0,
+    },
+    'manager': {
+        'batch_notices': True,
+    },
+}
+
 
 class SingletonMixin(object):
     """
@@ -41,6 +90,9 @@ class SingletonMixin(object):
 class Configuration(SingletonMixin):
     """
     Acts as a proxy to the ConfigParser module
+
+    Settings missing from the file are taken from `CONFIG_DEFAULTS`,
+    if available.
     """
     def __init__(self, fp, parser_dep=SafeConfigParser):
         self.conf = parser_dep()
@@ -67,6 +119,27 @@ class Configuration(SingletonMixin):
     def __getattr__(self, attr):
         return getattr(self.conf, attr)
 
+    def _get_or_default(self, getter, section, option, **kwargs):
+        try:
+            return getter(section, option, **kwargs)
+        except (NoSectionError, NoOptionError) as e:
+            try:
+                return CONFIG_DEFAULTS[section][option]
+            except KeyError:
+                raise e
+
+    def get(self, section, option, **kwargs):
+        return self._get_or_default(self.conf.get, section, option, **kwargs)
+
+    def getint(self, section, option):
+        return self._get_or_default(self.conf.getint, section, option)
+
+    def getfloat(self, section, option):
+        return self._get_or_default(self.conf.getfloat, section, option)
+
+    def getboolean(self, section, option):
+        return self._get_or_default(self.conf.getboolean, section, option)
+
     def items(self):
         """Settings as key-value pair.
         """
@@ -126,6 +199,21 @@ def setup_logging(config):
         has_logger = True
 
 
+def reset_logging_sockets():
+    """
+    Drops the sockets held by logging socket handlers.
+
+    Must be called by forked processes, so they do not write to the
+    same socket of the parent process. The handlers reconnect lazily
+    on the next emitted record.
+    """
+    for handler_ref in logging._handlerList:
+        handler = handler_ref()
+        if isinstance(handler, logging.handlers.SocketHandler) and handler.sock:
+            handler.sock.close()
+            handler.sock = None
+
+
 def normalize_data(data):
     """
     Normalize the ``data`` param converting to uppercase and clean spaces
@@ -287,6 +375,20 @@ def issue_identification(volume, number, supplement):
     return (volume, volume_suppl, number, number_suppl)
 
 
+def has_zip_signature(filename):
+    """
+    Cheap check for the zip local file header signature.
+
+    Unlike `zipfile.is_zipfile`, the central directory is not read,
+    so this test does not grant the file is a valid zip file.
+    """
+    try:
+        with open(filename, 'rb') as fp:
+            return fp.read(len(ZIP_SIGNATURE)) == ZIP_SIGNATURE
+    except IOError:
+        return False
+
+
 def zip_files(dict_files, compression=zipfile.ZIP_DEFLATED):
     """
     Compact dict itens passed by parameter and return a file-like object
@@ -51,7 +51,7 @@ class FundingGroupValidationPipe(base.ValidationPipe):
 
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = pkg_analyzer.xml_index
 
         funding_nodes = xml_tree.findall('.//funding-group')
 
@@ -86,7 +86,7 @@ class DOIVAlidationPipe(base.ValidationPipe):
 
         attempt, pkg_analyzer, journal_data = item[:3]
 
-        doi_xml = pkg_analyzer.xml.findtext('.//article-id/[@pub-id-type="doi"]')
+        doi_xml = pkg_analyzer.xml_index.findtext('.//article-id/[@pub-id-type="doi"]')
 
         if doi_xml:
             if self._doi_validator(doi_xml):
@@ -112,7 +112,7 @@ class LicenseValidationPipe(base.ValidationPipe):
 
         attempt, pkg_analyzer, journal_data = item[:3]
 
-        license_xml = pkg_analyzer.xml.find('.//article-meta/permissions')
+        license_xml = pkg_analyzer.xml_index.find('.//article-meta/permissions')
 
         if license_xml is not None:
             if license_xml.findtext('.//license-p'):
@@ -144,7 +144,7 @@ class ArticleSectionValidationPipe(base.ValidationPipe):
         """
         attempt, pkg_analyzer, issue_data = item[:3]
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = pkg_analyzer.xml_index
         xml_section = xml_tree.findtext('.//article-categories/subj-group[@subj-group-type="heading"]/subject')
 
         if xml_section:
@@ -218,7 +218,7 @@ class ArticleMetaPubDateValidationPipe(base.ValidationPipe):
 
         attempt, pkg_analyzer, issue_data = item[:3]
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = pkg_analyzer.xml_index
         xml_data = xml_tree.findall('.//article-meta//pub-date')
 
         issue_year = str(issue_data.get('publication_year'))
@@ -9,7 +9,6 @@ __all__ = ['attempt_is_valid',
 
 import logging
 
-import transaction
 import plumber
 
 from .. import (
@@ -23,6 +22,21 @@ from .. import (
 logger = logging.getLogger(__name__)
 
 
+def get_notifier(item, notifier_factory):
+    """
+    Returns the notifier carried by the pipeline `item`, or a new one
+    produced by `notifier_factory`, for items that do not carry it.
+
+    `item` is a tuple comprised of instances of models.Attempt, a
+    checkin.PackageAnalyzer, a dict of journal and issue data, a db
+    session and, optionally, a notifier.
+    """
+    if len(item) > 4:
+        return item[4]
+
+    return notifier_factory(item[0], item[3])
+
+
 def attempt_is_valid(data):
     """
     Ensure the `models.Attempt` instance is valid before being processed.
@@ -31,7 +45,7 @@ def attempt_is_valid(data):
     http://git.io/kPMqqw
     """
     try:
-        attempt, _, _, _ = data
+        attempt = data[0]
     except TypeError:
         attempt = data
 
@@ -57,16 +71,15 @@ class ValidationPipe(plumber.Pipe):
         checkin.PackageAnalyzer, a dict of journal and issue data.
         """
         attempt = item[0]
-        db_session = item[3]
         logger.debug('%s started processing %s' % (self.__class__.__name__, attempt))
 
         result_status, result_description = self.validate(item)
 
-        savepoint = transaction.savepoint()
+        # the changes are rolled back by the caller, within the
+        # savepoint of the attempt.
         try:
-            self._notifier(attempt, db_session).tell(result_description, result_status, label=self._stage_)
+            get_notifier(item, self._notifier).tell(result_description, result_status, label=self._stage_)
         except Exception as e:
-            savepoint.rollback()
             logger.error('An exception was raised during %s stage: %s' % (self._stage_, e))
             raise
 
@@ -150,8 +163,12 @@ class SetupPipe(plumber.Pipe):
         Adds some data that will be needed during validation
         workflow.
 
+        The notifier is created once per attempt, and carried by the
+        item to the next pipes, as is the index of the XML elements,
+        available at `PackageAnalyzer.xml_index`.
+
         :param message: is a models.Attempt, db session pair.
-        :returns: a tuple (Attempt, PackageAnalyzer, journal_data, db_session)
+        :returns: a tuple (Attempt, PackageAnalyzer, journal_data, db_session, notifier)
         """
         # setup
         attempt, db_session = message
@@ -167,6 +184,10 @@ class SetupPipe(plumber.Pipe):
         pkg_analyzer = attempt.analyzer
         pkg_analyzer.lock_package()
 
+        # the XML elements are indexed at once, so the validation pipes
+        # do not need to traverse the whole tree for each search.
+        pkg_analyzer.xml_index
+
         journal_data = self.get_journal(attempt)
         if not journal_data:
             logger.info('%s is not related to a known journal' % attempt)
@@ -176,7 +197,7 @@ class SetupPipe(plumber.Pipe):
             notifier.tell('The article is not related to a known journal or issue.',
                 models.Status.error)
 
-        return (attempt, pkg_analyzer, journal_data, db_session)
+        return (attempt, pkg_analyzer, journal_data, db_session, notifier)
 
 
 class TearDownPipe(plumber.Pipe):
@@ -184,10 +205,10 @@ class TearDownPipe(plumber.Pipe):
         self._notifier = notifier
 
     def transform(self, item):
-        attempt, pkg_analyzer, journal, db_session = item
+        attempt, pkg_analyzer, journal, db_session = item[:4]
 
         logger.debug('%s started processing %s' % (self.__class__.__name__, item))
-        self._notifier(attempt, db_session).end()
+        get_notifier(item, self._notifier).end()
 
         pkg_analyzer.restore_perms()
 
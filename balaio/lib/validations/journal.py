@@ -37,7 +37,7 @@ class PublisherNameValidationPipe(base.ValidationPipe):
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
         j_publisher_name = journal_and_issue_data.get('journal', {}).get('publisher_name', None)
         if j_publisher_name:
-            data = pkg_analyzer.xml
+            data = pkg_analyzer.xml_index
             xml_publisher_name = data.findtext('.//journal-meta/publisher/publisher-name')
 
             if xml_publisher_name:
@@ -69,7 +69,7 @@ class JournalAbbreviatedTitleValidationPipe(base.ValidationPipe):
         abbrev_title = journal_and_issue_data.get('journal').get('short_title')
 
         if abbrev_title:
-            abbrev_title_xml = pkg_analyzer.xml.find('.//journal-meta/journal-title-group/abbrev-journal-title[@abbrev-type="publisher"]')
+            abbrev_title_xml = pkg_analyzer.xml_index.find('.//journal-meta/journal-title-group/abbrev-journal-title[@abbrev-type="publisher"]')
             if abbrev_title_xml is not None:
                 if self._normalize_data(abbrev_title) == self._normalize_data(abbrev_title_xml.text):
                     return [models.Status.ok, 'Valid abbrev-journal-title: %s' % abbrev_title_xml.text ]
@@ -105,7 +105,7 @@ class NLMJournalTitleValidationPipe(base.ValidationPipe):
         #The value returned from get('medline_title') when do not have title is None
         j_nlm_title = journal_and_issue_data.get('journal').get('medline_title')
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = pkg_analyzer.xml_index
         xml_nlm_title = xml_tree.findtext('.//journal-meta/journal-id[@journal-id-type="nlm-ta"]')
 
         if not xml_nlm_title:
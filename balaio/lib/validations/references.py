@@ -8,14 +8,87 @@ __all__ = ['ReferenceValidationPipe',
            ]
 
 import re
+import weakref
 import logging
 
 from .. import models
+from .. import xmlindex
 from . import base
 
 
 logger = logging.getLogger(__name__)
 
+YEAR_FORMAT = re.compile(r'\d{4}')
+
+# elements of a ``ref`` looked for by the checks.
+CHECKED_TAGS = ('source', 'year', 'element-citation')
+
+
+class ReferenceCheck(object):
+    """
+    The outcome of the checks of the references of an article.
+
+    Each ``ref`` is visited once, and all the checks are performed
+    during the visit. The results are then reported by the reference
+    validation pipes, each one at its own stage.
+
+    :param refs: the ``.//ref-list/ref`` elements.
+    """
+    def __init__(self, refs):
+        self.count = 0
+        self.missing_source = []
+        self.missing_year = []
+        self.bad_year = []
+        self.missing_article_title = []
+
+        for ref in refs:
+            self._check(ref)
+
+    def _check(self, ref):
+        source = year = article_title = None
+
+        # the first of each, in document order, as ``ref.find`` does.
+        for element in xmlindex.iter_tags(ref, CHECKED_TAGS):
+            if element.tag == 'source':
+                if source is None:
+                    source = element
+            elif element.tag == 'year':
+                if year is None:
+                    year = element
+            elif article_title is None and element.get('publication-type') == 'journal':
+                article_title = element.find('article-title')
+
+        self.count += 1
+
+        if source is None or source.text is None:
+            self.missing_source.append(ref.attrib['id'])
+
+        if year is None or year.text is None:
+            self.missing_year.append(ref.attrib['id'])
+        elif not YEAR_FORMAT.search(year.text):
+            self.bad_year.append((ref.attrib['id'], year.text))
+
+        if article_title is None or article_title.text is None:
+            self.missing_article_title.append(ref.attrib['id'])
+
+
+_checks = weakref.WeakKeyDictionary()
+
+
+def check_references(pkg_analyzer):
+    """
+    Returns the `ReferenceCheck` of the package, performed once and
+    shared by the reference validation pipes.
+
+    :param pkg_analyzer: instance of `PackageAnalyzer`.
+    """
+    try:
+        return _checks[pkg_analyzer]
+    except KeyError:
+        check = _checks[pkg_analyzer] = ReferenceCheck(
+            pkg_analyzer.xml_index.findall('.//ref-list/ref'))
+        return check
+
 
 class ReferenceValidationPipe(base.ValidationPipe):
     """
@@ -32,10 +105,10 @@ class ReferenceValidationPipe(base.ValidationPipe):
         The article may be a editorial why return a warning if no references
         """
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
+        refs_count = check_references(pkg_analyzer).count
 
-        if refs:
-            return [models.Status.ok, 'Found ' + str(len(refs)) + ' references']
+        if refs_count:
+            return [models.Status.ok, 'Found ' + str(refs_count) + ' references']
         else:
             return [models.Status.warning, 'Missing data: references']
 
@@ -53,19 +126,8 @@ class ReferenceSourceValidationPipe(base.ValidationPipe):
         self._notifier = notifier
 
     def validate(self, item):
-        lst_errors = []
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
-
-        if refs:
-            for ref in refs:
-                source = ref.find(".//source")
-
-                if source is not None:
-                    if source.text is None:
-                        lst_errors.append(ref.attrib['id'])
-                else:
-                    lst_errors.append(ref.attrib['id'])
+        lst_errors = check_references(pkg_analyzer).missing_source
 
         if lst_errors:
             msg_error = 'Missing data: source. (%s)' % ', '.join(lst_errors)
@@ -87,25 +149,11 @@ class ReferenceYearValidationPipe(base.ValidationPipe):
         self._notifier = notifier
 
     def validate(self, item):
-
-        missing_data_ref_id_list = []
-        bad_data = []
-
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
+        check = check_references(pkg_analyzer)
 
-        if refs:
-            for ref in refs:
-                year = ref.find(".//year")
-
-                if year is not None:
-                    if year.text is None:
-                        missing_data_ref_id_list.append(ref.attrib['id'])
-                    else:
-                        if not re.search(r'\d{4}', year.text):
-                            bad_data.append((ref.attrib['id'], year.text))
-                else:
-                    missing_data_ref_id_list.append(ref.attrib['id'])
+        missing_data_ref_id_list = check.missing_year
+        bad_data = check.bad_year
 
         msg_error = ''
         if missing_data_ref_id_list:
@@ -130,21 +178,8 @@ class ReferenceJournalTypeArticleTitleValidationPipe(base.ValidationPipe):
         self._notifier = notifier
 
     def validate(self, item):
-
-        lst_errors = []
-
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
-
-        if refs:
-            for ref in refs:
-                article_title = ref.find(".//element-citation[@publication-type='journal']/article-title")
-
-                if article_title is not None:
-                    if article_title.text is None:
-                        lst_errors.append(ref.attrib['id'])
-                else:
-                    lst_errors.append(ref.attrib['id'])
+        lst_errors = check_references(pkg_analyzer).missing_article_title
 
         return [models.Status.error, 'Missing data: article-title. (%s)' % ', '.join(lst_errors) ] if lst_errors else [models.Status.ok, 'Valid data: article-title']
 
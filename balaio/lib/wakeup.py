@@ -0,0 +1,235 @@
+#coding: utf-8
+"""Wakeup of the validator when attempts are ready to be validated."""
+import os
+import glob
+import time
+import errno
+import socket
+import select
+import logging
+
+import transaction
+from sqlalchemy import text
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'balaio_validation'
+
+
+class PostgresChannel(object):
+    """
+    Wakeups sent through PostgreSQL LISTEN/NOTIFY.
+
+    Notifications are part of the transaction, so they are delivered
+    only if, and when, the transaction commits.
+
+    :param engine: (optional) engine used by the listener.
+    :param channel: (optional) name of the notification channel.
+    """
+    def __init__(self, engine=None, channel=CHANNEL):
+        self.engine = engine
+        self.channel = channel
+        self._conn = None
+
+    def notify(self, session):
+        session.execute(text('NOTIFY %s' % self.channel))
+
+    def listen(self):
+        self._conn = self.engine.raw_connection()
+        self._conn.connection.set_isolation_level(0)  # autocommit
+        cursor = self._conn.cursor()
+        cursor.execute('LISTEN %s' % self.channel)
+        cursor.close()
+
+    def fileno(self):
+        return self._conn.connection.fileno()
+
+    def drain(self):
+        dbapi_conn = self._conn.connection
+        dbapi_conn.poll()
+        count = len(dbapi_conn.notifies)
+        del dbapi_conn.notifies[:]
+        return count
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SocketChannel(object):
+    """
+    Wakeups sent as datagrams to local unix sockets.
+
+    Each listener binds its own socket, at `path` suffixed by its pid,
+    so many validator processes can listen at once. Wakeups are sent
+    to all of them.
+
+    Datagrams are sent after the transaction commits. They are
+    dropped if there is no listener, or if it has many pending
+    wakeups already.
+
+    :param path: filesystem path prefix of the sockets.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._sock = None
+        self._listen_path = None
+
+    def notify(self, session):
+        transaction.get().addAfterCommitHook(self._after_commit)
+
+    def _after_commit(self, committed):
+        if committed:
+            self.send()
+
+    def listener_paths(self):
+        """
+        Returns the paths of the sockets of the listeners.
+        """
+        prefix = self.path + '.'
+        return [path for path in glob.glob(prefix + '*') if path[len(prefix):].isdigit()]
+
+    def send(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        try:
+            for path in self.listener_paths():
+                try:
+                    sock.sendto(b'.', path)
+                except socket.error as e:
+                    if e.errno == errno.ECONNREFUSED:
+                        # left behind by a listener that is gone.
+                        _unlink(path)
+                    elif e.errno not in (errno.ENOENT, errno.EAGAIN):
+                        logger.warning('Could not send a wakeup to %s: %s' % (path, e))
+        finally:
+            sock.close()
+
+    def listen(self):
+        self._listen_path = '%s.%s' % (self.path, os.getpid())
+        _unlink(self._listen_path)
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(self._listen_path)
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def drain(self):
+        count = 0
+        while True:
+            try:
+                self._sock.recv(64)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return count
+                raise
+            count += 1
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            _unlink(self._listen_path)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def channel_from_config(config, engine=None):
+    """
+    Returns the channel set at `validator.wakeup`, or None if disabled.
+
+    `auto` stands for `postgres` when the database is PostgreSQL,
+    and `socket` otherwise.
+
+    :param config: `lib.utils.Configuration` instance.
+    :param engine: (optional) engine used by the listener.
+    """
+    kind = config.get('validator', 'wakeup')
+    if kind == 'auto':
+        kind = 'postgres' if config.get('app', 'db_dsn').startswith('postgres') else 'socket'
+
+    if kind == 'postgres':
+        return PostgresChannel(engine)
+    elif kind == 'socket':
+        return SocketChannel(config.get('validator', 'wakeup_socket'))
+    elif kind == 'off':
+        return None
+    else:
+        raise ValueError('unknown wakeup channel %s' % kind)
+
+
+class Waiter(object):
+    """
+    Waits for wakeups between validation rounds.
+
+    The channel is also polled, since wakeups may be lost, at intervals
+    that double while the rounds find nothing to do, from `min_interval`
+    up to `max_interval` seconds.
+
+    :param channel: (optional) a channel, or None to poll only.
+    :param min_interval: (optional) seconds to wait while busy.
+    :param max_interval: (optional) max seconds to wait while idle.
+    """
+    def __init__(self, channel=None, min_interval=1, max_interval=60):
+        self.channel = channel
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+        if self.channel is not None:
+            self.channel.listen()
+
+    def busy(self):
+        self.interval = self.min_interval
+
+    def idle(self):
+        self.interval = min(self.interval * 2, self.max_interval)
+
+    def wait(self):
+        """
+        Blocks until a wakeup arrives or the interval elapses.
+
+        Returns True if woken up.
+        """
+        if self.channel is None:
+            time.sleep(self.interval)
+            return False
+
+        readable, _, _ = select.select([self.channel], [], [], self.interval)
+        if readable and self.channel.drain():
+            self.busy()
+            return True
+
+        return False
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+
+
+_channel = None
+
+
+def setup(config):
+    """
+    Sets the channel through which the wakeups are sent by the process.
+    """
+    global _channel
+    _channel = channel_from_config(config)
+
+
+def notify(session):
+    """
+    Wakes the validator up once the transaction of `session` commits.
+    """
+    if _channel is not None:
+        _channel.notify(session)
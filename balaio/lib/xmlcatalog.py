@@ -0,0 +1,137 @@
+#coding: utf-8
+"""Offline resolution of the DTDs and entity sets referenced by XML files."""
+import os
+import logging
+import threading
+
+from lxml import etree
+from packtools.catalogs import XML_CATALOG
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_NS = 'urn:oasis:names:tc:entity:xmlns:xml:catalog'
+
+
+class UnresolvedEntity(IOError):
+    """
+    Raised when a DTD or entity set is not available locally.
+    """
+
+
+class XMLCatalog(object):
+    """
+    Local files bound to public identifiers, as declared by an
+    OASIS XML Catalog, and the files bundled alongside it.
+
+    The contents of the files are kept in memory after being read
+    for the first time.
+
+    :param catalog_path: (optional) filesystem path to the XML Catalog.
+    """
+    def __init__(self, catalog_path=XML_CATALOG):
+        self.root_dir = os.path.dirname(os.path.abspath(catalog_path))
+        self.public_ids = {}
+        self.basenames = {}
+        self._contents = {}
+        self._lock = threading.Lock()
+
+        catalog = etree.parse(catalog_path, etree.XMLParser(load_dtd=False, no_network=True))
+        for entry in catalog.iter('{%s}public' % CATALOG_NS):
+            self.public_ids[entry.get('publicId')] = os.path.join(self.root_dir, entry.get('uri'))
+
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            for filename in filenames:
+                self.basenames.setdefault(filename, os.path.join(dirpath, filename))
+
+    def lookup(self, system_url, public_id):
+        """
+        Returns the filesystem path to the file bound to `public_id`,
+        or to `system_url`, or None.
+
+        System identifiers are matched by their basenames, so remote
+        URLs to the known DTDs are resolved locally.
+        """
+        if public_id in self.public_ids:
+            return self.public_ids[public_id]
+
+        if system_url:
+            filepath = os.path.abspath(system_url)
+            if filepath.startswith(self.root_dir + os.sep) and os.path.isfile(filepath):
+                return filepath
+
+            return self.basenames.get(os.path.basename(system_url))
+
+    def read(self, filepath):
+        """
+        Returns the contents of the file at `filepath`, from memory.
+        """
+        try:
+            return self._contents[filepath]
+        except KeyError:
+            with open(filepath, 'rb') as fp:
+                contents = fp.read()
+
+            with self._lock:
+                return self._contents.setdefault(filepath, contents)
+
+
+class CatalogResolver(etree.Resolver):
+    """
+    Resolves DTDs and entity sets through a `XMLCatalog`.
+
+    Unknown resolutions raise `UnresolvedEntity`, so the parsing
+    fails fast, instead of falling back to the network.
+    """
+    def __init__(self, catalog):
+        super(CatalogResolver, self).__init__()
+        self.catalog = catalog
+
+    def resolve(self, system_url, public_id, context):
+        filepath = self.catalog.lookup(system_url, public_id)
+        if filepath is None:
+            raise UnresolvedEntity('Could not resolve %s (%s) locally.' % (system_url, public_id))
+
+        return self.resolve_string(self.catalog.read(filepath), context, base_url=filepath)
+
+
+_local = threading.local()
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """
+    Returns the `XMLCatalog` shared by the process.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = XMLCatalog()
+
+        return _catalog
+
+
+def get_parser():
+    """
+    Returns a parser bound to the shared catalog.
+
+    lxml parsers must not be shared by threads, so each
+    thread has its own.
+    """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(load_dtd=True, no_network=True)
+        parser.resolvers.add(CatalogResolver(get_catalog()))
+
+    return parser
+
+
+def parse(source):
+    """
+    Parses the XML at `source`, a filename or file-object, resolving
+    the DTDs and entity sets locally.
+
+    Raises `UnresolvedEntity` if the XML references an unknown DTD.
+    """
+    return etree.parse(source, get_parser())
@@ -0,0 +1,103 @@
+#coding: utf-8
+"""Index of the elements of a parsed XML document."""
+import re
+
+
+# ``.//tag`` followed by the remaining of the path, if any.
+DESCENDANT_PATH = re.compile(r'^\.//([\w.:-]+)(.*)$')
+
+# Elements under which the validations search.
+INDEXED_TAGS = ('journal-meta', 'article-meta', 'article-id', 'article-categories',
+                'funding-group', 'ack', 'ref-list')
+
+
+def iter_tags(element, tags):
+    """
+    Iterates, in document order, over `element` and its descendants
+    tagged as one of `tags`.
+    """
+    try:
+        return element.iter(*tags)
+    except TypeError:
+        # xml.etree.ElementTree filters by a single tag.
+        return (sub_element for sub_element in element.iter() if sub_element.tag in tags)
+
+
+class ElementIndex(object):
+    """
+    The elements of an XML tree tagged as one of `tags`, grouped by tag.
+
+    The tree is traversed once, when the index is created. Paths in
+    the form ``.//tag/remaining/path``, where `tag` is indexed, are
+    then resolved by searching ``remaining/path`` only below the
+    elements tagged ``tag``, instead of walking the whole tree again.
+    Other paths are resolved against the tree, as usual. Results are
+    kept by path.
+
+    Only some tags are indexed since, with lxml, it is the traversal
+    in Python of every element of a large document that is expensive.
+
+    Works with both `lxml.etree` and `xml.etree.ElementTree` trees,
+    and behaves like their `find`, `findall` and `findtext` methods.
+
+    :param tree: the parsed XML document, or its root element.
+    :param tags: (optional) the tags to be indexed.
+    """
+    def __init__(self, tree, tags=INDEXED_TAGS):
+        self.tree = tree
+        self.tags = frozenset(tags)
+        self._by_tag = dict((tag, []) for tag in self.tags)
+        self._by_path = {}
+
+        root = tree.getroot() if hasattr(tree, 'getroot') else tree
+        for element in iter_tags(root, self.tags):
+            # ``.//`` does not match the root element.
+            if element is not root:
+                self._by_tag[element.tag].append(element)
+
+    def findall(self, path):
+        """
+        Returns the elements matching `path`, in document order.
+        """
+        try:
+            return list(self._by_path[path])
+        except KeyError:
+            pass
+
+        match = DESCENDANT_PATH.match(path)
+        if match is None or match.group(1) not in self.tags:
+            found = self.tree.findall(path)
+        else:
+            tag, remaining = match.groups()
+            if remaining:
+                found = []
+                seen = set()
+                for element in self._by_tag[tag]:
+                    for sub_element in element.findall('.' + remaining):
+                        # nested `tag` elements share descendants.
+                        if sub_element not in seen:
+                            seen.add(sub_element)
+                            found.append(sub_element)
+            else:
+                found = self._by_tag[tag]
+
+        self._by_path[path] = found
+        return list(found)
+
+    def find(self, path):
+        """
+        Returns the first element matching `path`, or None.
+        """
+        found = self.findall(path)
+        return found[0] if found else None
+
+    def findtext(self, path, default=None):
+        """
+        Returns the text of the first element matching `path`, or
+        `default` if there is none.
+        """
+        element = self.find(path)
+        if element is None:
+            return default
+
+        return element.text or ''
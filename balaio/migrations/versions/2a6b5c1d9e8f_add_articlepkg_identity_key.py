@@ -0,0 +1,85 @@
+"""add ArticlePkg.identity_key
+
+Revision ID: 2a6b5c1d9e8f
+Revises: c438ff7274b
+Create Date: 2026-10-18 10:12:31.402113
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2a6b5c1d9e8f'
+down_revision = 'c438ff7274b'
+
+import hashlib
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import table, column
+
+
+BATCH_SIZE = 1000
+
+# frozen copy of `balaio.lib.models.make_identity_key`, as of this revision.
+IDENTITY_FIELDS = (
+    'article_title',
+    'journal_pissn',
+    'journal_eissn',
+    'issue_year',
+    'issue_volume',
+    'issue_number',
+    'issue_suppl_volume',
+    'issue_suppl_number',
+)
+
+
+def _normalize_identity_value(value):
+    if value is None:
+        return u''
+
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    else:
+        value = unicode(value)
+
+    return u' '.join(unicodedata.normalize('NFKC', value).lower().split())
+
+
+def make_identity_key(meta):
+    values = [_normalize_identity_value(meta.get(field)) for field in IDENTITY_FIELDS]
+    return hashlib.sha1(u'\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    op.add_column('articlepkg', sa.Column('identity_key', sa.String(length=40), nullable=True))
+
+    # backfill
+    conn = op.get_bind()
+    articlepkg = table('articlepkg', column('id'), column('identity_key'),
+        *[column(field) for field in IDENTITY_FIELDS])
+
+    update = (articlepkg.update()
+        .where(articlepkg.c.id == sa.bindparam('_id'))
+        .values(identity_key=sa.bindparam('_identity_key')))
+
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select([articlepkg])
+            .where(articlepkg.c.id > last_id)
+            .order_by(articlepkg.c.id)
+            .limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+
+        # a single executemany per batch.
+        conn.execute(update, [{'_id': row['id'], '_identity_key': make_identity_key(dict(row))}
+            for row in rows])
+
+        last_id = rows[-1]['id']
+
+    op.create_index('ix_articlepkg_identity_key', 'articlepkg', ['identity_key'])
+
+
+def downgrade():
+    op.drop_index('ix_articlepkg_identity_key', 'articlepkg')
+    op.drop_column('articlepkg', 'identity_key')
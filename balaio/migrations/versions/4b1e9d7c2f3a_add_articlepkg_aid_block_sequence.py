@@ -0,0 +1,22 @@
+"""add the sequence of ArticlePkg.aid blocks
+
+Revision ID: 4b1e9d7c2f3a
+Revises: 2a6b5c1d9e8f
+Create Date: 2026-10-18 11:03:12.220417
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b1e9d7c2f3a'
+down_revision = '2a6b5c1d9e8f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence('articlepkg_aid_block_seq')))
+
+
+def downgrade():
+    op.execute(sa.schema.DropSequence(sa.Sequence('articlepkg_aid_block_seq')))
@@ -0,0 +1,26 @@
+"""add attempt validation claim columns
+
+Revision ID: 5d3f8a2b6c1e
+Revises: 4b1e9d7c2f3a
+Create Date: 2026-10-18 12:20:45.118302
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d3f8a2b6c1e'
+down_revision = '4b1e9d7c2f3a'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('attempt', sa.Column('validation_claimed_by', sa.String(length=32), nullable=True))
+    op.add_column('attempt', sa.Column('validation_lease_expires_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_attempt_validation_claimed_by', 'attempt', ['validation_claimed_by'])
+
+
+def downgrade():
+    op.drop_index('ix_attempt_validation_claimed_by', 'attempt')
+    op.drop_column('attempt', 'validation_lease_expires_at')
+    op.drop_column('attempt', 'validation_claimed_by')
@@ -0,0 +1,38 @@
+"""add outbox
+
+Revision ID: 6e2a9c4d8b7f
+Revises: 5d3f8a2b6c1e
+Create Date: 2026-10-18 14:02:37.905126
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6e2a9c4d8b7f'
+down_revision = '5d3f8a2b6c1e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('attempt_id', sa.Integer(), nullable=True),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('tries', sa.Integer(), nullable=False),
+    sa.Column('next_try_at', sa.DateTime(), nullable=False),
+    sa.Column('delivered_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['attempt_id'], ['attempt.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_attempt_id', 'outbox', ['attempt_id'])
+    op.create_index('ix_outbox_delivered_at', 'outbox', ['delivered_at'])
+
+
+def downgrade():
+    op.drop_index('ix_outbox_delivered_at', 'outbox')
+    op.drop_index('ix_outbox_attempt_id', 'outbox')
+    op.drop_table('outbox')
@@ -0,0 +1,22 @@
+"""add attempt validation failures column
+
+Revision ID: 7c4e1a9b3d5f
+Revises: 6e2a9c4d8b7f
+Create Date: 2026-10-18 16:02:31.448210
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7c4e1a9b3d5f'
+down_revision = '6e2a9c4d8b7f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('attempt', sa.Column('validation_failures', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('attempt', 'validation_failures')
@@ -1,9 +1,13 @@
 #coding: utf-8
 import os
+import time
+import signal
 import threading
+import multiprocessing
 import Queue
 import logging
 import zipfile
+import collections
 
 import pyinotify
 import transaction
@@ -15,6 +19,11 @@ from lib import (
     excepts,
     notifier,
     package,
+    fsindex,
+    scheduler,
+    schemas,
+    committer,
+    wakeup,
 )
 
 
@@ -25,12 +34,13 @@ logger = logging.getLogger('balaio.monitor')
 mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVE_SELF | pyinotify.IN_MOVED_TO | pyinotify.IN_CREATE
 
 
-def process_package(pack, notifier):
+def process_package(pack, notifier, committer=None):
     """Perform the checkin process for one package.
 
     This method does not return any value.
     :param pack: `lib.package.SafePackage` instance.
     :param notifier: `lib.notifier.Notifier` instance.
+    :param committer: (optional) `lib.committer.GroupCommitter` instance.
     """
     logger.debug('Started processing %s.' % pack)
 
@@ -38,7 +48,7 @@ def process_package(pack, notifier):
     pack_reporter.tell('Started the identification process.')
 
     try:
-        attempt = checkin.get_attempt(pack)
+        attempt = checkin.get_attempt(pack, committer=committer)
 
     except excepts.MissingXML as e:
         pack.mark_as_failed(silence=True)
@@ -77,62 +87,440 @@ def process_package(pack, notifier):
         checkin_notifier.end()
 
         attempt.proceed_to_validation = True
+        wakeup.notify(session)
         transaction.commit()
 
 
+def iter_watched_files(watch_paths, recursive=True):
+    """Yields the path of every file under `watch_paths`.
+
+    Files prefixed with `_` are special packages, ignored by the system,
+    as are the report files written by the system itself.
+
+    :param watch_paths: list of directories.
+    :param recursive: (optional) if subdirectories must be visited.
+    """
+    for watch_path in watch_paths:
+        for dirpath, dirnames, filenames in os.walk(watch_path):
+            for filename in filenames:
+                if not filename.startswith('_') and filename != package.REPORT_FILENAME:
+                    yield os.path.join(dirpath, filename)
+
+            if not recursive:
+                break
+
+
+def checkin_job(filepath, config, checkin_notifier, committer=None):
+    """Perform the checkin of the package at `filepath`.
+
+    This is the full admission check, performed by the workers: the
+    package is processed only if it is a valid zip file.
+
+    :param filepath: absolute path to the package file.
+    :param config: `lib.utils.Configuration` instance.
+    :param checkin_notifier: a checkin notifier factory.
+    :param committer: (optional) `lib.committer.GroupCommitter` instance.
+    """
+    if not zipfile.is_zipfile(filepath):
+        logger.info('Invalid zipfile: %s.' % filepath)
+        return None
+
+    pack = package.SafePackage(filepath, config.get('app', 'working_dir'),
+                               staging=package.parse_staging(config.get('app', 'staging')))
+    process_package(pack, checkin_notifier, committer=committer)
+
+
+def _setup_worker_process(config):
+    """Prepare the state owned by a checkin worker process.
+
+    Each process must hold its own DB engine, since connections
+    inherited from the parent process cannot be shared.
+
+    :param config: `lib.utils.Configuration` instance.
+    :returns: a checkin notifier factory.
+    """
+    utils.reset_logging_sockets()
+    models.Session.configure(bind=models.create_engine_from_config(config))
+    wakeup.setup(config)
+    return notifier.checkin_notifier_factory(config)
+
+
+def _worker_process_main(config, conn):
+    """Main loop of a checkin worker process.
+
+    Filepaths are received through `conn` and, for each one, an
+    acknowledgement `(filepath, error)` is sent back after it has been
+    processed, where `error` is None on success.
+    """
+    CheckinNotifier = _setup_worker_process(config)
+
+    while True:
+        filepath = conn.recv()
+        if filepath == WorkerPool.shutdown_sentinel:
+            _log_schema_cache_stats()
+            conn.close()
+            return None
+
+        try:
+            checkin_job(filepath, config, CheckinNotifier)
+        except Exception as e:
+            conn.send((filepath, '%s' % e))
+        else:
+            conn.send((filepath, None))
+
+
+def _start_process(target, args):
+    """Starts a daemon process running `target(*args)`, and returns it.
+
+    The other threads keep running during the fork, and the child
+    inherits their locks in whatever state they are. The logging locks,
+    taken by every thread, are held during the fork, so no logging
+    structure is being changed, and recreated in the child. Other locks,
+    e.g. of the parent's DB connection pool, may still be inherited
+    locked, so the child must not use the state shared with the parent.
+    See `_setup_worker_process`.
+    """
+    process = multiprocessing.Process(target=_run_forked, args=(target,) + tuple(args))
+    process.daemon = True
+
+    handlers = [ref() for ref in logging._handlerList]
+    handlers = [handler for handler in handlers if handler is not None]
+
+    logging._acquireLock()
+    try:
+        for handler in handlers:
+            handler.acquire()
+        try:
+            process.start()
+        finally:
+            for handler in reversed(handlers):
+                handler.release()
+    finally:
+        logging._releaseLock()
+
+    return process
+
+
+def _run_forked(target, *args):
+    # the logging locks were held by the forking thread. See `_start_process`.
+    logging._lock = threading.RLock()
+    for ref in logging._handlerList:
+        handler = ref()
+        if handler is not None:
+            handler.createLock()
+
+    return target(*args)
+
+
+def _log_schema_cache_stats():
+    logger.info('Schema cache stats for process %s: %s.' % (os.getpid(),
+        ', '.join('%s=%s' % item for item in sorted(schemas.cache.stats().items()))))
+
+
+class ThreadExecutor(object):
+    """Runs checkin jobs on the calling thread.
+    """
+    def __init__(self, config, checkin_notifier, committer=None):
+        self.config = config
+        self.CheckinNotifier = checkin_notifier
+        self.committer = committer
+
+    def submit(self, filepath):
+        checkin_job(filepath, self.config, self.CheckinNotifier, committer=self.committer)
+
+    def shutdown(self):
+        _log_schema_cache_stats()
+
+
+class ProcessExecutor(object):
+    """Runs checkin jobs on a dedicated child process.
+
+    `submit` blocks until the child acknowledges the job, so the
+    calling thread owns exactly one job at a time, and raises
+    `excepts.CheckinJobFailed` if the job is not completed. If the child dies
+    while processing a job, it is respawned by the calling thread
+    right away, so the thread never waits for another one to do it.
+    """
+    def __init__(self, config):
+        self.config = config
+        self._spawn()
+
+    def _spawn(self):
+        self._conn, child_conn = multiprocessing.Pipe()
+        self.process = _start_process(_worker_process_main, (self.config, child_conn))
+        # so the death of the child is noticed as EOF.
+        child_conn.close()
+
+    def submit(self, filepath):
+        try:
+            self._conn.send(filepath)
+            filepath, error = self._conn.recv()
+        except (EOFError, IOError) as e:
+            pid = self.process.pid
+            self.respawn()
+            raise excepts.CheckinJobFailed('the worker process %s died: %s' % (pid, e))
+
+        if error is not None:
+            raise excepts.CheckinJobFailed(error)
+
+        return filepath
+
+    def respawn(self):
+        """Replaces the dead child process.
+
+        The new child is forked while the other worker threads are
+        running. See `_start_process` for the locks it may inherit.
+        """
+        self.process.join()
+        self._spawn()
+        logger.info('Respawned the checkin worker process as %s.' % self.process.pid)
+
+    def shutdown(self):
+        try:
+            self._conn.send(WorkerPool.shutdown_sentinel)
+        except IOError:
+            pass
+        self.process.join()
+
+
 class WorkerPool(object):
     """Pool of checkin processors.
 
     The pool is initialized during the instance initialization,
     and after being shutdown, it is not possible to restart it. Sorry =]
+
+    Jobs are consumed by `size` worker threads. With the `thread`
+    executor each thread performs the checkin by itself, and with the
+    `process` executor each thread hands its jobs over to a dedicated
+    child process, so the checkin of many packages is not serialized on
+    the GIL.
+
+    With the `fair` scheduling, jobs are served round-robin among the
+    directories the packages were deposited at, smaller packages first.
+    See `lib.scheduler.FairQueue`. The `fifo` scheduling serves jobs in
+    the order they were added.
+
+    Queued jobs are recorded at a `lib.fsindex.JobJournal` until they
+    are processed, so they can be resumed after a restart. See `resume`.
+
+    With `group_commit`, the Attempts registered by the worker threads
+    are committed in batches. See `lib.committer.GroupCommitter`. It is
+    available only with the `thread` executor.
     """
     shutdown_sentinel = '##HALT##'
+    executors = ('thread', 'process')
+    schedulings = ('fair', 'fifo')
+
+    def __init__(self, config, size=None, executor=None):
+        scheduling = config.get('monitor', 'scheduling')
+        if scheduling not in self.schedulings:
+            raise ValueError('scheduling must be one of %s' % ', '.join(self.schedulings))
+
+        if scheduling == 'fair':
+            self.job_queue = scheduler.FairQueue(maxsize=config.getint('monitor', 'queue_size'),
+                age_boost=config.getfloat('monitor', 'age_boost'))
+        else:
+            self.job_queue = Queue.Queue(maxsize=config.getint('monitor', 'queue_size'))
 
-    def __init__(self, config, size=None):
-        self.job_queue = Queue.Queue()
-        self.total_workers = size or 1
+        # fails on startup, instead of on each package.
+        package.parse_staging(config.get('app', 'staging'))
+
+        self.total_workers = size or config.getint('monitor', 'workers')
+        self.executor = executor or config.get('monitor', 'executor')
         self.config = config
         self.running_workers = None
+        self.seen_index = fsindex.SeenFileIndex(config.get('monitor', 'seen_index'))
+        self.journal = fsindex.JobJournal(config.get('monitor', 'job_journal'))
+        self.in_flight = set()
+        self.is_halting = False
+        self._in_flight_lock = threading.Lock()
+
+        package.report_appenders.configure(
+            fsync=config.getboolean('monitor', 'report_fsync'),
+            max_open=config.getint('monitor', 'report_max_open'))
+
+        if self.executor not in self.executors:
+            raise ValueError('executor must be one of %s' % ', '.join(self.executors))
+
+        self.committer = None
+        if self.executor == 'thread':
+            self.CheckinNotifier = notifier.checkin_notifier_factory(self.config)
+
+            if config.getboolean('monitor', 'group_commit'):
+                self.committer = committer.GroupCommitter(
+                    max_batch=config.getint('monitor', 'group_commit_size'),
+                    max_latency=config.getfloat('monitor', 'group_commit_latency'))
+
+        elif config.getboolean('monitor', 'group_commit'):
+            logger.warning('Group commit is not available with the %s executor.' % self.executor)
+
+        # worker processes inherit the compiled schemas.
+        schemas.cache.warm()
 
-        self.CheckinNotifier = notifier.checkin_notifier_factory(self.config)
         self._setup_workers()
 
     def __del__(self):
         self.shutdown()
 
+    def _make_executor(self):
+        if self.executor == 'process':
+            return ProcessExecutor(self.config)
+        else:
+            return ThreadExecutor(self.config, self.CheckinNotifier, committer=self.committer)
+
     def _setup_workers(self):
+        # child processes must be forked before any worker thread is started.
+        executors = [self._make_executor() for w in range(self.total_workers)]
+
         self.running_workers = []
-        for w in range(self.total_workers):
-            thread = threading.Thread(target=self._handle_events, args=(self.job_queue,))
+        for executor in executors:
+            thread = threading.Thread(target=self._handle_events, args=(self.job_queue, executor))
             self.running_workers.append(thread)
             thread.start()
 
-    def _handle_events(self, job_queue):
+    def _handle_events(self, job_queue, executor):
         while True:
-            filepath = job_queue.get()
-            if filepath == self.shutdown_sentinel:
+            job = job_queue.get()
+            if job == self.shutdown_sentinel:
+                executor.shutdown()
                 return None
 
-            pack = package.SafePackage(filepath, self.config.get('app', 'working_dir'))
-            process_package(pack, self.CheckinNotifier)
-
-    def add_job(self, filepath):
+            filepath, key = job
+            if self.is_halting:
+                # the job is kept at the journal.
+                with self._in_flight_lock:
+                    self.in_flight.discard((filepath, key[0]))
+                continue
+
+            try:
+                executor.submit(filepath)
+            except Exception as e:
+                # the job is kept at the journal, to be resumed on the
+                # next start.
+                logger.error('Failed to process %s: %s' % (filepath, e))
+            else:
+                self.seen_index.add(key, filepath)
+                self.journal.remove(filepath)
+            finally:
+                with self._in_flight_lock:
+                    self.in_flight.discard((filepath, key[0]))
+
+    def add_job(self, filepath, block=True, timeout=None):
         """Add a new package to be processed by the pool.
 
+        The job queue is bounded, so the call blocks while it is full,
+        at most for `timeout` seconds. If the job could not be queued,
+        the file is kept at the journal, so it is resumed after a
+        restart if the caller defers it and the monitor goes down.
+
+        Files are identified by their path and inode, and a file that
+        is already queued or being processed is not added again.
+
         :param filepath: is a string of the absolute path to the package file.
+        :param block: (optional) if the call must wait for a free slot.
+        :param timeout: (optional) max seconds to wait for a free slot.
+        :returns: False if the queue is full, True otherwise.
         """
-        self.job_queue.put(filepath)
+        # the file identity must be taken beforehand,
+        # since the file may be renamed during the checkin.
+        key = self.seen_index.key(filepath)
+        if key is None:
+            logger.info('The file is gone before being processed: %s.' % filepath)
+            self.journal.remove(filepath)
+            return True
+
+        in_flight_key = (filepath, key[0])
+        with self._in_flight_lock:
+            if in_flight_key in self.in_flight:
+                logger.debug('%s is already in the checkin processing pool.' % filepath)
+                return True
+
+            self.in_flight.add(in_flight_key)
+
+        # the job is recorded beforehand, since it may be
+        # processed before `put` returns.
+        self.journal.add(filepath)
+        try:
+            self.job_queue.put((filepath, key), block, timeout)
+        except Queue.Full:
+            with self._in_flight_lock:
+                self.in_flight.discard(in_flight_key)
+            return False
+        else:
+            return True
 
-    def shutdown(self):
+    def resume(self):
+        """Add to the pool the jobs recorded at the journal.
+
+        These are the jobs that were queued or being processed when
+        the monitor went down. Jobs are resumed in the order they
+        were first queued, and the call blocks while the queue is full.
+        """
+        pending = self.journal.pending()
+        if pending:
+            logger.info('Resuming %s jobs from the journal.' % len(pending))
+
+        for filepath in pending:
+            self.add_job(filepath)
+
+    def queue_stats(self):
+        """Returns the job queue metrics by class of packages.
+
+        Metrics are available only with the `fair` scheduling.
+        See `lib.scheduler.FairQueue.stats`.
+        """
+        if isinstance(self.job_queue, scheduler.FairQueue):
+            return self.job_queue.stats()
+        else:
+            return {}
+
+    def shutdown(self, drain=True):
         """Send a shutdown signal to all running workers.
 
-        All running workers are terminated gracefully.
+        All running workers are terminated gracefully, and the call
+        blocks until they are done. Then the group committer, if any,
+        is closed. If `drain` is False, the workers stop right after
+        their current jobs, and the queued jobs are kept at the journal
+        to be resumed later.
         """
-        for _ in range(len(self.running_workers)):
-            self.add_job(self.shutdown_sentinel)
+        if not drain:
+            self.is_halting = True
+
+        for _ in range(len(self.running_workers or [])):
+            self.job_queue.put(self.shutdown_sentinel)
+
+        current_thread = threading.current_thread()
+        for thread in self.running_workers or []:
+            if thread is current_thread:
+                continue
+
+            thread.join()
+
+        if self.committer is not None:
+            # the workers are done, so no more units are submitted.
+            self.committer.close()
+            self.committer = None
 
 
 class EventHandler(pyinotify.ProcessEvent):
+    """Admits new packages to the checkin processing pool.
+
+    Runs on the pyinotify notifier loop, so it performs only a cheap
+    sniff on each file before handing it over to the pool. When the
+    pool's job queue is full, files are deferred and admitted as soon as
+    there is room for them, round-robin among the directories they were
+    deposited at. See `lib.scheduler.FairBacklog`. Deferred files are
+    kept at the pool's job journal, so they are resumed if the monitor
+    goes down before they are admitted.
+
+    A single upload may fire many events, so the events about the same
+    file (path and inode) within `debounce` seconds are coalesced.
+
+    Admission metrics are kept at `stats`, under the keys `admitted`,
+    `coalesced`, `deferred` and `rejected`.
+    """
+    stats_interval = 300  # seconds
+
     def __init__(self, *args, **kwargs):
         config = kwargs.pop('config', None)
         super(EventHandler, self).__init__(*args, **kwargs)
@@ -141,6 +529,12 @@ class EventHandler(pyinotify.ProcessEvent):
             raise TypeError(u'__init__() expects a config kwarg')
 
         self.pool = WorkerPool(config)
+        self.admission_timeout = config.getfloat('monitor', 'admission_timeout')
+        self.deferred = scheduler.FairBacklog()
+        self.debounce = config.getfloat('monitor', 'debounce')
+        self.stats = collections.Counter()
+        self._stats_logged_at = time.time()
+        self._recent_events = {}
 
     def process_IN_CLOSE_WRITE(self, event):
         logger.debug('IN_CLOSE_WRITE event handler for %s.' % event)
@@ -159,16 +553,157 @@ class EventHandler(pyinotify.ProcessEvent):
         Add the package in a processing queue.
 
         All filenames prefixed with `_` are identified as special packages
-        and are ignored by the system.
+        and are ignored by the system, as are the report files.
         """
         filepath = event.pathname
-        if not os.path.basename(filepath).startswith('_'):
-            if not zipfile.is_zipfile(filepath):
-                logger.info('Invalid zipfile: %s.' % filepath)
+        filename = os.path.basename(filepath)
+        if not filename.startswith('_') and filename != package.REPORT_FILENAME:
+            if self.is_bounce(filepath):
+                logger.debug('Coalescing duplicated event for %s.' % filepath)
+                self.stats['coalesced'] += 1
                 return None
 
-            logger.debug('Adding %s to checkin processing pool.' % filepath)
-            self.pool.add_job(filepath)
+            if self.sniff(filepath):
+                self.admit(filepath)
+
+    def is_bounce(self, filepath):
+        """
+        Tells if an event about `filepath` was already handled within
+        the debounce window.
+        """
+        try:
+            key = (filepath, os.stat(filepath).st_ino)
+        except OSError:
+            return False
+
+        now = time.time()
+        for recent_key, handled_at in self._recent_events.items():
+            if now - handled_at > self.debounce:
+                del self._recent_events[recent_key]
+
+        if key in self._recent_events:
+            return True
+
+        self._recent_events[key] = now
+        return False
+
+    def sniff(self, filepath):
+        """
+        Cheap test to tell if `filepath` looks like a package.
+        """
+        if not utils.has_zip_signature(filepath):
+            logger.info('Invalid zipfile: %s.' % filepath)
+            self.stats['rejected'] += 1
+            return False
+
+        return True
+
+    def admit(self, filepath):
+        """
+        Add `filepath` to the checkin processing pool, or defer it if
+        the pool is busy.
+        """
+        self.flush_deferred()
+
+        if filepath in self.deferred:
+            logger.debug('%s is already deferred.' % filepath)
+            self.stats['coalesced'] += 1
+            return None
+
+        logger.debug('Adding %s to checkin processing pool.' % filepath)
+        if self.deferred or not self.pool.add_job(filepath, timeout=self.admission_timeout):
+            self._defer(filepath)
+        else:
+            self.stats['admitted'] += 1
+
+    def _defer(self, filepath):
+        logger.info('Checkin processing pool is busy. Deferring %s.' % filepath)
+        self.deferred.append(filepath)
+        self.stats['deferred'] += 1
+
+    def flush_deferred(self):
+        """
+        Admit deferred files while there is room in the pool.
+        """
+        while self.deferred:
+            if not self.pool.add_job(self.deferred.peek(), block=False):
+                break
+
+            self.deferred.popleft()
+            self.stats['admitted'] += 1
+
+    def log_stats(self):
+        """
+        Log the admission metrics, at most once every `stats_interval`.
+        """
+        now = time.time()
+        if now - self._stats_logged_at >= self.stats_interval:
+            self._stats_logged_at = now
+            logger.info('Admission stats: %s. Deferred backlog: %s.' % (
+                ', '.join('%s=%s' % item for item in sorted(self.stats.items())),
+                len(self.deferred)))
+
+            for job_class, stats in sorted(self.pool.queue_stats().items()):
+                logger.info('Queue stats for %s: depth=%s, served=%s, mean_wait=%.1fs, max_wait=%.1fs.' % (
+                    job_class, stats['depth'], stats['served'], stats['mean_wait'], stats['max_wait']))
+
+    def catch_up(self, watch_paths, recursive=True, bootstrap=False):
+        """
+        Add to the pool the files under `watch_paths` that have not
+        been seen yet, e.g. packages deposited while the monitor was down.
+
+        Only a `stat` call is needed per already seen file. Files
+        rejected by `sniff` are recorded as seen too, so they are not
+        read again on the next start.
+
+        If the index of seen files is brand new, e.g. because it was
+        lost, the files that were deposited while the monitor was down
+        can not be told apart from the ones already processed. Then
+        `excepts.MissingSeenIndex` is raised, unless `bootstrap` is set,
+        in which case all existing files are recorded as seen and
+        nothing is processed.
+        """
+        seen_index = self.pool.seen_index
+        bootstrapped = []
+        rejected = []
+        total = 0
+
+        for filepath in iter_watched_files(watch_paths, recursive=recursive):
+            key = seen_index.key(filepath)
+            if key is None or key in seen_index:
+                continue
+
+            if seen_index.is_new:
+                if not bootstrap:
+                    raise excepts.MissingSeenIndex('The index of seen files %s is missing, but '
+                        'there are files at %s. Set monitor.bootstrap_seen_index to record the '
+                        'existing files as seen.' % (seen_index.path, ', '.join(watch_paths)))
+                bootstrapped.append((key, filepath))
+            elif self.sniff(filepath):
+                # blocks while the pool is busy, since no events are
+                # being dispatched yet.
+                self.pool.add_job(filepath)
+                self.stats['admitted'] += 1
+                total += 1
+            else:
+                rejected.append((key, filepath))
+
+        if rejected:
+            seen_index.add_many(rejected)
+
+        if bootstrapped:
+            seen_index.add_many(bootstrapped)
+            logger.warning('Bootstrapped the index of seen files with %s existing files. '
+                'They were not processed.' % len(bootstrapped))
+
+        logger.info('Catch-up scan finished. %s files were added to the checkin processing pool.' % total)
+
+    def on_loop(self, notifier):
+        """
+        Callback for `pyinotify.Notifier.loop`, run after each iteration.
+        """
+        self.flush_deferred()
+        self.log_stats()
 
 
 if __name__ == '__main__':
@@ -177,11 +712,14 @@ if __name__ == '__main__':
     config = utils.balaio_config_from_env()
     utils.setup_logging(config)
     models.Session.configure(bind=models.create_engine_from_config(config))
+    wakeup.setup(config)
 
     # Setting up PyInotify event watcher.
     wm = pyinotify.WatchManager()
     handler = EventHandler(config=config)
-    notifier = pyinotify.Notifier(wm, handler)
+    # the timeout (in ms) grants the deferred files are admitted
+    # even when no new events arrive.
+    notifier = pyinotify.Notifier(wm, handler, timeout=1000)
 
     wm.add_watch(config.get('monitor', 'watch_path').split(','),
                  mask,
@@ -190,5 +728,20 @@ if __name__ == '__main__':
 
     logger.info('Watching %s.' % config.get('monitor', 'watch_path'))
 
-    notifier.loop()
+    # Jobs that were queued or being processed when the monitor went down.
+    handler.pool.resume()
+
+    # Packages deposited while the monitor was down. The scan is run after
+    # the watches are set, so no file is missed in between.
+    if config.getboolean('monitor', 'catch_up'):
+        handler.catch_up(config.get('monitor', 'watch_path').split(','),
+                         recursive=config.getboolean('monitor', 'recursive'),
+                         bootstrap=config.getboolean('monitor', 'bootstrap_seen_index'))
+
+    # SIGTERM, e.g. sent by circus, stops the loop as SIGINT does.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    notifier.loop(callback=handler.on_loop)
+
+    logger.info('Shutting down.')
+    handler.pool.shutdown(drain=config.getboolean('monitor', 'drain_on_shutdown'))
 
@@ -5,7 +5,7 @@ import datetime
 from StringIO import StringIO
 from xml.etree.ElementTree import ElementTree
 
-from balaio.lib import utils, package
+from balaio.lib import utils, package, xmlindex
 
 
 HERE = os.path.dirname(os.path.abspath(__file__))
@@ -77,12 +77,53 @@ class NotifierStub(object):
         pass
 
 
+class WorkerPoolStub(object):
+    """
+    `is_full` must be patched to simulate a busy pool.
+    """
+    def __init__(self, *args, **kwargs):
+        self.jobs = []
+        self.is_full = False
+        self.seen_index = SeenFileIndexStub()
+
+    def add_job(self, filepath, block=True, timeout=None):
+        if self.is_full:
+            return False
+
+        self.jobs.append(filepath)
+        return True
+
+    def queue_stats(self):
+        return {}
+
+
+class SeenFileIndexStub(object):
+    def __init__(self, *args, **kwargs):
+        self.path = '/tmp/balaio_seen.db'
+        self.is_new = False
+        self._seen = {}
+
+    @staticmethod
+    def key(filepath):
+        return filepath
+
+    def __contains__(self, key):
+        return key in self._seen
+
+    def add(self, key, filepath):
+        self._seen[key] = filepath
+
+    def add_many(self, items):
+        self._seen.update(items)
+
+
 class PackageAnalyzerStub(object):
     def __init__(self, *args, **kwargs):
         """
-        `_xml_string` needs to be patched.
+        `_xml_string` needs to be patched, an empty article
+        is used otherwise.
         """
-        self._xml_string = None
+        self._xml_string = '<article/>'
         self.checksum = '5a74db5db860f2f8e3c6a5c64acdbf04'
         self._filename = '/tmp/bla.zip'
         self.meta = {
@@ -98,6 +139,10 @@ class PackageAnalyzerStub(object):
         etree = ElementTree()
         return etree.parse(StringIO(self._xml_string))
 
+    @property
+    def xml_index(self):
+        return xmlindex.ElementIndex(self.xml)
+
     def lock_package(self):
         return None
 
@@ -107,6 +152,9 @@ class PackageAnalyzerStub(object):
     def is_valid_schema(self):
         return True
 
+    def validate_schema(self):
+        return (self.is_valid_schema(), [])
+
     def is_valid_meta(self):
         return True
 
@@ -194,6 +242,7 @@ class AttemptStub(object):
         self.proceed_to_checkout = True,
         self.checkout_started_at = '2011-09-01 14:11:04.129956',
         self.queued_checkout = True,
+        self.validation_failures = 0
         self.articlepkg = ArticlePkgStub()
 
     def to_dict(self):
@@ -254,18 +303,54 @@ default_config = """
 db_dsn=
 socket=balaio.sock
 working_dir=/tmp/balaio_wd
+staging=reflink,copy
 log_level=DEBUG
 debug_sql=False
 
 [monitor]
 watch_path=/vagrant/watch
 recursive=True
+executor=thread
+workers=1
+queue_size=100
+scheduling=fair
+age_boost=600
+admission_timeout=0.5
+debounce=2
+catch_up=True
+seen_index=/tmp/balaio_seen.db
+job_journal=/tmp/balaio_jobs.db
+bootstrap_seen_index=False
+drain_on_shutdown=False
+group_commit=False
+group_commit_size=50
+group_commit_latency=0.05
+report_fsync=False
+report_max_open=64
+
+[validator]
+wakeup=auto
+wakeup_socket=/tmp/balaio_validator.sock
+poll_min=1
+poll_max=60
+claim_size=10
+claim_lease=600
+max_failures=3
+
+[dispatcher]
+batch_size=50
+max_tries=10
+backoff=30
+max_backoff=3600
+poll_min=1
+poll_max=10
 
 [manager]
 api_key=
 api_username=
 api_url=http://homolog.manager.scielo.org/api/
 notifications=False
+batch_notices=True
 
 [http_server]
 ip=0.0.0.0
@@ -373,6 +458,8 @@ class DummyRoutesMapper:
 class SessionStub(object):
     def __init__(self):
         self._items = []
+        self.flushes = 0
+        self.closed = False
 
     def __contains__(self, item):
         return item in self._items
@@ -380,6 +467,12 @@ class SessionStub(object):
     def add(self, item):
         self._items.append(item)
 
+    def flush(self):
+        self.flushes += 1
+
+    def close(self):
+        self.closed = True
+
 
 class SafePackageStub(object):
     def __init__(self, package, working_dir):
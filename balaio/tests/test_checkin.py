@@ -6,7 +6,7 @@ from tempfile import NamedTemporaryFile
 import unittest
 import transaction
 
-from balaio.lib import checkin, models, excepts, package
+from balaio.lib import checkin, models, excepts, package, committer, schemas
 from .utils import db_bootstrap, DB_READY
 from . import doubles
 
@@ -60,6 +60,32 @@ class CheckinTests(unittest.TestCase):
         self.assertRaises(excepts.DuplicatedPackage,
             lambda: checkin.get_attempt(safe_package))
 
+    def test_get_attempt_duplicated_package_is_not_validated(self):
+        safe_package = doubles.SafePackageStub(SAMPLE_PACKAGE, '/tmp/')
+        checkin.get_attempt(safe_package)
+
+        class UnreachableAnalyzerStub(doubles.PackageAnalyzerStub):
+            def validate_schema(self):
+                raise AssertionError('the package should not be validated')
+
+        class DuplicatedSafePackageStub(doubles.SafePackageStub):
+            analyzer = UnreachableAnalyzerStub()
+
+        duplicated_package = DuplicatedSafePackageStub(SAMPLE_PACKAGE, '/tmp/')
+        self.assertRaises(excepts.DuplicatedPackage,
+            lambda: checkin.get_attempt(duplicated_package))
+
+    def test_get_attempt_with_group_commit(self):
+        group_committer = committer.GroupCommitter()
+        safe_package = doubles.SafePackageStub(SAMPLE_PACKAGE, '/tmp/')
+        try:
+            attempt = checkin.get_attempt(safe_package, committer=group_committer)
+        finally:
+            group_committer.close()
+
+        self.assertIsInstance(attempt, models.Attempt)
+        self.assertTrue(models.Attempt.checksum_exists(attempt.package_checksum, self.session))
+
     def test_get_attempt_article_title_is_already_registered(self):
         """
         There are more than one article registered with same article title
@@ -91,3 +117,18 @@ class CheckinTests(unittest.TestCase):
         safe_package = package.SafePackage(pkg.name, '/tmp/')
         self.assertRaises(excepts.InvalidXML, lambda: checkin.get_attempt(safe_package))
 
+    def test_get_attempt_unknown_schema(self):
+        class SchemaCacheStub(object):
+            def validate(self, xml):
+                raise schemas.UnknownSchema('Unsupported DOCTYPE public id: -//FOO//EN')
+
+        pkg = self._make_test_archive([('texto.xml', b'<root/>')])
+        safe_package = package.SafePackage(pkg.name, '/tmp/')
+
+        cache = schemas.cache
+        schemas.cache = SchemaCacheStub()
+        try:
+            self.assertRaises(excepts.InvalidXML, lambda: checkin.get_attempt(safe_package))
+        finally:
+            schemas.cache = cache
+
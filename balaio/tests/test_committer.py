@@ -0,0 +1,101 @@
+#coding: utf-8
+import threading
+import unittest
+
+from balaio.lib import committer
+from . import doubles
+
+
+class GroupCommitterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.sessions = []
+        def Session():
+            session = doubles.SessionStub()
+            self.sessions.append(session)
+            return session
+
+        self.committer = committer.GroupCommitter(max_batch=10, max_latency=0.2, Session=Session)
+
+    def tearDown(self):
+        self.committer.close()
+
+    def test_work_result_is_returned(self):
+        self.assertEqual(self.committer.submit(lambda session: 'foo'), 'foo')
+
+    def test_work_receives_a_session(self):
+        session = self.committer.submit(lambda session: session)
+
+        self.assertIsInstance(session, doubles.SessionStub)
+        self.assertTrue(session.closed)
+
+    def test_work_errors_are_raised(self):
+        def work(session):
+            raise ValueError('foo')
+
+        self.assertRaises(ValueError, lambda: self.committer.submit(work))
+
+    def test_concurrent_units_are_committed_together(self):
+        results = {}
+        def worker(i):
+            results[i] = self.committer.submit(lambda session: i)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, dict((i, i) for i in range(5)))
+        self.assertEqual(self.committer.units, 5)
+        self.assertTrue(self.committer.batches < 5)
+
+    def test_failing_units_do_not_fail_the_batch(self):
+        results = {}
+        def work(i, session):
+            if i == 2:
+                raise ValueError('duplicated')
+            return i
+
+        def worker(i):
+            try:
+                results[i] = self.committer.submit(lambda session: work(i, session))
+            except ValueError as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsInstance(results.pop(2), ValueError)
+        self.assertEqual(results, {0: 0, 1: 1, 3: 3})
+
+    def test_units_are_flushed_one_by_one(self):
+        def worker():
+            self.committer.submit(lambda session: None)
+
+        threads = [threading.Thread(target=worker) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(session.flushes for session in self.sessions), 3)
+
+    def test_batch_size_is_bounded(self):
+        self.committer.close()
+        self.committer = committer.GroupCommitter(max_batch=1, max_latency=0.2,
+            Session=doubles.SessionStub)
+
+        def worker():
+            self.committer.submit(lambda session: None)
+
+        threads = [threading.Thread(target=worker) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.committer.batches, 3)
@@ -0,0 +1,112 @@
+#coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from balaio.lib import fsindex
+
+
+class SeenFileIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self):
+        return fsindex.SeenFileIndex(os.path.join(self.tmpdir, 'seen.db'))
+
+    def _make_file(self, name, data='foo'):
+        filepath = os.path.join(self.tmpdir, name)
+        with open(filepath, 'wb') as fp:
+            fp.write(data)
+
+        return filepath
+
+    def test_brand_new_index(self):
+        self.assertTrue(self._makeOne().is_new)
+
+    def test_existing_index(self):
+        index = self._makeOne()
+        index.add(index.key(self._make_file('foo.zip')), 'foo.zip')
+        self.assertFalse(self._makeOne().is_new)
+
+    def test_existing_empty_index(self):
+        self._makeOne()
+        self.assertTrue(self._makeOne().is_new)
+
+    def test_key_of_missing_file(self):
+        self.assertIsNone(fsindex.SeenFileIndex.key('/tmp/inexistent/foo.zip'))
+
+    def test_added_keys_are_seen(self):
+        index = self._makeOne()
+        filepath = self._make_file('foo.zip')
+        key = index.key(filepath)
+
+        self.assertFalse(key in index)
+        index.add(key, filepath)
+        self.assertTrue(key in index)
+
+    def test_index_is_persistent(self):
+        filepath = self._make_file('foo.zip')
+        key = fsindex.SeenFileIndex.key(filepath)
+        self._makeOne().add(key, filepath)
+
+        self.assertTrue(key in self._makeOne())
+
+    def test_modified_files_are_not_seen(self):
+        index = self._makeOne()
+        filepath = self._make_file('foo.zip')
+        index.add(index.key(filepath), filepath)
+
+        with open(filepath, 'ab') as fp:
+            fp.write('bar')
+
+        self.assertFalse(index.key(filepath) in index)
+
+    def test_non_ascii_filepaths(self):
+        index = self._makeOne()
+        filepath = self._make_file('açaí.zip')
+        key = index.key(filepath)
+        index.add(key, filepath)
+
+        self.assertTrue(key in index)
+
+
+class JobJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.tmpdir, 'jobs.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_added_jobs_are_pending(self):
+        journal = fsindex.JobJournal(self.journal_path)
+        journal.add('/tmp/foo.zip')
+        journal.add('/tmp/bar.zip')
+
+        self.assertEqual(journal.pending(), ['/tmp/foo.zip', '/tmp/bar.zip'])
+
+    def test_removed_jobs_are_not_pending(self):
+        journal = fsindex.JobJournal(self.journal_path)
+        journal.add('/tmp/foo.zip')
+        journal.remove('/tmp/foo.zip')
+
+        self.assertEqual(journal.pending(), [])
+
+    def test_jobs_added_twice_keep_their_order(self):
+        journal = fsindex.JobJournal(self.journal_path)
+        journal.add('/tmp/foo.zip')
+        journal.add('/tmp/bar.zip')
+        journal.add('/tmp/foo.zip')
+
+        self.assertEqual(journal.pending(), ['/tmp/foo.zip', '/tmp/bar.zip'])
+
+    def test_jobs_are_persisted(self):
+        fsindex.JobJournal(self.journal_path).add('/tmp/foo.zip')
+
+        self.assertEqual(fsindex.JobJournal(self.journal_path).pending(), ['/tmp/foo.zip'])
@@ -14,6 +14,11 @@ from balaio.lib.models import (
     Attempt,
     ArticlePkg,
     Session,
+    Base,
+    make_identity_key,
+    make_aid,
+    scramble_aid_counter,
+    AidAllocator,
 )
 from . import doubles, modelfactories
 from .utils import db_bootstrap, DB_READY
@@ -127,6 +132,26 @@ class CheckpointTests(unittest.TestCase):
         chk_point.end()
         self.assertRaises(RuntimeError, lambda: chk_point.tell('Foo', Status.ok, label='zip'))
 
+    def test_deferred_messages_are_not_stored(self):
+        chk_point = Checkpoint(Point.checkin)
+        chk_point.start()
+        chk_point.tell('Foo', Status.ok, deferred=True)
+
+        self.assertEqual(len(chk_point.messages), 0)
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_deferred_messages_are_written_at_once(self):
+        chk_point = modelfactories.CheckpointFactory(point=Point.validation)
+        session = modelfactories.CheckpointFactory.FACTORY_SESSION()
+        chk_point.start()
+        chk_point.tell('Foo', Status.ok, label='zip', deferred=True)
+        chk_point.tell('Bar', Status.error, deferred=True)
+
+        chk_point.write_deferred_notices(session)
+
+        self.assertEqual([(n.message, n.status) for n in chk_point.messages],
+                         [('Foo', Status.ok), ('Bar', Status.error)])
+
 
 class NoticeTests(unittest.TestCase):
 
@@ -184,6 +209,38 @@ class AttemptTests(mocker.MockerTestCase):
         attempt = Attempt.get_from_package(pkg_analyzer)
         self.assertFalse(attempt.is_valid)
 
+    def test_checksum_exists(self):
+        mock_session = self.mocker.mock()
+
+        mock_session.query(Attempt.id)
+        self.mocker.result(mock_session)
+
+        mock_session.filter_by(package_checksum='5a74db5db860f2f8e3c6a5c64acdbf04')
+        self.mocker.result(mock_session)
+
+        mock_session.first()
+        self.mocker.result((1,))
+
+        self.mocker.replay()
+
+        self.assertTrue(Attempt.checksum_exists('5a74db5db860f2f8e3c6a5c64acdbf04', mock_session))
+
+    def test_checksum_does_not_exist(self):
+        mock_session = self.mocker.mock()
+
+        mock_session.query(Attempt.id)
+        self.mocker.result(mock_session)
+
+        mock_session.filter_by(package_checksum='5a74db5db860f2f8e3c6a5c64acdbf04')
+        self.mocker.result(mock_session)
+
+        mock_session.first()
+        self.mocker.result(None)
+
+        self.mocker.replay()
+
+        self.assertFalse(Attempt.checksum_exists('5a74db5db860f2f8e3c6a5c64acdbf04', mock_session))
+
     @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
     def test_xml_filename(self):
         attempt = modelfactories.AttemptFactory()
@@ -207,6 +264,27 @@ class AttemptTests(mocker.MockerTestCase):
 
         self.assertRaises(ValueError, lambda: attempt.xml_filename)
 
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_claimed_attempts_are_not_claimed_twice(self):
+        attempts = [modelfactories.AttemptFactory(proceed_to_validation=True) for _ in range(3)]
+        session = modelfactories.AttemptFactory.FACTORY_SESSION()
+
+        first = Attempt.claim_for_validation(session, limit=2)
+        second = Attempt.claim_for_validation(session, limit=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(first) & set(second))
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_expired_claims_are_claimed_again(self):
+        attempt = modelfactories.AttemptFactory(proceed_to_validation=True)
+        session = modelfactories.AttemptFactory.FACTORY_SESSION()
+
+        Attempt.claim_for_validation(session, lease=-1)
+
+        self.assertEqual(Attempt.claim_for_validation(session), [attempt])
+
     @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
     def test_expiration(self):
         attempt = modelfactories.AttemptFactory(filepath='/var/pack.zip')
@@ -254,6 +332,77 @@ class AttemptTests(mocker.MockerTestCase):
         self.assertFalse(attempt.is_expired)
 
 
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class ConcurrentClaimTests(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = db_bootstrap()
+        for _ in range(3):
+            modelfactories.AttemptFactory(proceed_to_validation=True)
+        transaction.commit()
+
+    def tearDown(self):
+        transaction.abort()
+        Base.metadata.drop_all(self.engine)
+
+    def test_locked_candidates_are_skipped(self):
+        first = Attempt.claim_for_validation(Session(), limit=2)
+        # a distinct session, so the claims run in concurrent transactions.
+        second = Attempt.claim_for_validation(Session(), limit=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(a.id for a in first) & set(a.id for a in second))
+
+
+class AidTests(unittest.TestCase):
+
+    def test_scrambling_is_a_bijection(self):
+        space = 28 ** 3
+        scrambled = set(scramble_aid_counter(n, length=3) for n in range(space))
+
+        self.assertEqual(scrambled, set(range(space)))
+
+    def test_aids_are_10_chars_long(self):
+        for counter in (0, 1, 28 ** 10 - 1):
+            self.assertEqual(len(make_aid(counter)), 10)
+
+    def test_consecutive_counters_are_not_alike(self):
+        self.assertNotEqual(make_aid(0)[:5], make_aid(1)[:5])
+
+
+class AidAllocatorTests(mocker.MockerTestCase):
+
+    def test_block_is_reserved_once(self):
+        mock_session = self.mocker.mock()
+
+        mock_session.scalar(mocker.ANY)
+        self.mocker.result(3)
+        self.mocker.count(1)
+
+        self.mocker.replay()
+
+        allocator = AidAllocator(block_size=10)
+        aids = [allocator.next(mock_session) for _ in range(10)]
+
+        self.assertEqual(aids, [make_aid(n) for n in range(30, 40)])
+
+    def test_new_block_is_reserved_when_exhausted(self):
+        mock_session = self.mocker.mock()
+
+        mock_session.scalar(mocker.ANY)
+        self.mocker.result(3)
+        mock_session.scalar(mocker.ANY)
+        self.mocker.result(7)
+
+        self.mocker.replay()
+
+        allocator = AidAllocator(block_size=2)
+        aids = [allocator.next(mock_session) for _ in range(3)]
+
+        self.assertEqual(aids, [make_aid(6), make_aid(7), make_aid(14)])
+
+
 class ArticlePkgTests(mocker.MockerTestCase):
 
     def test_get_or_create_from_package(self):
@@ -265,7 +414,7 @@ class ArticlePkgTests(mocker.MockerTestCase):
         mock_session.query(ArticlePkg)
         self.mocker.result(mock_session)
 
-        mock_session.filter_by(article_title='foo')
+        mock_session.filter_by(identity_key=make_identity_key(pkg_analyzer.meta))
         self.mocker.result(mock_session)
 
         mock_session.one()
@@ -277,6 +426,24 @@ class ArticlePkgTests(mocker.MockerTestCase):
 
         self.assertIsInstance(article_pkg, ArticlePkg)
 
+    def test_identity_key_is_normalized(self):
+        meta = {'article_title': u'Foo  Bar', 'journal_pissn': '1234-4321', 'issue_year': 2014}
+        other = {'article_title': ' foo bar ', 'journal_pissn': '1234-4321', 'issue_year': '2014'}
+
+        self.assertEqual(make_identity_key(meta), make_identity_key(other))
+
+    def test_identity_key_differs_by_issue(self):
+        meta = {'article_title': u'Foo', 'journal_pissn': '1234-4321', 'issue_number': '1'}
+        other = {'article_title': u'Foo', 'journal_pissn': '1234-4321', 'issue_number': '2'}
+
+        self.assertNotEqual(make_identity_key(meta), make_identity_key(other))
+
+    def test_identity_key_of_instances(self):
+        meta = {'article_title': u'Foo', 'journal_eissn': '1234-1234', 'issue_year': '2014'}
+        article_pkg = ArticlePkg(**meta)
+
+        self.assertEqual(article_pkg.make_identity_key(), make_identity_key(meta))
+
     def test_property_issue_label_when_exists_year_volume_number(self):
         """
         When exists ``year``, ``volume`` and ``number`` must return something
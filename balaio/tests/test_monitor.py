@@ -1,4 +1,10 @@
+import os
 import unittest
+import logging
+import shutil
+import tempfile
+import threading
+from StringIO import StringIO
 
 import mocker
 from sqlalchemy.exc import OperationalError
@@ -6,6 +12,8 @@ from sqlalchemy.exc import OperationalError
 from balaio import monitor
 from balaio.lib import models
 from balaio.lib import excepts
+from balaio.lib import scheduler
+from balaio.lib import package
 from . import doubles
 from .utils import db_bootstrap, DB_READY
 
@@ -25,16 +33,43 @@ def setUpModule():
         pass
 
 
-class WorkerPoolTests(unittest.TestCase):
+class TempIndexesMixin(object):
+    """
+    Points the index of seen files and the journal of jobs of the
+    monitor to temporary files, removed after each test.
+    """
+    def setUp(self):
+        self.seen_index = self._mkstemp()
+        self.job_journal = self._mkstemp()
+
+    def tearDown(self):
+        for path in (self.seen_index, self.job_journal):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _mkstemp(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        return path
+
+    def _config(self, *args):
+        config = doubles.ConfigurationStub(*args)
+        config.set('monitor', 'seen_index', self.seen_index)
+        config.set('monitor', 'job_journal', self.job_journal)
+        return config
+
+
+class WorkerPoolTests(TempIndexesMixin, unittest.TestCase):
 
     def test_pool_size(self):
-        config = doubles.ConfigurationStub()
+        config = self._config()
         wpool = monitor.WorkerPool(config, size=1)
+        self.addCleanup(wpool.shutdown)
 
         self.assertEqual(len(wpool.running_workers), 1)
 
     def test_shutting_down_workers(self):
-        config = doubles.ConfigurationStub()
+        config = self._config()
         wpool = monitor.WorkerPool(config, size=2)
 
         for worker in wpool.running_workers:
@@ -46,6 +81,508 @@ class WorkerPoolTests(unittest.TestCase):
             self.assertFalse(worker.is_alive())
 
 
+    def test_group_committer_is_closed_on_shutdown(self):
+        config = self._config(
+            doubles.default_config.replace('group_commit=False', 'group_commit=True'))
+        wpool = monitor.WorkerPool(config, size=1)
+        committer = wpool.committer
+
+        wpool.shutdown()
+        self.assertFalse(committer._thread.is_alive())
+        self.assertIsNone(wpool.committer)
+
+    def test_unknown_executor(self):
+        config = self._config()
+        self.assertRaises(ValueError,
+            lambda: monitor.WorkerPool(config, size=1, executor='foo'))
+
+    def test_unknown_staging(self):
+        config = self._config(
+            doubles.default_config.replace('staging=reflink,copy', 'staging=reflink,cpy'))
+        self.assertRaises(ValueError,
+            lambda: monitor.WorkerPool(config, size=1))
+
+    def test_unknown_scheduling(self):
+        config = self._config(
+            doubles.default_config.replace('scheduling=fair', 'scheduling=foo'))
+        self.assertRaises(ValueError,
+            lambda: monitor.WorkerPool(config, size=1))
+
+    def test_fair_scheduling_by_default(self):
+        config = self._config()
+        wpool = monitor.WorkerPool(config, size=1, executor='process')
+        wpool.shutdown()
+
+        self.assertIsInstance(wpool.job_queue, scheduler.FairQueue)
+
+    def test_process_executor_pool_size(self):
+        config = self._config()
+        wpool = monitor.WorkerPool(config, size=2, executor='process')
+
+        self.assertEqual(len(wpool.running_workers), 2)
+        wpool.shutdown()
+
+    def test_shutting_down_process_workers(self):
+        config = self._config()
+        wpool = monitor.WorkerPool(config, size=2, executor='process')
+
+        wpool.shutdown()
+        import time; time.sleep(0.5)  # calm down...
+        for worker in wpool.running_workers:
+            self.assertFalse(worker.is_alive())
+
+
+def _child_acquires_logging_locks(handler):
+    """
+    Exits with an error if the logging locks can not be acquired by
+    a thread of the child process.
+    """
+    acquired = []
+
+    def acquire():
+        acquired.extend([logging._lock.acquire(False), handler.lock.acquire(False)])
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join()
+    os._exit(0 if all(acquired) else 1)
+
+
+class StartProcessTests(unittest.TestCase):
+
+    def test_logging_locks_are_usable_in_the_child(self):
+        handler = logging.StreamHandler(StringIO())
+        logging.getLogger('balaio.tests').addHandler(handler)
+        self.addCleanup(logging.getLogger('balaio.tests').removeHandler, handler)
+
+        process = monitor._start_process(_child_acquires_logging_locks, (handler,))
+        process.join()
+
+        self.assertEqual(process.exitcode, 0)
+
+    def test_logging_locks_are_released_in_the_parent(self):
+        handler = logging.StreamHandler(StringIO())
+        logging.getLogger('balaio.tests').addHandler(handler)
+        self.addCleanup(logging.getLogger('balaio.tests').removeHandler, handler)
+
+        process = monitor._start_process(os._exit, (0,))
+        process.join()
+
+        acquired = []
+
+        def acquire():
+            for lock in (logging._lock, handler.lock):
+                acquired.append(lock.acquire(False))
+                if acquired[-1]:
+                    lock.release()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+        self.assertEqual(acquired, [True, True])
+
+
+class ProcessExecutorTests(unittest.TestCase):
+
+    def _makeOne(self):
+        config = doubles.ConfigurationStub()
+        # so the worker process can bootstrap.
+        config.set('app', 'db_dsn', 'sqlite://')
+        executor = monitor.ProcessExecutor(config)
+        self.addCleanup(executor.shutdown)
+        return executor
+
+    def _kill(self, executor):
+        executor.process.terminate()
+        executor.process.join()
+
+    def test_dead_workers_are_respawned_by_the_worker_thread(self):
+        executor = self._makeOne()
+        dead = executor.process
+        self._kill(executor)
+
+        self.assertRaises(excepts.CheckinJobFailed, executor.submit, '/tmp/foo.zip')
+        self.assertIsNot(executor.process, dead)
+        self.assertTrue(executor.process.is_alive())
+
+    def test_jobs_are_processed_after_a_respawn(self):
+        executor = self._makeOne()
+        self._kill(executor)
+        self.assertRaises(excepts.CheckinJobFailed, executor.submit, '/tmp/foo.zip')
+
+        self.assertEqual(executor.submit('/tmp/inexistent/bar.zip'), '/tmp/inexistent/bar.zip')
+
+
+class WorkerPoolJobsTests(TempIndexesMixin, mocker.MockerTestCase):
+
+    def setUp(self):
+        super(WorkerPoolJobsTests, self).setUp()
+        self.package = tempfile.NamedTemporaryFile()
+
+    def _makeOne(self):
+        mock_factory = self.mocker.replace('balaio.lib.notifier.checkin_notifier_factory')
+        mock_factory(mocker.ANY)
+        self.mocker.result(doubles.NotifierStub)
+        self.mocker.replay()
+
+        return monitor.WorkerPool(self._config(), size=1)
+
+    def test_files_in_flight_are_not_added_twice(self):
+        wpool = self._makeOne()
+        wpool.shutdown()
+        import time; time.sleep(0.2)  # calm down...
+
+        self.assertTrue(wpool.add_job(self.package.name))
+        self.assertTrue(wpool.add_job(self.package.name))
+        self.assertEqual(wpool.job_queue.qsize(), 1)
+
+    def test_processed_files_are_no_longer_in_flight(self):
+        wpool = self._makeOne()
+
+        wpool.add_job(self.package.name)
+        wpool.shutdown()
+        for worker in wpool.running_workers:
+            worker.join()
+
+        self.assertEqual(wpool.in_flight, set())
+        self.assertTrue(wpool.seen_index.key(self.package.name) in wpool.seen_index)
+
+    def test_missing_files_are_ignored(self):
+        wpool = self._makeOne()
+        wpool.shutdown()
+        import time; time.sleep(0.2)  # calm down...
+
+        self.assertTrue(wpool.add_job('/tmp/inexistent/foo.zip'))
+        self.assertEqual(wpool.job_queue.qsize(), 0)
+
+    def test_queued_files_are_journaled(self):
+        wpool = self._makeOne()
+        wpool.shutdown()
+        import time; time.sleep(0.2)  # calm down...
+
+        wpool.add_job(self.package.name)
+        self.assertEqual(wpool.journal.pending(), [self.package.name])
+
+    def test_processed_files_leave_the_journal(self):
+        wpool = self._makeOne()
+
+        wpool.add_job(self.package.name)
+        wpool.shutdown()
+        for worker in wpool.running_workers:
+            worker.join()
+
+        self.assertEqual(wpool.journal.pending(), [])
+
+    def test_journaled_files_are_resumed(self):
+        wpool = self._makeOne()
+        wpool.journal.add(self.package.name)
+
+        wpool.resume()
+        wpool.shutdown()
+        for worker in wpool.running_workers:
+            worker.join()
+
+        self.assertEqual(wpool.journal.pending(), [])
+        self.assertTrue(wpool.seen_index.key(self.package.name) in wpool.seen_index)
+
+    def test_files_are_kept_at_the_journal_when_the_queue_is_full(self):
+        wpool = self._makeOne()
+        wpool.shutdown()
+        other = tempfile.NamedTemporaryFile()
+
+        wpool.job_queue.maxsize = 1
+        try:
+            self.assertTrue(wpool.add_job(self.package.name))
+            self.assertFalse(wpool.add_job(other.name, block=False))
+        finally:
+            # so the shutdown sentinels still fit.
+            wpool.job_queue.maxsize = 0
+
+        self.assertEqual(wpool.journal.pending(), [self.package.name, other.name])
+        self.assertEqual(len(wpool.in_flight), 1)
+
+    def test_failed_jobs_are_kept_at_the_journal(self):
+        class ExecutorStub(object):
+            def submit(self, filepath):
+                raise excepts.CheckinJobFailed('the worker process died')
+            def shutdown(self):
+                pass
+
+        wpool = self._makeOne()
+        wpool.shutdown()
+
+        wpool.add_job(self.package.name)
+        wpool.shutdown()
+        wpool._handle_events(wpool.job_queue, ExecutorStub())
+
+        self.assertEqual(wpool.journal.pending(), [self.package.name])
+        self.assertFalse(wpool.seen_index.key(self.package.name) in wpool.seen_index)
+        self.assertEqual(wpool.in_flight, set())
+
+    def test_queued_files_are_kept_when_not_draining(self):
+        class ExecutorStub(object):
+            def submit(self, filepath):
+                raise AssertionError('the job should not be processed')
+            def shutdown(self):
+                pass
+
+        wpool = self._makeOne()
+        wpool.shutdown()
+        for worker in wpool.running_workers:
+            worker.join()
+
+        wpool.add_job(self.package.name)
+        wpool.shutdown(drain=False)
+        wpool._handle_events(wpool.job_queue, ExecutorStub())
+
+        self.assertEqual(wpool.journal.pending(), [self.package.name])
+        self.assertEqual(wpool.in_flight, set())
+
+
+class EventHandlerTests(mocker.MockerTestCase):
+
+    def _makeOne(self, pool):
+        mock_pool = self.mocker.replace('balaio.monitor.WorkerPool')
+        mock_pool(mocker.ANY)
+        self.mocker.result(pool)
+        self.mocker.replay()
+
+        return monitor.EventHandler(config=doubles.ConfigurationStub())
+
+    def test_admitted_files_are_added_to_the_pool(self):
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+
+        handler.admit('/tmp/watch/foo.zip')
+
+        self.assertEqual(pool.jobs, ['/tmp/watch/foo.zip'])
+        self.assertEqual(handler.stats['admitted'], 1)
+
+    def test_files_are_deferred_while_the_pool_is_full(self):
+        pool = doubles.WorkerPoolStub()
+        pool.is_full = True
+        handler = self._makeOne(pool)
+
+        handler.admit('/tmp/watch/foo.zip')
+
+        self.assertEqual(pool.jobs, [])
+        self.assertEqual(list(handler.deferred), ['/tmp/watch/foo.zip'])
+        self.assertEqual(handler.stats['deferred'], 1)
+
+    def test_deferred_files_are_admitted_in_order(self):
+        pool = doubles.WorkerPoolStub()
+        pool.is_full = True
+        handler = self._makeOne(pool)
+
+        handler.admit('/tmp/watch/foo.zip')
+        pool.is_full = False
+        handler.admit('/tmp/watch/bar.zip')
+
+        self.assertEqual(pool.jobs, ['/tmp/watch/foo.zip', '/tmp/watch/bar.zip'])
+        self.assertEqual(len(handler.deferred), 0)
+
+    def test_deferred_files_are_never_dropped(self):
+        pool = doubles.WorkerPoolStub()
+        pool.is_full = True
+        handler = self._makeOne(pool)
+        queue_size = doubles.ConfigurationStub().getint('monitor', 'queue_size')
+        filepaths = ['/tmp/watch/%s.zip' % i for i in range(2 * queue_size + 50)]
+
+        for filepath in filepaths:
+            handler.admit(filepath)
+        pool.is_full = False
+        handler.on_loop(None)
+
+        self.assertEqual(pool.jobs, filepaths)
+        self.assertEqual(handler.stats['deferred'], len(filepaths))
+
+    def test_deferred_files_are_admitted_round_robin_among_directories(self):
+        pool = doubles.WorkerPoolStub()
+        pool.is_full = True
+        handler = self._makeOne(pool)
+
+        for i in range(3):
+            handler.admit('/tmp/watch/foo/%s.zip' % i)
+        handler.admit('/tmp/watch/bar/0.zip')
+        pool.is_full = False
+        handler.on_loop(None)
+
+        self.assertEqual(pool.jobs, ['/tmp/watch/foo/0.zip', '/tmp/watch/bar/0.zip',
+                                     '/tmp/watch/foo/1.zip', '/tmp/watch/foo/2.zip'])
+
+    def test_duplicated_events_are_coalesced(self):
+        package = tempfile.NamedTemporaryFile()
+        package.write('PK\x03\x04foo')
+        package.flush()
+
+        event = doubles.ObjectStub()
+        event.pathname = package.name
+
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+
+        handler.process_IN_CLOSE_WRITE(event)
+        handler.process_IN_MOVED_TO(event)
+
+        self.assertEqual(pool.jobs, [package.name])
+        self.assertEqual(handler.stats['coalesced'], 1)
+
+    def test_events_after_the_debounce_window_are_handled(self):
+        package = tempfile.NamedTemporaryFile()
+        package.write('PK\x03\x04foo')
+        package.flush()
+
+        event = doubles.ObjectStub()
+        event.pathname = package.name
+
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+        handler.debounce = 0
+
+        handler.process_IN_CLOSE_WRITE(event)
+        import time; time.sleep(0.01)
+        handler.process_IN_CLOSE_WRITE(event)
+
+        self.assertEqual(pool.jobs, [package.name, package.name])
+
+    def test_deferred_files_are_not_deferred_twice(self):
+        pool = doubles.WorkerPoolStub()
+        pool.is_full = True
+        handler = self._makeOne(pool)
+
+        handler.admit('/tmp/watch/foo.zip')
+        handler.admit('/tmp/watch/foo.zip')
+
+        self.assertEqual(list(handler.deferred), ['/tmp/watch/foo.zip'])
+
+    def test_on_loop_flushes_deferred_files(self):
+        pool = doubles.WorkerPoolStub()
+        pool.is_full = True
+        handler = self._makeOne(pool)
+
+        handler.admit('/tmp/watch/foo.zip')
+        pool.is_full = False
+        handler.on_loop(None)
+
+        self.assertEqual(pool.jobs, ['/tmp/watch/foo.zip'])
+
+
+class CatchUpTests(mocker.MockerTestCase):
+
+    def setUp(self):
+        self.watch_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.watch_path)
+
+    def _make_file(self, name, data='PK\x03\x04foo'):
+        filepath = os.path.join(self.watch_path, name)
+        with open(filepath, 'wb') as fp:
+            fp.write(data)
+
+        return filepath
+
+    def _makeOne(self, pool):
+        mock_pool = self.mocker.replace('balaio.monitor.WorkerPool')
+        mock_pool(mocker.ANY)
+        self.mocker.result(pool)
+        self.mocker.replay()
+
+        return monitor.EventHandler(config=doubles.ConfigurationStub())
+
+    def test_unseen_files_are_added_to_the_pool(self):
+        filepath = self._make_file('foo.zip')
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path])
+
+        self.assertEqual(pool.jobs, [filepath])
+
+    def test_seen_files_are_skipped(self):
+        filepath = self._make_file('foo.zip')
+        pool = doubles.WorkerPoolStub()
+        pool.seen_index.add(filepath, filepath)
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path])
+
+        self.assertEqual(pool.jobs, [])
+
+    def test_special_and_non_zip_files_are_skipped(self):
+        self._make_file('_failed_foo.zip')
+        self._make_file('report.log', data='bla bla')
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path])
+
+        self.assertEqual(pool.jobs, [])
+
+    def test_rejected_files_are_recorded_as_seen(self):
+        filepath = self._make_file('foo.txt', data='bla bla')
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path])
+
+        self.assertTrue(filepath in pool.seen_index)
+        self.assertEqual(handler.stats['rejected'], 1)
+
+        handler.catch_up([self.watch_path])
+        self.assertEqual(handler.stats['rejected'], 1)
+
+    def test_report_files_are_not_read(self):
+        self._make_file(package.REPORT_FILENAME, data='bla bla')
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path])
+
+        self.assertEqual(handler.stats['rejected'], 0)
+
+    def test_new_index_is_bootstrapped(self):
+        filepath = self._make_file('foo.zip')
+        pool = doubles.WorkerPoolStub()
+        pool.seen_index.is_new = True
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path], bootstrap=True)
+
+        self.assertEqual(pool.jobs, [])
+        self.assertTrue(filepath in pool.seen_index)
+
+    def test_missing_index_fails(self):
+        self._make_file('foo.zip')
+        pool = doubles.WorkerPoolStub()
+        pool.seen_index.is_new = True
+        handler = self._makeOne(pool)
+
+        self.assertRaises(excepts.MissingSeenIndex,
+            lambda: handler.catch_up([self.watch_path]))
+        self.assertEqual(pool.jobs, [])
+
+    def test_missing_index_without_files(self):
+        pool = doubles.WorkerPoolStub()
+        pool.seen_index.is_new = True
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path])
+        self.assertEqual(pool.jobs, [])
+
+    def test_subdirectories(self):
+        os.mkdir(os.path.join(self.watch_path, 'bar'))
+        filepath = self._make_file(os.path.join('bar', 'foo.zip'))
+        pool = doubles.WorkerPoolStub()
+        handler = self._makeOne(pool)
+
+        handler.catch_up([self.watch_path], recursive=False)
+        self.assertEqual(pool.jobs, [])
+
+        handler.catch_up([self.watch_path], recursive=True)
+        self.assertEqual(pool.jobs, [filepath])
+
+
 class ProcessPackageFunctionTests(mocker.MockerTestCase):
 
     def tearDown(self):
@@ -62,7 +599,7 @@ class ProcessPackageFunctionTests(mocker.MockerTestCase):
         self.mocker.result(pack_reporter)
 
         checkin_mod = self.mocker.replace('balaio.lib.checkin')
-        checkin_mod.get_attempt(mocker.ANY)
+        checkin_mod.get_attempt(mocker.ANY, committer=None)
         self.mocker.throw(excepts.InvalidXML(['Some validation error.']))
 
         patched_safepack = self.mocker.patch(safepack)
@@ -84,7 +621,7 @@ class ProcessPackageFunctionTests(mocker.MockerTestCase):
         self.mocker.result(pack_reporter)
 
         checkin_mod = self.mocker.replace('balaio.lib.checkin')
-        checkin_mod.get_attempt(mocker.ANY)
+        checkin_mod.get_attempt(mocker.ANY, committer=None)
         self.mocker.throw(excepts.DuplicatedPackage)
 
         patched_safepack = self.mocker.patch(safepack)
@@ -106,7 +643,7 @@ class ProcessPackageFunctionTests(mocker.MockerTestCase):
         self.mocker.result(pack_reporter)
 
         checkin_mod = self.mocker.replace('balaio.lib.checkin')
-        checkin_mod.get_attempt(mocker.ANY)
+        checkin_mod.get_attempt(mocker.ANY, committer=None)
         self.mocker.throw(RuntimeError)
 
         patched_safepack = self.mocker.patch(safepack)
@@ -128,7 +665,7 @@ class ProcessPackageFunctionTests(mocker.MockerTestCase):
         self.mocker.result(pack_reporter)
 
         checkin_mod = self.mocker.replace('balaio.lib.checkin')
-        checkin_mod.get_attempt(mocker.ANY)
+        checkin_mod.get_attempt(mocker.ANY, committer=None)
         self.mocker.throw(excepts.MissingXML)
 
         patched_safepack = self.mocker.patch(safepack)
@@ -29,10 +29,13 @@ class NotifierTests(mocker.MockerTestCase):
 
     def _makeOne(self, **kwargs):
         checkpoint = kwargs.get('checkpoint', modelfactories.CheckpointFactory())
-        scieloapi = kwargs.get('scieloapi', doubles.ScieloAPIClientStub())
         db_session = kwargs.get('db_session', doubles.SessionStub())
 
-        return Notifier(checkpoint, scieloapi, db_session)
+        return Notifier(checkpoint, db_session)
+
+    def _outbox(self, notifier):
+        return [item for item in notifier.db_session._items
+                if isinstance(item, models.OutboxMessage)]
 
     @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
     def test_start_sends_notification_on_checkin_points(self):
@@ -79,14 +82,14 @@ class NotifierTests(mocker.MockerTestCase):
             'status': 'ok',
         }
 
-        mock_scieloapi = self.mocker.mock()
-        mock_scieloapi.notices.post(expected)
-        self.mocker.result(None)
-        self.mocker.replay()
-
-        notifier = self._makeOne(checkpoint=checkpoint, scieloapi=mock_scieloapi)
+        notifier = self._makeOne(checkpoint=checkpoint)
         self.assertIsNone(notifier._send_checkout_notification())
 
+        message, = self._outbox(notifier)
+        self.assertEqual(message.kind, models.OutboxMessage.NOTICE)
+        self.assertEqual(message.data, expected)
+        self.assertIs(message.attempt, checkpoint.attempt)
+
     @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
     def test_send_checkin_notification_payload(self):
         attempt = modelfactories.AttemptFactory()
@@ -105,36 +108,19 @@ class NotifierTests(mocker.MockerTestCase):
              'attempt_ref': str(checkpoint.attempt.id),
              'package_name': '0042-9686-bwho-91-08-545',
              'uploaded_at': str(checkpoint.attempt.started_at),
-             'article': '/api/v1/checkins_articles/1/',
         }
 
         mock_attempt = self.mocker.patch(attempt)
         mock_attempt.analyzer.get_ext('xml')
         self.mocker.result(['0042-9686-bwho-91-08-545/0042-9686-bwho-91-08-545.xml'])
-
-        mock_scieloapi = self.mocker.mock()
-        mock_scieloapi.checkins_articles.post(expected1)
-        self.mocker.result(1)  # resource id
-        mock_scieloapi.checkins.post(expected2)
-        self.mocker.result(2)  # resource id
         self.mocker.replay()
 
-        notifier = self._makeOne(checkpoint=checkpoint, scieloapi=mock_scieloapi)
+        notifier = self._makeOne(checkpoint=checkpoint)
         self.assertIsNone(notifier._send_checkin_notification())
 
-    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
-    def test_send_checkin_notification_handles_scieloapi_exc(self):
-        from scieloapi.exceptions import APIError
-
-        checkpoint = modelfactories.CheckpointFactory(point=models.Point.checkin)
-
-        mock_scieloapi = self.mocker.mock()
-        mock_scieloapi.checkins_articles.post(mocker.ANY)
-        self.mocker.throw(APIError)
-        self.mocker.replay()
-
-        notifier = self._makeOne(checkpoint=checkpoint, scieloapi=mock_scieloapi)
-        self.assertIsNone(notifier._send_checkin_notification())
+        message, = self._outbox(notifier)
+        self.assertEqual(message.kind, models.OutboxMessage.CHECKIN)
+        self.assertEqual(message.data, {'article': expected1, 'checkin': expected2})
 
     @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
     def test_send_notice_notification_on_checkin_points(self):
@@ -170,28 +156,49 @@ class NotifierTests(mocker.MockerTestCase):
             'status': 'ok',
         }
 
-        mock_scieloapi = self.mocker.mock()
-        mock_scieloapi.notices.post(expected)
-        self.mocker.result(None)
-        self.mocker.replay()
-
-        notifier = self._makeOne(checkpoint=checkpoint, scieloapi=mock_scieloapi)
+        notifier = self._makeOne(checkpoint=checkpoint)
         self.assertIsNone(notifier._send_notice_notification(
             'foo', models.Status.ok, label='bar'))
 
-    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
-    def test_send_notice_notification_handles_scieloapi_exc(self):
-        from scieloapi.exceptions import APIError
+        message, = self._outbox(notifier)
+        self.assertEqual(message.data, expected)
 
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_nothing_is_written_to_outbox_when_disabled(self):
         checkpoint = modelfactories.CheckpointFactory(point=models.Point.validation)
-        checkpoint.attempt.checkin_uri = '/api/v1/checkins/1/'
+        notifier = Notifier(checkpoint, doubles.SessionStub(), manager_integration=False)
 
-        mock_scieloapi = self.mocker.mock()
-        mock_scieloapi.notices.post(mocker.ANY)
-        self.mocker.throw(APIError)
-        self.mocker.replay()
+        notifier._send_notice_notification('foo', models.Status.ok, label='bar')
 
-        notifier = self._makeOne(checkpoint=checkpoint, scieloapi=mock_scieloapi)
-        self.assertIsNone(notifier._send_notice_notification(
-            'foo', models.Status.ok, label='bar'))
+        self.assertEqual(self._outbox(notifier), [])
+
+
+class BatchNotifierTests(unittest.TestCase):
+
+    def _makeOne(self):
+        checkpoint = models.Checkpoint(models.Point.validation)
+        checkpoint.attempt = models.Attempt(package_checksum='5a74db5db860f2f8e3c6a5c64acdbf04')
+
+        return Notifier(checkpoint, doubles.SessionStub(), batch=True)
+
+    def _outbox(self, notifier):
+        return [item for item in notifier.db_session._items
+                if isinstance(item, models.OutboxMessage)]
+
+    def test_notices_are_buffered_until_end(self):
+        notifier = self._makeOne()
+        notifier.start()
+        notifier.tell('foo', models.Status.ok, label='bar')
+
+        self.assertEqual(self._outbox(notifier), [])
+
+    def test_notices_are_written_at_once(self):
+        notifier = self._makeOne()
+        notifier.start()
+        notifier.tell('foo', models.Status.ok, label='bar')
+        notifier.end()
 
+        message, = self._outbox(notifier)
+        self.assertEqual(message.kind, models.OutboxMessage.NOTICES)
+        self.assertEqual([notice['status'] for notice in message.data['notices']],
+                         ['SERV_BEGIN', 'ok', 'SERV_END'])
@@ -0,0 +1,202 @@
+#coding: utf-8
+import datetime
+import unittest
+
+import mocker
+from scieloapi.exceptions import APIError
+from sqlalchemy.exc import OperationalError
+
+from balaio.lib import outbox, models
+from . import doubles, modelfactories
+from .utils import db_bootstrap, DB_READY
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    try:
+        db_bootstrap()
+    except OperationalError:
+        # all db-bound testcases need to test for DB_READY before run.
+        pass
+
+
+class DispatcherTests(mocker.MockerTestCase):
+
+    def _makeOne(self, scieloapi, messages=(), **kwargs):
+        dispatcher = outbox.Dispatcher(scieloapi, Session=doubles.SessionStub, **kwargs)
+        dispatcher._pending = lambda session, now: list(messages)
+        return dispatcher
+
+    def _make_attempt(self, checkin_uri=None):
+        attempt = models.Attempt(package_checksum='5a74db5db860f2f8e3c6a5c64acdbf04')
+        attempt.checkin_uri = checkin_uri
+        return attempt
+
+    def _make_checkin(self, attempt):
+        return models.OutboxMessage(models.OutboxMessage.CHECKIN,
+            {'article': {'article_title': 'foo'}, 'checkin': {'attempt_ref': '1'}},
+            attempt=attempt)
+
+    def _make_notice(self, attempt):
+        return models.OutboxMessage(models.OutboxMessage.NOTICE,
+            {'checkin': None, 'message': 'foo'}, attempt=attempt)
+
+    def test_backoff_doubles_up_to_the_max(self):
+        dispatcher = outbox.Dispatcher(None, backoff=10, max_backoff=50)
+
+        self.assertEqual([dispatcher.backoff_for(n) for n in range(1, 5)], [10, 20, 40, 50])
+
+    def test_notice_is_bound_to_the_checkin(self):
+        attempt = self._make_attempt(checkin_uri='/api/v1/checkins/2/')
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi.notices.post({'checkin': '/api/v1/checkins/2/', 'message': 'foo'})
+        self.mocker.result(None)
+        self.mocker.replay()
+
+        self._makeOne(mock_scieloapi).deliver(self._make_notice(attempt))
+
+    def test_checkin_delivery(self):
+        attempt = self._make_attempt()
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi.checkins_articles.post({'article_title': 'foo'})
+        self.mocker.result(1)
+        mock_scieloapi.checkins.post({'attempt_ref': '1', 'article': '/api/v1/checkins_articles/1/'})
+        self.mocker.result(2)
+        self.mocker.replay()
+
+        self._makeOne(mock_scieloapi).deliver(self._make_checkin(attempt))
+
+        self.assertEqual(attempt.checkin_uri, '/api/v1/checkins/2/')
+
+    def test_article_is_not_created_twice(self):
+        attempt = self._make_attempt()
+        message = self._make_checkin(attempt)
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi.checkins_articles.post(mocker.ANY)
+        self.mocker.result(1)
+        self.mocker.count(1)
+        mock_scieloapi.checkins.post(mocker.ANY)
+        self.mocker.throw(APIError)
+        mock_scieloapi.checkins.post(mocker.ANY)
+        self.mocker.result(2)
+        self.mocker.replay()
+
+        dispatcher = self._makeOne(mock_scieloapi)
+        self.assertRaises(APIError, lambda: dispatcher.deliver(message))
+        dispatcher.deliver(message)
+
+        self.assertEqual(attempt.checkin_uri, '/api/v1/checkins/2/')
+
+    def test_batched_notices_are_resumed(self):
+        attempt = self._make_attempt(checkin_uri='/api/v1/checkins/2/')
+        message = models.OutboxMessage(models.OutboxMessage.NOTICES,
+            {'notices': [{'message': 'foo'}, {'message': 'bar'}]}, attempt=attempt)
+
+        mock_scieloapi = self.mocker.mock()
+        with self.mocker.order():
+            mock_scieloapi.notices.post({'message': 'foo', 'checkin': '/api/v1/checkins/2/'})
+            self.mocker.result(1)
+            mock_scieloapi.notices.post({'message': 'bar', 'checkin': '/api/v1/checkins/2/'})
+            self.mocker.throw(APIError)
+            mock_scieloapi.notices.post({'message': 'bar', 'checkin': '/api/v1/checkins/2/'})
+            self.mocker.result(2)
+        self.mocker.replay()
+
+        dispatcher = self._makeOne(mock_scieloapi)
+        self.assertRaises(APIError, lambda: dispatcher.deliver(message))
+        self.assertEqual(message.data['sent'], 1)
+
+        dispatcher.deliver(message)
+
+    def test_delivered_messages_are_marked(self):
+        message = self._make_notice(self._make_attempt())
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi.notices.post(mocker.ANY)
+        self.mocker.result(None)
+        self.mocker.replay()
+
+        self.assertEqual(self._makeOne(mock_scieloapi, [message]).run_once(), 1)
+        self.assertIsNotNone(message.delivered_at)
+
+    def test_failed_deliveries_are_retried_later(self):
+        message = self._make_notice(self._make_attempt())
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi.notices.post(mocker.ANY)
+        self.mocker.throw(APIError)
+        self.mocker.replay()
+
+        self._makeOne(mock_scieloapi, [message], backoff=30).run_once()
+
+        self.assertIsNone(message.delivered_at)
+        self.assertEqual(message.tries, 1)
+        self.assertTrue(message.next_try_at > datetime.datetime.now() + datetime.timedelta(seconds=20))
+
+    def test_messages_of_an_attempt_wait_for_failed_ones(self):
+        attempt = self._make_attempt()
+        attempt.id = 1
+        checkin = self._make_checkin(attempt)
+        notice = self._make_notice(attempt)
+        checkin.attempt_id = notice.attempt_id = 1
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi.checkins_articles.post(mocker.ANY)
+        self.mocker.throw(APIError)
+        self.mocker.replay()
+
+        self._makeOne(mock_scieloapi, [checkin, notice]).run_once()
+
+        self.assertIsNone(notice.delivered_at)
+        self.assertEqual(notice.tries, 0)
+
+    def test_backed_off_messages_are_not_counted(self):
+        message = self._make_notice(self._make_attempt())
+        message.next_try_at = datetime.datetime.now() + datetime.timedelta(seconds=30)
+
+        mock_scieloapi = self.mocker.mock()
+        self.mocker.replay()
+
+        self.assertEqual(self._makeOne(mock_scieloapi, [message]).run_once(), 0)
+        self.assertIsNone(message.delivered_at)
+
+
+class PendingMessagesTests(unittest.TestCase):
+
+    def _make_message(self, attempt=None, backed_off=False):
+        message = models.OutboxMessage(models.OutboxMessage.NOTICE, {'message': 'foo'}, attempt=attempt)
+        if backed_off:
+            message.tries = 1
+            message.next_try_at = datetime.datetime.now() + datetime.timedelta(hours=1)
+        return message
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_backed_off_messages_are_not_pending(self):
+        session = modelfactories.AttemptFactory.FACTORY_SESSION()
+        backed_off = [self._make_message(backed_off=True) for _ in range(50)]
+        due = [self._make_message() for _ in range(10)]
+        session.add_all(backed_off + due)
+        session.flush()
+
+        dispatcher = outbox.Dispatcher(None, batch_size=50)
+        self.assertEqual(dispatcher._pending(session, datetime.datetime.now()), due)
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_messages_after_a_backed_off_one_are_not_pending(self):
+        blocked_attempt = modelfactories.AttemptFactory()
+        attempt = modelfactories.AttemptFactory()
+        session = modelfactories.AttemptFactory.FACTORY_SESSION()
+        messages = [self._make_message(blocked_attempt, backed_off=True),
+                    self._make_message(blocked_attempt),
+                    self._make_message(attempt),
+                    self._make_message(attempt)]
+        session.add_all(messages)
+        session.flush()
+
+        dispatcher = outbox.Dispatcher(None)
+        self.assertEqual(dispatcher._pending(session, datetime.datetime.now()), messages[2:])
@@ -1,10 +1,14 @@
 #coding: utf-8
 import os
+import stat
 import zipfile
 from tempfile import NamedTemporaryFile
 
 import mocker
 import unittest
+import shutil
+import hashlib
+import tempfile
 
 from balaio.lib import package
 from . import doubles
@@ -274,14 +278,45 @@ class PackageAnalyzerTests(mocker.MockerTestCase):
 
         self.assertFalse(pkg.is_valid_schema())
 
+    def test_schema_is_validated_once(self):
+        data = [('bar.xml', b'<root><name>bar</name></root>')]
+        arch = self._make_test_archive(data)
+        pkg = self._makeOne(arch.name)
+
+        mock_cache = self.mocker.patch(package.schemas.cache)
+        mock_cache.validate(mocker.ANY)
+        self.mocker.result((False, ['some error']))
+        self.mocker.count(1)
+        self.mocker.replay()
+
+        self.assertFalse(pkg.is_valid_schema())
+        self.assertEqual(pkg.validate_schema(), (False, ['some error']))
+
+    def test_memoized_meta_is_not_shared(self):
+        data = [('bar.xml', b'<root><name>bar</name></root>')]
+        arch = self._make_test_archive(data)
+        pkg = self._makeOne(arch.name)
+        pkg._meta = {'article_title': 'foo'}
+
+        pkg.meta['article_title'] = 'bar'
+        self.assertEqual(pkg.meta, {'article_title': 'foo'})
+
+    def test_xml_index_is_built_once(self):
+        data = [('bar.xml', b'<root><name>bar</name></root>')]
+        arch = self._make_test_archive(data)
+        pkg = self._makeOne(arch.name)
+
+        self.assertIs(pkg.xml_index, pkg.xml_index)
+        self.assertEqual(pkg.xml_index.findtext('.//name'), 'bar')
+
 
 class SafePackageTests(mocker.MockerTestCase):
     def test_primary_path(self):
         # mocks
-        mock_shutil = self.mocker.replace('shutil')
+        mock_stage_by_copy = self.mocker.replace(package.stage_by_copy)
         mock_uuid4 = self.mocker.replace('uuid.uuid4')
 
-        mock_shutil.copy2(mocker.ANY, mocker.ANY)
+        mock_stage_by_copy(mocker.ANY, mocker.ANY)
         self.mocker.result(None)
 
         mock_uuid4().hex
@@ -289,28 +324,28 @@ class SafePackageTests(mocker.MockerTestCase):
 
         self.mocker.replay()
 
-        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/')
+        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/', staging=('copy',))
 
         self.assertEqual(safe_pkg.primary_path, SAMPLE_PACKAGE)
 
     def test_analyzer_context(self):
         # mocks
-        mock_shutil = self.mocker.replace('shutil')
+        mock_stage_by_copy = self.mocker.replace(package.stage_by_copy)
         mock_uuid4 = self.mocker.replace('uuid.uuid4')
         mock_panalyzer = self.mocker.replace(package.PackageAnalyzer)
 
-        mock_shutil.copy2(mocker.ANY, mocker.ANY)
-        self.mocker.result(None)
+        mock_stage_by_copy(mocker.ANY, mocker.ANY)
+        self.mocker.result('5a74db5db860f2f8e3c6a5c64acdbf04')
 
         mock_uuid4().hex
         self.mocker.result('e7d0213c44ba4ed5adcde9e3fdf62963')
 
-        mock_panalyzer(mocker.ANY)
+        mock_panalyzer(mocker.ANY, checksum='5a74db5db860f2f8e3c6a5c64acdbf04', shared=False)
         self.mocker.result(doubles.PackageAnalyzerStub())
 
         self.mocker.replay()
 
-        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/')
+        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/', staging=('copy',))
         with safe_pkg.analyzer as safe_context:
             self.assertEqual(safe_context.checksum,
                              '5a74db5db860f2f8e3c6a5c64acdbf04')
@@ -318,10 +353,10 @@ class SafePackageTests(mocker.MockerTestCase):
     @unittest.skip('uuid.uuid4() Performed more times than expected')
     def test_gen_safe_path(self):
         # mocks
-        mock_shutil = self.mocker.replace('shutil')
+        mock_stage_by_copy = self.mocker.replace(package.stage_by_copy)
         mock_uuid4 = self.mocker.replace('uuid.uuid4')
 
-        mock_shutil.copy2(mocker.ANY, mocker.ANY)
+        mock_stage_by_copy(mocker.ANY, mocker.ANY)
         self.mocker.result(None)
 
         mock_uuid4().hex
@@ -330,17 +365,17 @@ class SafePackageTests(mocker.MockerTestCase):
 
         self.mocker.replay()
 
-        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/')
+        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/', staging=('copy',))
 
         self.assertEqual(safe_pkg._gen_safe_path(), '/tmp/e7d0213c44ba4ed5adcde9e3fdf62963.zip')
 
     def test_mark_as_failed_can_be_silenced(self):
         # mocks
-        mock_shutil = self.mocker.replace('shutil')
+        mock_stage_by_copy = self.mocker.replace(package.stage_by_copy)
         mock_uuid4 = self.mocker.replace('uuid.uuid4')
         mock_utils = self.mocker.replace('balaio.lib.utils')
 
-        mock_shutil.copy2(mocker.ANY, mocker.ANY)
+        mock_stage_by_copy(mocker.ANY, mocker.ANY)
         self.mocker.result(None)
 
         mock_uuid4().hex
@@ -351,17 +386,17 @@ class SafePackageTests(mocker.MockerTestCase):
 
         self.mocker.replay()
 
-        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/')
+        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/', staging=('copy',))
 
         self.assertIsNone(safe_pkg.mark_as_failed(silence=True))
 
     def test_mark_as_failed_not_silenced_by_default(self):
         # mocks
-        mock_shutil = self.mocker.replace('shutil')
+        mock_stage_by_copy = self.mocker.replace(package.stage_by_copy)
         mock_uuid4 = self.mocker.replace('uuid.uuid4')
         mock_utils = self.mocker.replace('balaio.lib.utils')
 
-        mock_shutil.copy2(mocker.ANY, mocker.ANY)
+        mock_stage_by_copy(mocker.ANY, mocker.ANY)
         self.mocker.result(None)
 
         mock_uuid4().hex
@@ -372,7 +407,241 @@ class SafePackageTests(mocker.MockerTestCase):
 
         self.mocker.replay()
 
-        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/')
+        safe_pkg = package.SafePackage(SAMPLE_PACKAGE, '/tmp/', staging=('copy',))
 
         self.assertRaises(OSError, lambda: safe_pkg.mark_as_failed())
 
+
+
+class SafePackageStagingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.working_dir = os.path.join(self.tmpdir, 'wd')
+        os.mkdir(self.working_dir)
+
+        self.package = os.path.join(self.tmpdir, 'foo.zip')
+        shutil.copy2(SAMPLE_PACKAGE, self.package)
+
+    def tearDown(self):
+        package.STAGING_STRATEGIES.pop('broken', None)
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self, filepath):
+        with open(filepath, 'rb') as fp:
+            return fp.read()
+
+    def test_staging_by_copy(self):
+        safe_pkg = package.SafePackage(self.package, self.working_dir, staging=('copy',))
+
+        self.assertEqual(safe_pkg.staged_by, 'copy')
+        self.assertNotEqual(os.stat(safe_pkg.path).st_ino, os.stat(self.package).st_ino)
+        self.assertEqual(self._read(safe_pkg.path), self._read(self.package))
+
+    def test_staging_by_copy_computes_the_checksum(self):
+        safe_pkg = package.SafePackage(self.package, self.working_dir, staging=('copy',))
+
+        self.assertEqual(safe_pkg.checksum,
+            hashlib.md5(self._read(self.package)).hexdigest())
+
+    def test_staging_by_copy_with_small_buffers(self):
+        dst = os.path.join(self.working_dir, 'bar.zip')
+        checksum = package.stage_by_copy(self.package, dst, bufsize=7)
+
+        self.assertEqual(self._read(dst), self._read(self.package))
+        self.assertEqual(checksum, package.checksum_file(self.package))
+
+    def test_staging_by_copy_never_overwrites(self):
+        dst = os.path.join(self.working_dir, 'bar.zip')
+        with open(dst, 'wb') as fp:
+            fp.write('bar')
+
+        self.assertRaises(OSError, lambda: package.stage_by_copy(self.package, dst))
+        self.assertEqual(self._read(dst), 'bar')
+
+    def test_staging_by_link(self):
+        safe_pkg = package.SafePackage(self.package, self.working_dir, staging=('link',))
+
+        self.assertEqual(safe_pkg.staged_by, 'link')
+        self.assertEqual(os.stat(safe_pkg.path).st_ino, os.stat(self.package).st_ino)
+        self.assertIsNone(safe_pkg.checksum)
+
+    def test_packages_are_not_linked_by_default(self):
+        safe_pkg = package.SafePackage(self.package, self.working_dir)
+
+        self.assertNotEqual(safe_pkg.staged_by, 'link')
+        self.assertNotEqual(os.stat(safe_pkg.path).st_ino, os.stat(self.package).st_ino)
+
+    def test_linked_packages_perms_are_untouched(self):
+        os.chmod(self.package, 0644)
+        safe_pkg = package.SafePackage(self.package, self.working_dir, staging=('link',))
+
+        with safe_pkg.analyzer:
+            self.assertEqual(stat.S_IMODE(os.stat(self.package).st_mode), 0644)
+        self.assertEqual(stat.S_IMODE(os.stat(self.package).st_mode), 0644)
+
+    def test_staged_package_is_in_working_dir(self):
+        safe_pkg = package.SafePackage(self.package, self.working_dir)
+
+        self.assertEqual(os.path.dirname(safe_pkg.path), self.working_dir)
+        self.assertEqual(self._read(safe_pkg.path), self._read(self.package))
+
+    def test_fallback_to_the_next_strategy(self):
+        def broken(src, dst):
+            raise OSError('broken')
+        package.STAGING_STRATEGIES['broken'] = broken
+
+        safe_pkg = package.SafePackage(self.package, self.working_dir, staging=('broken', 'copy'))
+
+        self.assertEqual(safe_pkg.staged_by, 'copy')
+
+    def test_all_strategies_failing(self):
+        def broken(src, dst):
+            raise OSError('broken')
+        package.STAGING_STRATEGIES['broken'] = broken
+
+        self.assertRaises(IOError,
+            lambda: package.SafePackage(self.package, self.working_dir, staging=('broken',)))
+
+
+class ParseStagingTests(unittest.TestCase):
+
+    def test_names_are_stripped(self):
+        self.assertEqual(package.parse_staging('reflink, copy'), ('reflink', 'copy'))
+
+    def test_empty_names_are_ignored(self):
+        self.assertEqual(package.parse_staging('copy,'), ('copy',))
+
+    def test_unknown_names(self):
+        self.assertRaises(ValueError, package.parse_staging, 'reflink,cpy')
+
+    def test_no_names(self):
+        self.assertRaises(ValueError, package.parse_staging, ' ')
+
+
+class ReportAppenderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.report = os.path.join(self.tmpdir, 'report.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self):
+        with open(self.report) as fp:
+            return fp.read()
+
+    def test_lines_are_appended(self):
+        appender = package.ReportAppender(self.report)
+        appender.write('foo\n')
+        appender.write('bar\n')
+
+        self.assertEqual(self._read(), 'foo\nbar\n')
+
+    def test_file_is_kept_open(self):
+        appender = package.ReportAppender(self.report)
+        appender.write('foo\n')
+        fd = appender._fd
+        appender.write('bar\n')
+
+        self.assertEqual(appender._fd, fd)
+
+    def test_removed_file_is_recreated(self):
+        appender = package.ReportAppender(self.report, check_every=1)
+        appender.write('foo\n')
+        os.unlink(self.report)
+        appender.write('bar\n')
+
+        self.assertEqual(self._read(), 'bar\n')
+
+    def test_removed_file_is_recreated_after_check_every_writes(self):
+        appender = package.ReportAppender(self.report, check_every=2)
+        appender.write('foo\n')
+        os.unlink(self.report)
+        appender.write('bar\n')
+        appender.write('baz\n')
+
+        self.assertEqual(self._read(), 'baz\n')
+
+    def test_file_is_not_checked_on_every_write(self):
+        appender = package.ReportAppender(self.report, check_every=3)
+        checks = []
+        is_stale = appender._is_stale
+        appender._is_stale = lambda: checks.append(1) or is_stale()
+
+        for _ in range(7):
+            appender.write('foo\n')
+
+        self.assertEqual(len(checks), 2)
+
+    def test_unicode_lines_are_utf8_encoded(self):
+        appender = package.ReportAppender(self.report)
+        appender.write(u'ação\n')
+
+        self.assertEqual(self._read().decode('utf-8'), u'ação\n')
+
+
+class ReportAppendersTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_appenders_are_shared(self):
+        appenders = package.ReportAppenders()
+        filepath = os.path.join(self.tmpdir, 'report.log')
+
+        self.assertIs(appenders.get(filepath), appenders.get(filepath))
+
+    def test_least_recently_used_is_closed(self):
+        appenders = package.ReportAppenders(max_open=2)
+        foo, bar, baz = [os.path.join(self.tmpdir, name) for name in ('foo', 'bar', 'baz')]
+
+        foo_appender = appenders.get(foo)
+        foo_appender.write('foo\n')
+        bar_appender = appenders.get(bar)
+        bar_appender.write('bar\n')
+        appenders.get(foo)
+        appenders.get(baz)
+
+        self.assertIsNotNone(foo_appender._fd)
+        self.assertIsNone(bar_appender._fd)
+
+    def test_settings_are_applied(self):
+        appenders = package.ReportAppenders()
+        appenders.configure(fsync=True)
+
+        self.assertTrue(appenders.get(os.path.join(self.tmpdir, 'foo')).fsync)
+
+    def test_registry_is_reset_on_forked_processes(self):
+        appenders = package.ReportAppenders()
+        filepath = os.path.join(self.tmpdir, 'report.log')
+        appender = appenders.get(filepath)
+
+        appenders._pid = -1
+        self.assertIsNot(appenders.get(filepath), appender)
+
+
+class CheckinReporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        package.report_appenders.close_all()
+        shutil.rmtree(self.tmpdir)
+
+    def test_messages_are_written_to_report_log(self):
+        reporter = package.CheckinReporter(os.path.join(self.tmpdir, 'foo.zip'))
+        reporter.tell('Foo')
+        reporter.tell('Bar')
+
+        with open(os.path.join(self.tmpdir, 'report.log')) as fp:
+            lines = fp.readlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith('\tfoo.zip\tFoo\n'))
+        self.assertTrue(lines[1].endswith('\tfoo.zip\tBar\n'))
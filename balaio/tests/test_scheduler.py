@@ -0,0 +1,129 @@
+#coding: utf-8
+import time
+import unittest
+
+from balaio.lib import scheduler
+
+
+def make_job(filepath, size):
+    return (filepath, (1, size, 1.0))
+
+
+class FairBacklogTests(unittest.TestCase):
+
+    def test_files_are_served_round_robin_among_directories(self):
+        backlog = scheduler.FairBacklog()
+        for i in range(3):
+            backlog.append('/watch/foo/%s.zip' % i)
+        backlog.append('/watch/bar/0.zip')
+
+        served = [backlog.popleft() for _ in range(4)]
+        self.assertEqual(served, ['/watch/foo/0.zip', '/watch/bar/0.zip',
+                                  '/watch/foo/1.zip', '/watch/foo/2.zip'])
+        self.assertEqual(len(backlog), 0)
+
+    def test_peek(self):
+        backlog = scheduler.FairBacklog()
+        backlog.append('/watch/foo/0.zip')
+        backlog.append('/watch/foo/1.zip')
+
+        self.assertEqual(backlog.peek(), '/watch/foo/0.zip')
+        self.assertEqual(len(backlog), 2)
+
+    def test_empty_backlog(self):
+        backlog = scheduler.FairBacklog()
+
+        self.assertRaises(IndexError, backlog.peek)
+        self.assertRaises(IndexError, backlog.popleft)
+
+    def test_files_are_added_once(self):
+        backlog = scheduler.FairBacklog()
+        backlog.append('/watch/foo/0.zip')
+        backlog.append('/watch/foo/0.zip')
+
+        self.assertTrue('/watch/foo/0.zip' in backlog)
+        self.assertEqual(list(backlog), ['/watch/foo/0.zip'])
+
+    def test_drained_classes_are_dropped(self):
+        backlog = scheduler.FairBacklog()
+        backlog.append('/watch/foo/0.zip')
+        backlog.popleft()
+
+        self.assertEqual(backlog.classes, {})
+
+
+class FairQueueTests(unittest.TestCase):
+
+    def test_jobs_are_served_round_robin_among_directories(self):
+        queue = scheduler.FairQueue()
+        for i in range(3):
+            queue.put(make_job('/watch/foo/%s.zip' % i, 10))
+        queue.put(make_job('/watch/bar/0.zip', 10))
+
+        served = [queue.get()[0] for _ in range(4)]
+        self.assertEqual(served, ['/watch/foo/0.zip', '/watch/bar/0.zip',
+                                  '/watch/foo/1.zip', '/watch/foo/2.zip'])
+
+    def test_smaller_packages_first(self):
+        queue = scheduler.FairQueue()
+        queue.put(make_job('/watch/foo/big.zip', 1000))
+        queue.put(make_job('/watch/foo/small.zip', 10))
+
+        self.assertEqual(queue.get()[0], '/watch/foo/small.zip')
+        self.assertEqual(queue.get()[0], '/watch/foo/big.zip')
+
+    def test_same_size_packages_are_served_in_order(self):
+        queue = scheduler.FairQueue()
+        queue.put(make_job('/watch/foo/a.zip', 10))
+        queue.put(make_job('/watch/foo/b.zip', 10))
+
+        self.assertEqual(queue.get()[0], '/watch/foo/a.zip')
+
+    def test_old_jobs_are_boosted(self):
+        queue = scheduler.FairQueue(age_boost=0)
+        queue.put(make_job('/watch/foo/big.zip', 1000))
+        time.sleep(0.01)
+        queue.put(make_job('/watch/foo/small.zip', 10))
+
+        self.assertEqual(queue.get()[0], '/watch/foo/big.zip')
+
+    def test_other_items_are_served_after_all_jobs(self):
+        queue = scheduler.FairQueue()
+        queue.put(make_job('/watch/foo/a.zip', 10))
+        queue.put('##HALT##')
+        queue.put(make_job('/watch/foo/b.zip', 10))
+
+        self.assertEqual(queue.qsize(), 3)
+        self.assertEqual(queue.get()[0], '/watch/foo/a.zip')
+        self.assertEqual(queue.get()[0], '/watch/foo/b.zip')
+        self.assertEqual(queue.get(), '##HALT##')
+
+    def test_maxsize_is_honored(self):
+        queue = scheduler.FairQueue(maxsize=1)
+        queue.put(make_job('/watch/foo/a.zip', 10))
+
+        self.assertTrue(queue.full())
+
+    def test_stats_by_class(self):
+        queue = scheduler.FairQueue()
+        queue.put(make_job('/watch/foo/a.zip', 10))
+        queue.put(make_job('/watch/foo/b.zip', 10))
+        queue.put(make_job('/watch/bar/a.zip', 10))
+        queue.get()
+
+        stats = queue.stats()
+        self.assertEqual(stats['/watch/foo']['depth'], 1)
+        self.assertEqual(stats['/watch/foo']['served'], 1)
+        self.assertEqual(stats['/watch/bar']['depth'], 1)
+        self.assertEqual(stats['/watch/bar']['served'], 0)
+        self.assertEqual(stats['/watch/bar']['mean_wait'], 0.0)
+        self.assertTrue(stats['/watch/foo']['max_wait'] >= 0.0)
+
+    def test_stats_of_drained_classes_are_dropped(self):
+        queue = scheduler.FairQueue()
+        queue.put(make_job('/watch/foo/a.zip', 10))
+        queue.put(make_job('/watch/bar/a.zip', 10))
+        queue.get()
+
+        self.assertEqual(queue.stats().keys(), ['/watch/bar'])
+        self.assertEqual(queue._stats.keys(), ['/watch/bar'])
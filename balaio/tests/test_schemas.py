@@ -0,0 +1,85 @@
+#coding: utf-8
+import unittest
+from StringIO import StringIO
+
+from lxml import etree
+
+from balaio.lib import schemas
+
+
+JATS_ARTICLE = '<article dtd-version="1.0"><front/></article>'
+PMC_PUBLIC_ID = '-//NLM//DTD Journal Publishing DTD v3.0 20080202//EN'
+
+
+class SchemaIdForTests(unittest.TestCase):
+
+    def test_schema_bound_to_the_doctype(self):
+        xml = etree.parse(StringIO('<!DOCTYPE article PUBLIC "%s" "journalpublishing3.dtd"><article/>' % PMC_PUBLIC_ID))
+        self.assertEqual(schemas.schema_id_for(xml), PMC_PUBLIC_ID)
+
+    def test_xml_without_doctype_use_the_default_schema(self):
+        xml = etree.parse(StringIO('<article/>'))
+        self.assertEqual(schemas.schema_id_for(xml), schemas.DEFAULT_PUBLIC_ID)
+
+
+class LoadSchemaTests(unittest.TestCase):
+
+    def test_sps_schemas_are_loaded_from_the_catalog(self):
+        for public_id in schemas.SPS_PUBLIC_IDS:
+            self.assertIsInstance(schemas.load_schema(public_id), etree.DTD)
+
+    def test_unsupported_public_ids(self):
+        self.assertRaises(schemas.UnknownSchema, lambda: schemas.load_schema('-//FOO//DTD Foo//EN'))
+
+
+class SchemaCacheTests(unittest.TestCase):
+
+    def _makeOne(self):
+        self.loaded = []
+        def loader(schema_id):
+            self.loaded.append(schema_id)
+            return etree.DTD(StringIO('<!ELEMENT article (front)><!ATTLIST article dtd-version CDATA #IMPLIED><!ELEMENT front EMPTY>'))
+
+        return schemas.SchemaCache(loader=loader)
+
+    def test_schemas_are_compiled_once(self):
+        cache = self._makeOne()
+        cache.get('foo.dtd')
+        cache.get('foo.dtd')
+
+        self.assertEqual(self.loaded, ['foo.dtd'])
+
+    def test_hits_and_misses_are_counted(self):
+        cache = self._makeOne()
+        cache.get('foo.dtd')
+        cache.get('foo.dtd')
+        cache.get('bar.dtd')
+
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'schemas': 2})
+
+    def test_warm_compiles_all_sps_schemas(self):
+        cache = self._makeOne()
+        cache.warm()
+
+        self.assertEqual(sorted(self.loaded), sorted(schemas.SPS_PUBLIC_IDS))
+
+    def test_warm_ignores_unknown_schemas(self):
+        cache = schemas.SchemaCache()
+        cache.warm(['-//FOO//DTD Foo//EN'])
+
+        self.assertEqual(cache.stats()['schemas'], 0)
+
+    def test_validate_valid_xml(self):
+        cache = self._makeOne()
+        xml = etree.parse(StringIO(JATS_ARTICLE))
+
+        self.assertEqual(cache.validate(xml), (True, []))
+
+    def test_validate_invalid_xml(self):
+        cache = self._makeOne()
+        xml = etree.parse(StringIO('<article dtd-version="1.0"><back/></article>'))
+
+        result, errors = cache.validate(xml)
+        self.assertFalse(result)
+        self.assertTrue(errors)
+        self.assertEqual(errors[0].line, 1)
@@ -0,0 +1,44 @@
+#coding: utf-8
+import unittest
+
+import requests
+import scieloapi
+
+from balaio.lib import scieloapitoolbelt
+
+
+class SessionStub(object):
+    def __init__(self, exc):
+        self.exc = exc
+
+    def get(self, *args, **kwargs):
+        raise self.exc
+
+    def post(self, *args, **kwargs):
+        raise self.exc
+
+
+class KeepAliveBrokerTests(unittest.TestCase):
+
+    def _makeOne(self, exc):
+        return scieloapitoolbelt.KeepAliveBroker(session=SessionStub(exc))
+
+    def test_get_translates_connection_errors(self):
+        broker = self._makeOne(requests.exceptions.ConnectionError())
+        self.assertRaises(scieloapi.exceptions.ConnectionError,
+                          broker.get, 'http://manager.scielo.org/api/v1/', 'journals')
+
+    def test_get_translates_timeouts(self):
+        broker = self._makeOne(requests.exceptions.Timeout())
+        self.assertRaises(scieloapi.exceptions.Timeout,
+                          broker.get, 'http://manager.scielo.org/api/v1/', 'journals')
+
+    def test_post_translates_request_errors(self):
+        broker = self._makeOne(requests.exceptions.RequestException())
+        self.assertRaises(scieloapi.exceptions.HTTPError,
+                          broker.post, 'http://manager.scielo.org/api/v1/', {}, 'checkins')
+
+    def test_translated_errors_are_api_errors(self):
+        broker = self._makeOne(requests.exceptions.ConnectionError())
+        self.assertRaises(scieloapi.exceptions.APIError,
+                          broker.get, 'http://manager.scielo.org/api/v1/', 'journals')
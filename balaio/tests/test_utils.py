@@ -1,4 +1,5 @@
 #coding: utf-8
+import os
 import mocker
 import unittest
 import ConfigParser
@@ -97,6 +98,30 @@ class ConfigurationTests(mocker.MockerTestCase):
             ConfigParser.NoSectionError,
             lambda: conf.get('missing', 'status'))
 
+    def test_missing_options_fall_back_to_defaults(self):
+        conf = utils.Configuration(StringIO('[app]\nstatus = True\n'))
+
+        self.assertEqual(conf.get('app', 'staging'), 'reflink,copy')
+        self.assertEqual(conf.getint('monitor', 'workers'), 1)
+        self.assertEqual(conf.getfloat('monitor', 'debounce'), 2.0)
+        self.assertFalse(conf.getboolean('monitor', 'group_commit'))
+
+    def test_options_in_the_file_take_precedence_over_defaults(self):
+        conf = utils.Configuration(StringIO('[monitor]\nworkers = 4\n'))
+        self.assertEqual(conf.getint('monitor', 'workers'), 4)
+
+    def test_defaults_match_the_template(self):
+        template = os.path.join(os.path.dirname(__file__), '..', '..', 'conf', 'config.ini-TEMPLATE')
+        parser = ConfigParser.SafeConfigParser()
+        parser.read(template)
+        getters = {bool: parser.getboolean, int: parser.getint,
+                   float: parser.getfloat, str: parser.get}
+
+        for section, options in utils.CONFIG_DEFAULTS.items():
+            for option, default in options.items():
+                self.assertEqual(getters[type(default)](section, option), default,
+                                 (section, option))
+
 
 class ISSNFunctionsTest(unittest.TestCase):
 
@@ -313,6 +338,32 @@ class ZipFilesUtilsTests(unittest.TestCase):
         self.assertIsInstance(fp.read(), str)
 
 
+class HasZipSignatureTests(unittest.TestCase):
+
+    def test_zip_file(self):
+        from tempfile import NamedTemporaryFile
+        import zipfile
+
+        fp = NamedTemporaryFile()
+        with zipfile.ZipFile(fp, 'w') as zipfp:
+            zipfp.writestr('bar.xml', b'<root/>')
+        fp.flush()
+
+        self.assertTrue(utils.has_zip_signature(fp.name))
+
+    def test_non_zip_file(self):
+        from tempfile import NamedTemporaryFile
+
+        fp = NamedTemporaryFile()
+        fp.write(b'<root/>')
+        fp.flush()
+
+        self.assertFalse(utils.has_zip_signature(fp.name))
+
+    def test_missing_file(self):
+        self.assertFalse(utils.has_zip_signature('/tmp/inexistent/foo.zip'))
+
+
 class GetStaticPathTests(unittest.TestCase):
 
     def test_get_static_path_with_normal_arq_name(self):
@@ -49,6 +49,31 @@ class ValidationPipeTests(mocker.MockerTestCase):
             base.ValidationPipe.transform(mock_self, item),
             item)
 
+    def test_transform_uses_the_carried_notifier(self):
+        mock_self = self.mocker.mock(base.ValidationPipe)
+        mock_notifier = self.mocker.mock()
+
+        item = (AttemptStub(), ArticlePkgStub(), {}, SessionStub(), mock_notifier)
+
+        mock_self.validate(item)
+        self.mocker.result([models.Status.ok, 'foo'])
+
+        mock_self._stage_
+        self.mocker.result('bar')
+
+        # the notifier factory must not be called.
+        mock_self._notifier
+        self.mocker.result(self.mocker.mock())
+
+        mock_notifier.tell('foo', models.Status.ok, label='bar')
+        self.mocker.result(None)
+
+        self.mocker.replay()
+
+        self.assertEqual(
+            base.ValidationPipe.transform(mock_self, item),
+            item)
+
     def test_validate_raises_NotImplementedError(self):
         vpipe = self._makeOne([{'name': 'foo'}])
         self.assertRaises(NotImplementedError, lambda: vpipe.validate('foo'))
@@ -188,7 +213,7 @@ class SetupPipeTests(mocker.MockerTestCase):
     def test_transform_returns_right_datastructure(self):
         """
         The right datastructure is a tuple in the form:
-        (<models.Attempt>, <checkin.PackageAnalyzer>, <dict>, Session)
+        (<models.Attempt>, <checkin.PackageAnalyzer>, <dict>, Session, Notifier)
         """
         data = "<root><issn pub-type='epub'>0102-6720</issn></root>"
 
@@ -205,7 +230,8 @@ class SetupPipeTests(mocker.MockerTestCase):
         self.assertIsInstance(result[1], PackageAnalyzerStub)
         # index 2 is the return data from scieloapi.journals.filter
         # so, testing its type actualy means nothing.
-        self.assertEqual(len(result), 4)
+        self.assertIsInstance(result[4], NotifierStub)
+        self.assertEqual(len(result), 5)
 
     def test_fetch_journal_issue_data_with_valid_criteria(self):
         """
@@ -1,6 +1,7 @@
 # coding: utf-8
 import unittest
 import mocker
+from lxml import etree
 
 from balaio.lib import models, utils
 from balaio.lib.validations import references
@@ -434,3 +435,59 @@ class ReferenceDateValidationTests(unittest.TestCase):
         self.assertEquals(
             vpipe.validate([None, pkg_analyzer_stub, None]), expected)
 
+
+
+class ReferenceCheckTests(unittest.TestCase):
+
+    data = '''
+        <root>
+          <ref-list>
+            <ref id="B1">
+              <element-citation publication-type="book">
+                <article-title>Title</article-title>
+                <source>Source</source>
+                <year>1999</year>
+              </element-citation>
+              <element-citation publication-type="journal">
+                <article-title>Title</article-title>
+                <source></source>
+                <year>199a</year>
+              </element-citation>
+            </ref>
+            <ref id="B2">
+              <element-citation publication-type="journal">
+                <source>Source</source>
+              </element-citation>
+            </ref>
+          </ref-list>
+        </root>'''
+
+    def _makePkgAnalyzerWithData(self, data):
+        pkg_analyzer_stub = PackageAnalyzerStub()
+        pkg_analyzer_stub._xml_string = data
+        return pkg_analyzer_stub
+
+    def test_checks_match_the_first_elements_of_each_ref(self):
+        pkg_analyzer_stub = self._makePkgAnalyzerWithData(self.data)
+        check = references.ReferenceCheck(pkg_analyzer_stub.xml.findall('.//ref-list/ref'))
+
+        self.assertEqual(check.count, 2)
+        self.assertEqual(check.missing_source, [])
+        self.assertEqual(check.missing_year, ['B2'])
+        self.assertEqual(check.bad_year, [])
+        self.assertEqual(check.missing_article_title, ['B2'])
+
+    def test_checks_with_lxml(self):
+        refs = etree.fromstring(self.data).findall('.//ref-list/ref')
+        check = references.ReferenceCheck(refs)
+
+        self.assertEqual(check.missing_year, ['B2'])
+        self.assertEqual(check.missing_article_title, ['B2'])
+
+    def test_refs_are_checked_once_per_package(self):
+        pkg_analyzer_stub = self._makePkgAnalyzerWithData(self.data)
+
+        self.assertIs(references.check_references(pkg_analyzer_stub),
+                      references.check_references(pkg_analyzer_stub))
+        self.assertIsNot(references.check_references(pkg_analyzer_stub),
+                         references.check_references(self._makePkgAnalyzerWithData(self.data)))
@@ -0,0 +1,206 @@
+#coding: utf-8
+import unittest
+
+import transaction
+from sqlalchemy.exc import OperationalError
+
+from balaio import validator
+from balaio.lib import models
+from . import doubles, modelfactories
+from .utils import db_bootstrap, DB_READY
+
+
+global_engine = None
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    global global_engine
+    try:
+        global_engine = db_bootstrap()
+    except OperationalError:
+        # global_engine remains None, all db-bound testcases
+        # need to test for DB_READY before run.
+        pass
+
+
+class PipelineStub(object):
+    def __init__(self):
+        self.validated = []
+
+    def run(self, items):
+        for attempt, session in items:
+            self.validated.append(attempt)
+            yield attempt
+
+
+class FailingPipelineStub(PipelineStub):
+    """
+    Changes every attempt, and fails for the attempts in `failing`.
+    """
+    def __init__(self, failing):
+        super(FailingPipelineStub, self).__init__()
+        self.failing = failing
+
+    def run(self, items):
+        for attempt, session in items:
+            attempt.is_valid = False
+            if attempt.id in self.failing:
+                raise ValueError('validation failed')
+            self.validated.append(attempt)
+            yield attempt
+
+
+class StopWorker(Exception):
+    pass
+
+
+class WaiterStub(object):
+    """
+    Records the calls made by the worker, and stops it when it waits.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def busy(self):
+        self.calls.append('busy')
+
+    def idle(self):
+        self.calls.append('idle')
+
+    def wait(self):
+        self.calls.append('wait')
+        raise StopWorker()
+
+
+class WorkerTests(unittest.TestCase):
+
+    def _makeOne(self, batches, **kwargs):
+        worker = validator.Worker(PipelineStub(), waiter=WaiterStub(), **kwargs)
+        batches = iter(batches)
+        worker._load_messages = lambda session: next(batches)
+        return worker
+
+    def tearDown(self):
+        transaction.abort()
+
+    def test_claimed_attempts_are_validated(self):
+        attempts = [doubles.AttemptStub(), doubles.AttemptStub()]
+        worker = self._makeOne([attempts])
+
+        self.assertEqual(worker.run_once(), 2)
+        self.assertEqual(worker.pipeline.validated, attempts)
+
+    def test_nothing_to_do(self):
+        worker = self._makeOne([[]])
+
+        self.assertEqual(worker.run_once(), 0)
+        self.assertEqual(worker.pipeline.validated, [])
+
+    def test_backlog_is_consumed_without_waiting(self):
+        worker = self._makeOne([[doubles.AttemptStub()], [doubles.AttemptStub()], []])
+
+        self.assertRaises(StopWorker, worker.start)
+        self.assertEqual(worker.waiter.calls, ['busy', 'busy', 'idle', 'wait'])
+
+    def test_claim_options(self):
+        worker = validator.Worker(PipelineStub(), waiter=WaiterStub(),
+                                  claim_size=5, claim_lease=60, max_failures=2)
+        claims = []
+
+        def claim_for_validation(session, limit, lease, max_failures):
+            claims.append((limit, lease, max_failures))
+            return []
+
+        original = models.Attempt.__dict__['claim_for_validation']
+        models.Attempt.claim_for_validation = staticmethod(claim_for_validation)
+        try:
+            worker.run_once()
+        finally:
+            models.Attempt.claim_for_validation = original
+
+        self.assertEqual(claims, [(5, 60, 2)])
+
+    def test_failures_are_counted(self):
+        attempt = doubles.AttemptStub()
+        worker = validator.Worker(FailingPipelineStub([1]), waiter=WaiterStub())
+
+        self.assertFalse(worker._validate(attempt, doubles.SessionStub()))
+        self.assertEqual(attempt.validation_failures, 1)
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class WorkerClaimTests(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = db_bootstrap()
+        self.attempt = modelfactories.AttemptFactory(proceed_to_validation=True)
+        transaction.commit()
+
+    def tearDown(self):
+        transaction.abort()
+        models.Base.metadata.drop_all(self.engine)
+
+    def _makeOne(self, **kwargs):
+        return validator.Worker(PipelineStub(), waiter=WaiterStub(), **kwargs)
+
+    def test_claims_are_committed(self):
+        worker = self._makeOne()
+        worker._load_messages(models.Session())
+
+        claimed = models.Session().query(models.Attempt).get(self.attempt.id)
+        self.assertIsNotNone(claimed.validation_claimed_by)
+        self.assertIsNotNone(claimed.validation_lease_expires_at)
+
+    def test_attempts_are_not_validated_twice_while_leased(self):
+        self.assertEqual(self._makeOne().run_once(), 1)
+        self.assertEqual(self._makeOne().run_once(), 0)
+
+    def test_attempts_are_claimed_again_after_the_lease(self):
+        self.assertEqual(self._makeOne(claim_lease=-1).run_once(), 1)
+
+        worker = self._makeOne()
+        self.assertEqual(worker.run_once(), 1)
+        self.assertEqual([a.id for a in worker.pipeline.validated], [self.attempt.id])
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class WorkerFailureTests(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = db_bootstrap()
+        self.good = modelfactories.AttemptFactory(proceed_to_validation=True)
+        self.bad = modelfactories.AttemptFactory(proceed_to_validation=True)
+        transaction.commit()
+        self.good_id, self.bad_id = self.good.id, self.bad.id
+
+    def tearDown(self):
+        transaction.abort()
+        models.Base.metadata.drop_all(self.engine)
+
+    def _makeOne(self, **kwargs):
+        return validator.Worker(FailingPipelineStub([self.bad_id]), waiter=WaiterStub(),
+                                claim_lease=-1, **kwargs)
+
+    def test_failing_attempt_is_rolled_back_alone(self):
+        self.assertEqual(self._makeOne().run_once(), 2)
+
+        session = models.Session()
+        good = session.query(models.Attempt).get(self.good_id)
+        bad = session.query(models.Attempt).get(self.bad_id)
+        self.assertFalse(good.is_valid)
+        self.assertEqual(good.validation_failures, 0)
+        self.assertTrue(bad.is_valid)
+        self.assertEqual(bad.validation_failures, 1)
+
+    def test_attempts_are_not_claimed_after_max_failures(self):
+        worker = self._makeOne(max_failures=2)
+        worker.run_once()
+        # the succeeded attempt is not valid anymore.
+        self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(worker.run_once(), 0)
+
+        bad = models.Session().query(models.Attempt).get(self.bad_id)
+        self.assertEqual(bad.validation_failures, 2)
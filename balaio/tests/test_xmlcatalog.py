@@ -0,0 +1,48 @@
+#coding: utf-8
+import unittest
+from StringIO import StringIO
+
+from balaio.lib import xmlcatalog
+
+
+JATS_PUBLIC_ID = '-//NLM//DTD JATS (Z39.96) Journal Publishing DTD v1.0 20120330//EN'
+
+
+class XMLCatalogTests(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = xmlcatalog.XMLCatalog()
+
+    def test_lookup_by_public_id(self):
+        filepath = self.catalog.lookup('foo.dtd', JATS_PUBLIC_ID)
+        self.assertTrue(filepath.endswith('JATS-journalpublishing1.dtd'))
+
+    def test_lookup_remote_system_id_by_basename(self):
+        filepath = self.catalog.lookup(
+            'http://jats.nlm.nih.gov/publishing/1.0/JATS-journalpublishing1.dtd', None)
+        self.assertTrue(filepath.startswith(self.catalog.root_dir))
+
+    def test_lookup_unknown_entity(self):
+        self.assertIsNone(self.catalog.lookup('http://example.com/foo.dtd', '-//FOO//EN'))
+
+    def test_contents_are_kept_in_memory(self):
+        filepath = self.catalog.lookup(None, JATS_PUBLIC_ID)
+        self.assertIs(self.catalog.read(filepath), self.catalog.read(filepath))
+
+
+class ParseTests(unittest.TestCase):
+
+    def test_known_dtds_are_resolved_locally(self):
+        xml = xmlcatalog.parse(StringIO(
+            '<!DOCTYPE article PUBLIC "%s" "http://example.com/JATS-journalpublishing1.dtd">'
+            '<article>&nbsp;foo</article>' % JATS_PUBLIC_ID))
+
+        self.assertEqual(xml.getroot().text, u'\xa0foo')
+
+    def test_unknown_dtds_fail_fast(self):
+        self.assertRaises(xmlcatalog.UnresolvedEntity, lambda: xmlcatalog.parse(StringIO(
+            '<!DOCTYPE article PUBLIC "-//FOO//EN" "http://example.com/foo.dtd"><article/>')))
+
+    def test_xml_without_doctype(self):
+        xml = xmlcatalog.parse(StringIO('<article>foo</article>'))
+        self.assertEqual(xml.getroot().text, 'foo')
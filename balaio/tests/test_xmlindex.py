@@ -0,0 +1,105 @@
+#coding: utf-8
+import unittest
+from StringIO import StringIO
+import xml.etree.ElementTree as ElementTree
+
+from lxml import etree
+
+from balaio.lib import xmlindex
+
+
+SAMPLE = '''<article>
+    <front>
+        <article-meta>
+            <article-id pub-id-type="other">foo</article-id>
+            <article-id pub-id-type="doi">10.1590/S0100-879X2013000100001</article-id>
+            <pub-date><year>2013</year></pub-date>
+            <permissions><license/></permissions>
+        </article-meta>
+    </front>
+    <back>
+        <!-- references -->
+        <ref-list>
+            <ref id="B1"><element-citation><source>Foo</source><year>2001</year></element-citation></ref>
+            <ref id="B2"><element-citation><source>Bar</source></element-citation></ref>
+        </ref-list>
+        <pub-date><year>1999</year></pub-date>
+    </back>
+</article>'''
+
+PATHS = [
+    './/ref-list/ref',
+    './/article-meta//pub-date',
+    './/pub-date',
+    './/article-id/[@pub-id-type="doi"]',
+    './/article-meta/permissions',
+    './/article-meta/missing',
+    './/missing',
+    'front/article-meta',
+]
+
+
+class ElementIndexTests(unittest.TestCase):
+
+    def _makeOne(self, tree):
+        return xmlindex.ElementIndex(tree)
+
+    def test_findall_matches_lxml(self):
+        tree = etree.parse(StringIO(SAMPLE))
+        index = self._makeOne(tree)
+
+        for path in PATHS:
+            self.assertEqual(index.findall(path), tree.findall(path), path)
+
+    def test_findall_matches_elementtree(self):
+        tree = ElementTree.ElementTree()
+        tree.parse(StringIO(SAMPLE))
+        index = self._makeOne(tree)
+
+        for path in PATHS:
+            self.assertEqual(index.findall(path), tree.findall(path), path)
+
+    def test_findall_matches_with_other_tags(self):
+        tree = etree.parse(StringIO(SAMPLE))
+        index = xmlindex.ElementIndex(tree, tags=['ref', 'year'])
+
+        for path in PATHS + ['.//ref//source', './/year']:
+            self.assertEqual(index.findall(path), tree.findall(path), path)
+
+    def test_root_element_is_not_matched(self):
+        index = xmlindex.ElementIndex(etree.parse(StringIO(SAMPLE)), tags=['article'])
+        self.assertEqual(index.findall('.//article'), [])
+
+    def test_only_the_given_tags_are_indexed(self):
+        index = xmlindex.ElementIndex(etree.parse(StringIO(SAMPLE)), tags=['ref'])
+
+        self.assertEqual(index._by_tag.keys(), ['ref'])
+        self.assertEqual(len(index._by_tag['ref']), 2)
+
+    def test_results_are_kept_by_path(self):
+        index = self._makeOne(etree.parse(StringIO(SAMPLE)))
+        first = index.findall('front/article-meta')
+
+        index.tree = None
+        self.assertEqual(index.findall('front/article-meta'), first)
+
+    def test_returned_lists_are_copies(self):
+        index = self._makeOne(etree.parse(StringIO(SAMPLE)))
+        index.findall('.//ref-list/ref').pop()
+
+        self.assertEqual(len(index.findall('.//ref-list/ref')), 2)
+
+    def test_find(self):
+        index = self._makeOne(etree.parse(StringIO(SAMPLE)))
+
+        self.assertEqual(index.find('.//ref-list/ref').attrib['id'], 'B1')
+        self.assertIsNone(index.find('.//ref-list/missing'))
+
+    def test_findtext(self):
+        index = self._makeOne(etree.parse(StringIO(SAMPLE)))
+
+        self.assertEqual(index.findtext('.//article-id/[@pub-id-type="doi"]'),
+                         '10.1590/S0100-879X2013000100001')
+        self.assertEqual(index.findtext('.//article-meta/permissions/license'), '')
+        self.assertIsNone(index.findtext('.//missing'))
+        self.assertEqual(index.findtext('.//missing', 'foo'), 'foo')
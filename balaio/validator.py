@@ -1,7 +1,6 @@
 # coding: utf-8
 import sys
 import logging
-import time
 
 import scieloapi
 import transaction
@@ -14,6 +13,7 @@ from lib import (
     scieloapitoolbelt,
     models,
     validations,
+    wakeup,
 )
 
 
@@ -21,39 +21,85 @@ logger = logging.getLogger('balaio.validator')
 
 
 class Worker(object):
+    """
+    Validates the attempts claimed in batches of `claim_size`.
 
-    def __init__(self, pipeline):
+    Attempts are claimed for `claim_lease` seconds, so many workers,
+    in one or more hosts, can share the backlog. Attempts that fail to be
+    validated are claimed again once the lease expires, until they have
+    failed `max_failures` times.
+    """
+
+    def __init__(self, pipeline, waiter=None, claim_size=10, claim_lease=600, max_failures=3):
         self.pipeline = pipeline
+        self.waiter = waiter or wakeup.Waiter(min_interval=10, max_interval=10)
+        self.claim_size = claim_size
+        self.claim_lease = claim_lease
+        self.max_failures = max_failures
 
     def _load_messages(self, session):
-        messages = session.query(models.Attempt).filter(
-            models.Attempt.ready_to_validate())
+        messages = models.Attempt.claim_for_validation(session,
+            limit=self.claim_size, lease=self.claim_lease, max_failures=self.max_failures)
+
+        # the claim must be visible to the other workers.
+        transaction.commit()
 
         return messages
 
+    def _validate(self, attempt, session):
+        """
+        Runs the pipeline for `attempt` within a savepoint, so a failure
+        rolls back its own changes only. Failures are counted.
+
+        Returns True on success.
+        """
+        savepoint = transaction.savepoint()
+        try:
+            for _ in self.pipeline.run([(attempt, session)]):
+                # nothing to do here.
+                pass
+
+            session.flush()
+        except Exception as e:
+            savepoint.rollback()
+            logger.exception('Failed to validate %s: %s' % (attempt, e))
+
+            attempt.validation_failures += 1
+            if attempt.validation_failures >= self.max_failures:
+                logger.error('Giving up validating %s after %s failures.' % (
+                    attempt, attempt.validation_failures))
+            return False
+
+        return True
+
     def run_once(self):
+        """
+        Runs the pipeline for a batch of attempts ready to be validated.
+
+        Returns the number of attempts.
+        """
         logger.debug('New validation round.')
         session = models.Session()
 
-        raw_messages = self._load_messages(session)
+        try:
+            raw_messages = self._load_messages(session)
+        except Exception:
+            transaction.abort()
+            session.close()
+            raise
 
         # check if there is something to do.
         # if not, close the session and return.
-        raw_messages_no = raw_messages.count()
+        raw_messages_no = len(raw_messages)
         if not raw_messages_no:
-            transaction.abort()
             session.close()
             logger.debug('End of validation round. Nothing to do.')
-            return None
+            return 0
 
         try:
-            # enrich each message with the current session.
             logger.debug('Started validation of %s attempts' % raw_messages_no)
-            messages = ((msg, session) for msg in raw_messages)
-
-            for _ in self.pipeline.run(messages):
-                # nothing to do here.
-                pass
+            for attempt in raw_messages:
+                self._validate(attempt, session)
         finally:
 
             try:
@@ -65,10 +111,17 @@ class Worker(object):
                 session.close()
                 logger.debug('End of validation round.')
 
+        return raw_messages_no
+
     def start(self):
         while True:
-            self.run_once()
-            time.sleep(10)
+            # the backlog is consumed batch after batch.
+            if self.run_once():
+                self.waiter.busy()
+                continue
+
+            self.waiter.idle()
+            self.waiter.wait()
 
 
 if __name__ == '__main__':
@@ -76,7 +129,13 @@ if __name__ == '__main__':
     # Setting up the app configuration, logging and SqlAlchemy Session.
     config = utils.balaio_config_from_env()
     utils.setup_logging(config)
-    models.Session.configure(bind=models.create_engine_from_config(config))
+    engine = models.create_engine_from_config(config)
+    models.Session.configure(bind=engine)
+
+    # Attempts ready to be validated are announced by the monitor.
+    waiter = wakeup.Waiter(wakeup.channel_from_config(config, engine),
+                           min_interval=config.getfloat('validator', 'poll_min'),
+                           max_interval=config.getfloat('validator', 'poll_max'))
 
     # Setting up some pipe dependencies.
     scieloapi = scieloapi.Client(config.get('manager', 'api_username'),
@@ -114,7 +173,10 @@ if __name__ == '__main__':
 
     while True:
         try:
-            app = Worker(ppl)
+            app = Worker(ppl, waiter=waiter,
+                         claim_size=config.getint('validator', 'claim_size'),
+                         claim_lease=config.getint('validator', 'claim_lease'),
+                         max_failures=config.getint('validator', 'max_failures'))
             app.start()
         except KeyboardInterrupt:
             sys.exit(0)
@@ -0,0 +1,140 @@
+# coding: utf-8
+"""
+Measures the requests, connections and wall time spent to deliver the
+notifications of one validation to SciELO Manager, with and without
+batched notices.
+
+A local stand-in for the Manager API is used, so the numbers reflect
+the client side only. Usage::
+
+    $ python scripts/notices_benchmark.py [notices per attempt] [attempts]
+"""
+import os
+import sys
+import json
+import time
+import threading
+import SocketServer
+import BaseHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import scieloapi
+
+from balaio.lib import models, outbox, scieloapitoolbelt
+
+
+ENDPOINTS = ['checkins', 'checkins_articles', 'notices']
+
+
+class ManagerStandIn(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # replies are written at once, so keep-alive connections are not
+    # stalled by delayed ACKs.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    requests = 0
+    connections = 0
+    _lock = threading.Lock()
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self._lock:
+            ManagerStandIn.connections += 1
+
+    def _reply(self, status, body='', headers=()):
+        with self._lock:
+            ManagerStandIn.requests += 1
+
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        endpoints = dict((ep, {'list_endpoint': '/api/v1/%s/' % ep}) for ep in ENDPOINTS)
+        self._reply(200, json.dumps(endpoints), [('Content-Type', 'application/json')])
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        endpoint = self.path.strip('/').split('/')[-1]
+        self._reply(201, headers=[('Location', 'http://localhost/api/v1/%s/%s/' % (endpoint, self.requests))])
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    # keep-alive connections are served concurrently.
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # connections dropped at exit.
+        pass
+
+
+class SessionStub(object):
+    def close(self):
+        pass
+
+
+def make_messages(notices, batch):
+    attempt = models.Attempt(package_checksum='5a74db5db860f2f8e3c6a5c64acdbf04')
+    messages = [models.OutboxMessage(models.OutboxMessage.CHECKIN,
+        {'article': {'article_title': 'foo'}, 'checkin': {'attempt_ref': '1'}}, attempt=attempt)]
+
+    data = [{'checkin': None, 'stage': 'bar', 'checkpoint': 'validation',
+             'message': 'notice %s' % n, 'status': 'ok'} for n in range(notices)]
+
+    if batch:
+        messages.append(models.OutboxMessage(models.OutboxMessage.NOTICES,
+            {'notices': data}, attempt=attempt))
+    else:
+        messages.extend(models.OutboxMessage(models.OutboxMessage.NOTICE, notice, attempt=attempt)
+            for notice in data)
+
+    return messages
+
+
+def measure(client, notices, attempts, batch):
+    messages = []
+    for _ in range(attempts):
+        messages.extend(make_messages(notices, batch))
+
+    dispatcher = outbox.Dispatcher(client, Session=SessionStub, batch_size=len(messages))
+    dispatcher._pending = lambda session, now: messages
+
+    ManagerStandIn.requests = ManagerStandIn.connections = 0
+    started_at = time.time()
+    dispatcher.run_once()
+    elapsed = time.time() - started_at
+
+    assert all(message.delivered_at for message in messages)
+    return ManagerStandIn.requests, ManagerStandIn.connections, elapsed
+
+
+def main(notices=16, attempts=20):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ManagerStandIn)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    api_uri = 'http://127.0.0.1:%s/api/' % server.server_port
+    scenarios = [
+        ('one message per notice', scieloapi.Client('user', 'key', api_uri=api_uri), False),
+        ('batched, keep-alive', scieloapitoolbelt.keepalive_client('user', 'key', api_uri=api_uri), True),
+    ]
+
+    print '%s attempts, %s notices each' % (attempts, notices)
+    for name, client, batch in scenarios:
+        requests, connections, elapsed = measure(client, notices, attempts, batch)
+        print '%-24s %5d requests %5d connections %8.1f ms/attempt' % (
+            name, requests, connections, elapsed * 1000 / attempts)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])